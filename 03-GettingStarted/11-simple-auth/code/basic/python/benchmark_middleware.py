@@ -0,0 +1,180 @@
+"""
+Compare the auth middleware written as BaseHTTPMiddleware with the plain ASGI
+one in server.py.
+
+Both versions make the same check. Each runs in front of a small Starlette app
+served by uvicorn in its own process, and the script measures:
+
+- request overhead: requests per second and mean latency for a small response
+- time to first byte of a streamed response whose first chunk is ready at once
+- the time a rejected request with a large body takes to be answered
+
+Run with:
+
+    python benchmark_middleware.py [--requests 2000] [--concurrency 20]
+"""
+import argparse
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import time
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from server import CustomHeaderMiddleware, valid_token
+
+HEADERS = {"Authorization": "Bearer secret-token"}
+
+
+class BaseHTTPAuthMiddleware(BaseHTTPMiddleware):
+    """The middleware as it was written before, for comparison"""
+
+    async def dispatch(self, request, call_next):
+        has_header = request.headers.get("Authorization")
+        if not has_header:
+            print("-> Missing Authorization header!")
+            return Response(status_code=401, content="Unauthorized")
+        if not valid_token(has_header):
+            print("-> Invalid token!")
+            return Response(status_code=403, content="Forbidden")
+        print("Valid token, proceeding...")
+        print(f"-> Received {request.method} {request.url}")
+        response = await call_next(request)
+        response.headers['Custom'] = 'Example'
+        return response
+
+
+async def small(request):
+    return JSONResponse({"ok": True})
+
+
+async def stream(request):
+    async def chunks():
+        yield b"first\n"
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            yield b"more\n"
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+async def upload(request):
+    await request.body()
+    return JSONResponse({"ok": True})
+
+
+def build_app(variant: str) -> Starlette:
+    app = Starlette(routes=[
+        Route("/small", small),
+        Route("/stream", stream),
+        Route("/upload", upload, methods=["POST"]),
+    ])
+    if variant == "BaseHTTPMiddleware":
+        app.add_middleware(BaseHTTPAuthMiddleware)
+    elif variant == "ASGI":
+        app.add_middleware(CustomHeaderMiddleware)
+    return app
+
+
+def serve(variant: str, port: int):
+    # The middleware prints a line per request, which would be measured too
+    sys.stdout = open(os.devnull, "w")
+    config = uvicorn.Config(build_app(variant), port=port, log_level="warning", access_log=False)
+    uvicorn.Server(config).run()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for(client: httpx.AsyncClient):
+    for _ in range(100):
+        try:
+            await client.get("/small", headers=HEADERS)
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise TimeoutError("The server did not start")
+
+
+async def measure(base_url: str, requests: int, concurrency: int, rejects: bool) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        await wait_for(client)
+
+        latencies = []
+        remaining = iter(range(requests))
+
+        async def worker():
+            for _ in remaining:
+                started = time.perf_counter()
+                response = await client.get("/small", headers=HEADERS)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        first_bytes = []
+        for _ in range(max(1, requests // 20)):
+            started = time.perf_counter()
+            async with client.stream("GET", "/stream", headers=HEADERS) as response:
+                async for _ in response.aiter_bytes():
+                    first_bytes.append(time.perf_counter() - started)
+                    break
+
+        # The body should not have to arrive before an unauthorized request is refused
+        body = b"x" * (8 * 1024 * 1024)
+        rejections = []
+        for _ in range(5 if rejects else 0):
+            started = time.perf_counter()
+            response = await client.post("/upload", content=body, headers={"Authorization": "Bearer wrong"})
+            rejections.append(time.perf_counter() - started)
+            assert response.status_code == 403
+
+    return {
+        "requests_per_second": requests / elapsed,
+        "mean_latency_ms": statistics.mean(latencies) * 1000,
+        "ttfb_ms": statistics.median(first_bytes) * 1000,
+        "reject_ms": statistics.median(rejections) * 1000 if rejections else math.nan,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare BaseHTTPMiddleware and ASGI auth middleware")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    # Creating the FastMCP app in server.py turns on request logging, one line per request
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    print(f"{'Middleware':<22}{'Requests/s':>12}{'Latency ms':>12}{'TTFB ms':>10}{'Reject 8 MB ms':>16}")
+    for variant in ("none", "BaseHTTPMiddleware", "ASGI"):
+        port = free_port()
+        process = multiprocessing.Process(target=serve, args=(variant, port), daemon=True)
+        process.start()
+        try:
+            # Without a middleware the upload is accepted, there is nothing to reject
+            result = asyncio.run(measure(f"http://127.0.0.1:{port}", args.requests, args.concurrency,
+                                         rejects=variant != "none"))
+        finally:
+            process.terminate()
+            process.join()
+        print(f"{variant:<22}{result['requests_per_second']:>12.0f}{result['mean_latency_ms']:>12.2f}"
+              f"{result['ttfb_ms']:>10.2f}{result['reject_ms']:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Token validation through an authorization server's introspection endpoint
+(RFC 7662), for opaque tokens the resource server cannot check by itself.
+
+Asking the authorization server on every request would add a round trip to
+each MCP message, so answers are cached:
+
+- an active token is cached until its `exp`
+- an inactive token is cached for a short time, so a client retrying with a
+  bad token does not reach the authorization server each time
+- concurrent lookups of the same token share one introspection call
+
+Run `python introspection.py [port]` for a local stand-in of the
+authorization server.
+"""
+import asyncio
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import httpx
+
+
+class TokenIntrospector:
+    """Cached, coalesced introspection calls over a pooled HTTP client"""
+
+    def __init__(
+        self,
+        introspection_url: str,
+        client_id: str | None = None,
+        client_secret: str | None = None,
+        negative_ttl: float = 10,
+        max_ttl: float = 3600,
+        max_size: int = 10_000,
+    ):
+        """
+        Args:
+            introspection_url: The authorization server's introspection endpoint
+            client_id: Client id of this resource server, if the endpoint requires authentication
+            client_secret: Client secret of this resource server
+            negative_ttl: Seconds an inactive token stays cached
+            max_ttl: Longest time an active token is cached, also used when it has no exp
+            max_size: Number of tokens kept, the least recently used are dropped first
+        """
+        self.introspection_url = introspection_url
+        self.negative_ttl = negative_ttl
+        self.max_ttl = max_ttl
+        self.max_size = max_size
+        auth = httpx.BasicAuth(client_id, client_secret or "") if client_id else None
+        self.client = httpx.AsyncClient(
+            auth=auth,
+            timeout=httpx.Timeout(5),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+        )
+        # Keys are hashes, so the cache never holds a usable token
+        self._cache: OrderedDict[str, tuple[dict | None, float]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.stats = {"hits": 0, "negative_hits": 0, "coalesced": 0, "introspections": 0, "errors": 0}
+
+    async def introspect(self, token: str) -> dict | None:
+        """Introspection answer of an active token, None if the token is not active"""
+        key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            claims, expires_at = cached
+            if expires_at > time.time():
+                self._cache.move_to_end(key)
+                self.stats["hits" if claims is not None else "negative_hits"] += 1
+                return claims
+            del self._cache[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.create_task(self._introspect(key, token))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded, so a client that disconnects does not fail the others waiting for the answer
+        return await asyncio.shield(task)
+
+    async def _introspect(self, key: str, token: str) -> dict | None:
+        self.stats["introspections"] += 1
+        try:
+            response = await self.client.post(
+                self.introspection_url,
+                data={"token": token, "token_type_hint": "access_token"},
+            )
+            response.raise_for_status()
+            answer = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            # Not cached: the next request asks again instead of locking the user out
+            self.stats["errors"] += 1
+            print(f"-> Introspection failed: {e}")
+            return None
+
+        now = time.time()
+        # Anything but an object with "active": true and a numeric exp in the future counts as inactive
+        exp = answer.get("exp", now + self.max_ttl) if isinstance(answer, dict) else None
+        if (isinstance(answer, dict) and answer.get("active") is True
+                and isinstance(exp, (int, float)) and not isinstance(exp, bool) and exp > now):
+            claims = answer
+            expires_at = min(exp, now + self.max_ttl)
+        else:
+            claims = None
+            expires_at = now + self.negative_ttl
+        self._cache[key] = (claims, expires_at)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return claims
+
+    async def close(self):
+        await self.client.aclose()
+
+
+# Local stand-in of an authorization server's introspection endpoint
+
+ACTIVE_TOKENS = {
+    "secret-token": {"scope": "mcp:read", "client_id": "mcp-client", "sub": "User Userson"},
+}
+TOKEN_LIFETIME = 300
+
+
+class IntrospectionHandler(BaseHTTPRequestHandler):
+    requests = 0
+    lock = threading.Lock()
+    # Slows every answer down, to make the effect of the cache visible
+    delay = 0.05
+
+    def do_POST(self):
+        if self.path != "/introspect":
+            self.send_error(404)
+            return
+        with self.lock:
+            type(self).requests += 1
+        length = int(self.headers.get("Content-Length", 0))
+        token = parse_qs(self.rfile.read(length).decode("utf-8")).get("token", [""])[0]
+        time.sleep(self.delay)
+        info = ACTIVE_TOKENS.get(token)
+        if info is None:
+            body = {"active": False}
+        else:
+            # Tokens expire at the end of the current lifetime window
+            exp = (int(time.time()) // TOKEN_LIFETIME + 1) * TOKEN_LIFETIME
+            body = {"active": True, "token_type": "Bearer", "exp": exp, **info}
+        self.reply(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.reply({"requests": self.requests})
+        else:
+            self.send_error(404)
+
+    def reply(self, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8001
+    print(f"Introspection stand-in on http://localhost:{port}/introspect (request count at /stats)")
+    ThreadingHTTPServer(("localhost", port), IntrospectionHandler).serve_forever()
@@ -5,13 +5,19 @@ from mcp.server.auth.settings import AuthSettings
 from mcp.server.fastmcp.server import FastMCP
 from typing import Any, Literal
 from starlette.middleware import Middleware
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
 from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from starlette.applications import Starlette
 from starlette.routing import Mount
 
 import asyncio
 import datetime
+import os
+from contextlib import asynccontextmanager
+
+from introspection import TokenIntrospector
 
 settings = {
     "host": "localhost",
@@ -28,23 +34,61 @@ def valid_token(token: str) -> bool:
         return token == "secret-token"
     return False
 
-class CustomHeaderMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
+# AUTH_MODE=introspection asks the authorization server at auth_server_url about each token
+introspector = TokenIntrospector(
+    f"{str(settings['auth_server_url']).rstrip('/')}/introspect",
+    client_id=os.environ.get("CLIENT_ID"),
+    client_secret=os.environ.get("CLIENT_SECRET"),
+) if os.environ.get("AUTH_MODE") == "introspection" else None
+
+async def token_is_valid(token: str) -> bool:
+    if introspector is None:
+        return valid_token(token)
+    if not token.startswith("Bearer "):
+        return False
+    # Answers are cached, most requests do not reach the authorization server
+    claims = await introspector.introspect(token[7:])
+    scope = claims.get("scope") if claims is not None else None
+    return isinstance(scope, str) and settings["mcp_scope"] in scope.split()
+
+class CustomHeaderMiddleware:
+    """Checks the Authorization header before the request reaches the MCP app.
+
+    This is a plain ASGI middleware rather than a BaseHTTPMiddleware: a rejected
+    request is answered before any of its body is read, and responses, including
+    long-lived streams, pass through untouched apart from one extra header.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Only the headers are looked at, the body is left to the app
+        request = Request(scope)
         has_header = request.headers.get("Authorization")
         if not has_header:
             print("-> Missing Authorization header!")
-            return Response(status_code=401, content="Unauthorized")
+            await Response(status_code=401, content="Unauthorized")(scope, receive, send)
+            return
 
-        if not valid_token(has_header):
+        if not await token_is_valid(has_header):
             print("-> Invalid token!")
-            return Response(status_code=403, content="Forbidden")
+            await Response(status_code=403, content="Forbidden")(scope, receive, send)
+            return
 
         print("Valid token, proceeding...")
         print(f"-> Received {request.method} {request.url}")
-        response = await call_next(request)
-        response.headers['Custom'] = 'Example'
-        return response
+
+        async def send_with_header(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Custom", "Example")
+            await send(message)
+
+        await self.app(scope, receive, send_with_header)
 
 app = FastMCP(
     name="MCP Resource Server",
@@ -76,6 +120,19 @@ async def setup(app) -> None:
     """Run the server using StreamableHTTP transport."""
 
     starlette_app = app.streamable_http_app()
+    if introspector is not None:
+        # Close the introspection client's connections when the server shuts down
+        lifespan = starlette_app.router.lifespan_context
+
+        @asynccontextmanager
+        async def lifespan_with_introspector(starlette_app):
+            try:
+                async with lifespan(starlette_app) as state:
+                    yield state
+            finally:
+                await introspector.close()
+
+        starlette_app.router.lifespan_context = lifespan_with_introspector
     return starlette_app
 
 async def run(starlette_app):
@@ -0,0 +1,157 @@
+"""
+Tests of the cached token introspection, against the stand-in authorization server of introspection.py.
+
+Run with `python -m pytest test_introspection.py`, needs httpx and the mcp package.
+"""
+import asyncio
+import importlib.util
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import httpx
+import pytest
+
+# Add the current directory to the path so we can import the modules next to this file
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from introspection import IntrospectionHandler, TokenIntrospector  # noqa: E402
+
+
+@pytest.fixture
+def introspection_url(monkeypatch):
+    monkeypatch.setattr(IntrospectionHandler, "requests", 0)
+    server = ThreadingHTTPServer(("localhost", 0), IntrospectionHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://localhost:{server.server_address[1]}/introspect"
+    server.shutdown()
+    server.server_close()
+
+
+def introspect(introspector: TokenIntrospector, *tokens: str) -> list:
+    """Introspect tokens concurrently, then close the introspector"""
+    async def run():
+        try:
+            return await asyncio.gather(*(introspector.introspect(token) for token in tokens))
+        finally:
+            await introspector.close()
+
+    return asyncio.run(run())
+
+
+def test_active_token_is_cached(introspection_url):
+    introspector = TokenIntrospector(introspection_url)
+
+    async def run():
+        first = await introspector.introspect("secret-token")
+        second = await introspector.introspect("secret-token")
+        await introspector.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first["active"] is True and first["scope"] == "mcp:read"
+    assert second == first
+    assert IntrospectionHandler.requests == 1
+    assert introspector.stats["hits"] == 1 and introspector.stats["introspections"] == 1
+
+
+def test_inactive_token_is_cached_for_negative_ttl(introspection_url, monkeypatch):
+    introspector = TokenIntrospector(introspection_url, negative_ttl=10)
+    now = time.time()
+
+    async def run():
+        assert await introspector.introspect("bad-token") is None
+        assert await introspector.introspect("bad-token") is None
+        assert IntrospectionHandler.requests == 1
+        # Once the negative entry expired, the authorization server is asked again
+        monkeypatch.setattr(time, "time", lambda: now + 11)
+        assert await introspector.introspect("bad-token") is None
+        assert IntrospectionHandler.requests == 2
+        await introspector.close()
+
+    asyncio.run(run())
+    assert introspector.stats["negative_hits"] == 1
+
+
+def test_concurrent_lookups_share_one_request(introspection_url):
+    introspector = TokenIntrospector(introspection_url)
+    results = introspect(introspector, *["secret-token"] * 10, *["bad-token"] * 10)
+    assert all(result is not None for result in results[:10])
+    assert all(result is None for result in results[10:])
+    assert IntrospectionHandler.requests == 2
+    assert introspector.stats["coalesced"] == 18
+
+
+def test_active_token_expires_with_its_exp(introspection_url, monkeypatch):
+    introspector = TokenIntrospector(introspection_url)
+
+    async def run():
+        claims = await introspector.introspect("secret-token")
+        monkeypatch.setattr(time, "time", lambda: claims["exp"] + 1)
+        assert await introspector.introspect("secret-token") is not None
+        await introspector.close()
+
+    asyncio.run(run())
+    assert IntrospectionHandler.requests == 2 and introspector.stats["hits"] == 0
+
+
+@pytest.mark.parametrize("answer", [
+    [],
+    "active",
+    {"active": "true", "exp": 4102444800},
+    {"active": 1, "exp": 4102444800},
+    {"active": True, "exp": "4102444800"},
+    {"active": True, "exp": True},
+    {"active": True, "exp": 1},
+])
+def test_malformed_answer_is_inactive(answer):
+    requests = []
+
+    def reply(request):
+        requests.append(request)
+        return httpx.Response(200, json=answer)
+
+    introspector = TokenIntrospector("http://auth.invalid/introspect")
+    introspector.client = httpx.AsyncClient(transport=httpx.MockTransport(reply))
+    assert introspect(introspector, "secret-token", "secret-token") == [None, None]
+    assert len(requests) == 1
+
+
+def test_failed_introspection_is_not_cached():
+    requests = []
+
+    def reply(request):
+        requests.append(request)
+        return httpx.Response(200, content=b"not json") if len(requests) == 1 else httpx.Response(503)
+
+    introspector = TokenIntrospector("http://auth.invalid/introspect")
+    introspector.client = httpx.AsyncClient(transport=httpx.MockTransport(reply))
+
+    async def run():
+        assert await introspector.introspect("secret-token") is None
+        assert await introspector.introspect("secret-token") is None
+        await introspector.close()
+
+    asyncio.run(run())
+    assert len(requests) == 2 and introspector.stats["errors"] == 2
+
+
+def test_client_is_closed_on_shutdown(introspection_url, monkeypatch):
+    monkeypatch.setenv("AUTH_MODE", "introspection")
+    # Loaded under its own name, other samples have a server module too
+    spec = importlib.util.spec_from_file_location(
+        "introspection_server", os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"))
+    server = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(server)
+    assert server.introspector is not None
+
+    async def run():
+        starlette_app = await server.setup(server.app)
+        async with starlette_app.router.lifespan_context(starlette_app):
+            assert not server.introspector.client.is_closed
+        assert server.introspector.client.is_closed
+
+    asyncio.run(run())
@@ -0,0 +1,116 @@
+# pip install PyJWT[crypto]
+
+# A local stand-in for an identity provider: it publishes its public keys as a
+# JWKS and signs RS256/ES256 tokens with the private ones.
+#
+#   python jwks_server.py [port] [max_age_seconds]
+#
+#   GET  /.well-known/jwks.json   public keys, with Cache-Control max-age
+#   GET  /token?alg=RS256         a signed token for "User Userson", also ES256
+#   POST /rotate                  add a new key pair for each algorithm, new tokens use it
+#   GET  /stats                   how many times the JWKS was downloaded
+#
+# Run the server against it with JWKS_URL=http://localhost:8002/.well-known/jwks.json
+import datetime
+import json
+import sys
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+MAX_AGE = 300
+
+
+class KeySet:
+    """Key pairs by kid, the newest of each algorithm signs new tokens"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.private_keys = {}
+        self.current = {}
+        self.jwks_requests = 0
+        self.rotate()
+
+    def rotate(self):
+        with self.lock:
+            for alg, private_key in (("RS256", rsa.generate_private_key(public_exponent=65537, key_size=2048)),
+                                     ("ES256", ec.generate_private_key(ec.SECP256R1()))):
+                kid = f"{alg.lower()}-{uuid.uuid4().hex[:8]}"
+                self.private_keys[kid] = (alg, private_key)
+                self.current[alg] = kid
+
+    def jwks(self) -> dict:
+        with self.lock:
+            self.jwks_requests += 1
+            keys = []
+            for kid, (alg, private_key) in self.private_keys.items():
+                algorithm = jwt.get_algorithm_by_name(alg)
+                key = json.loads(algorithm.to_jwk(private_key.public_key()))
+                keys.append({**key, "kid": kid, "alg": alg, "use": "sig"})
+            return {"keys": keys}
+
+    def token(self, alg: str) -> str:
+        with self.lock:
+            kid = self.current[alg]
+            _, private_key = self.private_keys[kid]
+        now = datetime.datetime.now(datetime.timezone.utc)
+        payload = {
+            "sub": "1234567890",
+            "name": "User Userson",
+            "iat": now,
+            "exp": now + datetime.timedelta(hours=1),
+            "scopes": ["Admin.Write", "User.Read"],
+        }
+        return jwt.encode(payload, private_key, algorithm=alg, headers={"kid": kid})
+
+
+keys = KeySet()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/.well-known/jwks.json":
+            self.reply(keys.jwks(), {"Cache-Control": f"public, max-age={MAX_AGE}"})
+        elif url.path == "/token":
+            alg = parse_qs(url.query).get("alg", ["RS256"])[0]
+            if alg not in keys.current:
+                self.send_error(400, f"alg must be one of {', '.join(keys.current)}")
+                return
+            self.reply({"access_token": keys.token(alg), "token_type": "Bearer"})
+        elif url.path == "/stats":
+            self.reply({"jwks_requests": keys.jwks_requests, "keys": len(keys.private_keys)})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if urlparse(self.path).path == "/rotate":
+            keys.rotate()
+            self.reply({"current": keys.current})
+        else:
+            self.send_error(404)
+
+    def reply(self, body: dict, headers: dict | None = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8002
+    if len(sys.argv) > 2:
+        MAX_AGE = int(sys.argv[2])
+    print(f"JWKS stand-in on http://localhost:{port}/.well-known/jwks.json")
+    ThreadingHTTPServer(("localhost", port), Handler).serve_forever()
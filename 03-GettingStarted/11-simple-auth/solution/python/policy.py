@@ -0,0 +1,137 @@
+"""
+Per-tool and per-resource authorization.
+
+Tools and resources declare the scopes they need where they are registered:
+
+    @app.tool()
+    @policy.requires_scopes("Admin.Write")
+    async def get_time(): ...
+
+At startup the declarations, users and roles are compiled into lookup tables,
+with every scope turned into one bit of an integer. A request is granted the
+scopes of its token that its user's roles allow, so a token cannot give a user
+more than their roles, and roles do not grant what the token was not issued
+for. The middleware computes these bits once, when it authenticates the
+request, and checking a tool call is then a dictionary lookup and an integer
+operation. Tools and resources that declare nothing are not checked at all.
+"""
+import functools
+import inspect
+import logging
+
+from mcp.server.fastmcp import FastMCP
+
+logger = logging.getLogger(__name__)
+
+
+class AuthorizationPolicy:
+    """Compiled scope requirements of tools and resources, and the scopes each user is granted"""
+
+    def __init__(self, app: FastMCP, users: dict[str, list[str]], roles: dict[str, list[str]]):
+        """
+        Args:
+            app: The server whose tool calls are checked
+            users: Roles of each known user, by name
+            roles: Scopes each role allows
+        """
+        self.app = app
+        self.users = users
+        self.roles = roles
+        self._declared: dict[str, tuple[str, ...]] = {}
+        self._bits: dict[str, int] = {}
+        self._required: dict[str, int] = {}
+        self._user_masks: dict[str, int] = {}
+        self._token_masks: dict[tuple[str, ...], int] = {}
+        self.compiled = False
+
+    def requires_scopes(self, *scopes: str):
+        """Declare the scopes a tool or resource function needs.
+
+        Put it below `@app.tool()` or `@app.resource(...)`. The token must
+        carry all of them, and the user's roles must allow all of them.
+
+        Args:
+            scopes: Scopes required to call the function
+        """
+        def decorate(fn):
+            # Functions of different modules can share a name, the module keeps them apart
+            name = f"{fn.__module__}.{fn.__qualname__}"
+            self._declared[name] = tuple(scopes)
+            self.compiled = False
+
+            # FastMCP reads the parameters through __wrapped__, so the wrapper looks like fn
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def checked(*args, **kwargs):
+                    self.check(name)
+                    return await fn(*args, **kwargs)
+            else:
+                @functools.wraps(fn)
+                def checked(*args, **kwargs):
+                    self.check(name)
+                    return fn(*args, **kwargs)
+            return checked
+        return decorate
+
+    def _bit(self, scope: str) -> int:
+        if scope not in self._bits:
+            self._bits[scope] = 1 << len(self._bits)
+        return self._bits[scope]
+
+    def _mask(self, scopes) -> int:
+        mask = 0
+        for scope in scopes:
+            mask |= self._bit(scope)
+        return mask
+
+    def compile(self):
+        """Build the lookup tables from the declared requirements, users and roles"""
+        self._required = {name: self._mask(scopes) for name, scopes in self._declared.items()}
+        role_masks = {role: self._mask(scopes) for role, scopes in self.roles.items()}
+        self._user_masks = {}
+        for name, user_roles in self.users.items():
+            mask = 0
+            for role in user_roles:
+                mask |= role_masks.get(role, 0)
+            self._user_masks[name] = mask
+        self._token_masks.clear()
+        self.compiled = True
+
+    def grants(self, claims: dict) -> int | None:
+        """Scope bits of a token's scopes that its user's roles allow, None if the user is unknown
+
+        Args:
+            claims: Claims of a verified token
+        """
+        if not self.compiled:
+            self.compile()
+        user_mask = self._user_masks.get(claims.get("name"))
+        if user_mask is None:
+            return None
+        scopes = claims.get("scopes", ())
+        scopes = tuple(scopes) if isinstance(scopes, (list, tuple)) else ()
+        token_mask = self._token_masks.get(scopes)
+        if token_mask is None:
+            # Scopes nobody asks for do not matter, so they do not get a bit
+            token_mask = 0
+            for scope in scopes:
+                token_mask |= self._bits.get(scope, 0)
+            if len(self._token_masks) >= 1024:
+                self._token_masks.clear()
+            self._token_masks[scopes] = token_mask
+        return user_mask & token_mask
+
+    def check(self, name: str):
+        """Raise PermissionError unless the current request was granted the scopes of a function
+
+        Args:
+            name: Module and qualified name of the function, as declared with `requires_scopes`
+        """
+        if not self.compiled:
+            self.compile()
+        request = self.app.get_context().request_context.request
+        granted = getattr(request.state, "scope_mask", 0) if request is not None else 0
+        if self._required[name] & ~granted:
+            logger.warning("-> Missing required scope!")
+            raise PermissionError("Forbidden - insufficient scopes")
+        logger.info("User has required scope, proceeding...")
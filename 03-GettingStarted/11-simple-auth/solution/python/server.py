@@ -2,11 +2,13 @@ from pydantic import AnyHttpUrl
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from mcp.server.auth.settings import AuthSettings
-from mcp.server.fastmcp.server import FastMCP
+from mcp.server.fastmcp.server import Context, FastMCP
 from typing import Any, Literal
 from starlette.middleware import Middleware
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
 from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from starlette.applications import Starlette
 from starlette.routing import Mount
 
@@ -15,7 +17,8 @@ import datetime
 
 from dotenv import load_dotenv
 import os
-from util import validate_token
+from policy import AuthorizationPolicy
+from util import jwks, verify_token
 load_dotenv()
 
 settings = {
@@ -25,59 +28,77 @@ settings = {
     "server_url": AnyHttpUrl("http://localhost:8000"),
 }
 
-users = ["User Userson", "Admin Adminson"]
+# Known users and their roles, a token's scopes only count when one of its user's roles allows them
+users = {"User Userson": ["reader", "admin"], "Reader Readerson": ["reader"]}
+roles = {"reader": ["User.Read"], "admin": ["Admin.Write"]}
 
-def is_user(token: str) -> bool:
-    decodedToken = validate_token(token[7:])
-    if not decodedToken:
-        return False
-    return decodedToken["name"] in users
+async def validate_jwt(authorization: str) -> dict | None:
+    """Claims of the bearer token in an Authorization header, None if it is not valid.
 
-def has_scope(token: str, scope: str) -> bool:
-    token = token[7:]
-    token = validate_token(token)
+    The token is verified once and its claims are cached until it expires,
+    so a session sending many requests with the same token pays for it once.
+    """
+    token = authorization[7:]
+    # print("Validating token:", token)
+    return await verify_token(token)
 
-    if not token:
-        return False
-    # very naive scope check, in real life parse the token and check scopes properly
-    return  scope in token["scopes"]
+def current_claims(ctx: Context) -> dict | None:
+    """Claims the middleware attached to the HTTP request of a tool call."""
+    request = ctx.request_context.request
+    return getattr(request.state, "claims", None) if request is not None else None
 
-def validate_jwt(token: str) -> bool:
-    token = token[7:]
-    # print("Validating token:", token)
-    return validate_token(token) != None
-   
 
-class CustomHeaderMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
+class CustomHeaderMiddleware:
+    """Checks the Authorization header before the request reaches the MCP app.
+
+    This is a plain ASGI middleware rather than a BaseHTTPMiddleware: a rejected
+    request is answered before any of its body is read, and responses, including
+    long-lived streams, pass through untouched apart from one extra header.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
+        # Only the headers are looked at, the body is left to the app
+        request = Request(scope)
         has_header = request.headers.get("Authorization")
-        # print("Authorization header:", has_header)
         if not has_header:
             print("-> Missing Authorization header!")
-            return Response(status_code=401, content="Unauthorized")
+            await Response(status_code=401, content="Unauthorized")(scope, receive, send)
+            return
 
-        if not validate_jwt(has_header):
+        # Decode once, the check below and the tools all use these claims
+        claims = await validate_jwt(has_header)
+        if not claims:
             print("-> Invalid token!")
-            return Response(status_code=403, content="Forbidden")
+            await Response(status_code=403, content="Forbidden")(scope, receive, send)
+            return
 
         print("Valid token, proceeding...")
 
-        if not is_user(has_header):
+        # The scopes a tool needs are checked when it is called, see policy.requires_scopes
+        scope_mask = policy.grants(claims)
+        if scope_mask is None:
             print("-> User does not exist!")
-            return Response(status_code=403, content="Forbidden - user does not exist")
+            await Response(status_code=403, content="Forbidden - user does not exist")(scope, receive, send)
+            return
         print("User exists, proceeding...")
 
-        if not has_scope(has_header, "Admin.Write"):
-            print("-> Missing required scope!")
-            return Response(status_code=403, content="Forbidden - insufficient scopes")
+        request.state.claims = claims
+        request.state.scope_mask = scope_mask
+        print(f"-> Received {request.method} {request.url}")
 
-        print("User has required scope, proceeding...")
+        async def send_with_header(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Custom", "Example")
+            await send(message)
 
-        print(f"-> Received {request.method} {request.url}")
-        response = await call_next(request)
-        response.headers['Custom'] = 'Example'
-        return response
+        await self.app(scope, receive, send_with_header)
 
 app = FastMCP(
     name="MCP Resource Server",
@@ -87,8 +108,12 @@ app = FastMCP(
     debug=True
 )
 
+# Scopes are declared on each tool with @policy.requires_scopes and compiled at startup
+policy = AuthorizationPolicy(app, users, roles)
+
 @app.tool()
-async def get_time() -> dict[str, Any]:
+@policy.requires_scopes("Admin.Write")
+async def get_time(ctx: Context) -> dict[str, Any]:
     """
     Get the current server time.
 
@@ -97,8 +122,10 @@ async def get_time() -> dict[str, Any]:
     """
 
     now = datetime.datetime.now()
+    claims = current_claims(ctx) or {}
 
     return {
+        "user": claims.get("name"),
         "current_time": now.isoformat(),
         "timezone": "UTC",  # Simplified for demo
         "timestamp": now.timestamp(),
@@ -124,7 +151,12 @@ async def run(starlette_app):
 
 async def main():
     print("Running MCP Resource Server...")
+    if jwks is not None:
+        # Keys are downloaded before the first request and refreshed in the background
+        print(f"Verifying tokens with keys from {jwks.jwks_url}")
+        await jwks.start()
     starlette_app = await setup(app)
+    policy.compile()
     print("Adding custom middleware...")
     starlette_app.add_middleware(CustomHeaderMiddleware)
 
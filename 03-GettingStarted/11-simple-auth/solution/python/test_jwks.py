@@ -0,0 +1,134 @@
+"""
+Tests of JWKS key caching and of the verified token cache, against the jwks_server.py stand-in.
+
+Run with `python -m pytest test_jwks.py`, needs PyJWT[crypto] and httpx.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import jwt
+import pytest
+
+# Add the current directory to the path so we can import the modules next to this file
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import jwks_server  # noqa: E402
+import util  # noqa: E402
+from util import JWKSCache, VerifiedTokenCache  # noqa: E402
+
+
+@pytest.fixture
+def jwks_url():
+    server = ThreadingHTTPServer(("localhost", 0), jwks_server.Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://localhost:{server.server_address[1]}/.well-known/jwks.json"
+    server.shutdown()
+    server.server_close()
+
+
+def downloads() -> int:
+    return jwks_server.keys.jwks_requests
+
+
+def test_cached_key_is_not_downloaded_again(jwks_url):
+    async def run():
+        cache = JWKSCache(jwks_url)
+        try:
+            before = downloads()
+            for alg in ("RS256", "ES256"):
+                token = jwks_server.keys.token(alg)
+                for _ in range(5):
+                    assert await cache.get_key(jwt.get_unverified_header(token)["kid"]) is not None
+            assert downloads() - before == 1
+            assert cache.stats["fetches"] == 1 and cache.stats["unknown_kids"] == 0
+        finally:
+            await cache.stop()
+
+    asyncio.run(run())
+
+
+def test_rotated_kid_is_downloaded_once(jwks_url):
+    async def run():
+        cache = JWKSCache(jwks_url, min_refetch_interval=0)
+        try:
+            await cache.start()
+            jwks_server.keys.rotate()
+            token = jwks_server.keys.token("RS256")
+            kid = jwt.get_unverified_header(token)["kid"]
+            before = downloads()
+            # Concurrent requests with the new kid share one download
+            keys = await asyncio.gather(*(cache.get_key(kid) for _ in range(10)))
+            assert all(key is not None for key in keys)
+            assert downloads() - before == 1
+            assert await cache.get_key(kid) is keys[0]
+            assert downloads() - before == 1
+        finally:
+            await cache.stop()
+
+    asyncio.run(run())
+
+
+def test_unknown_kid_does_not_flood_the_provider(jwks_url):
+    async def run():
+        cache = JWKSCache(jwks_url, min_refetch_interval=30)
+        try:
+            await cache.start()
+            before = downloads()
+            for index in range(20):
+                assert await cache.get_key(f"made-up-{index}") is None
+            # Refused right after the download, one more download is deferred to the end of the interval
+            assert downloads() == before
+            assert cache.stats["unknown_kids"] == 20
+        finally:
+            await cache.stop()
+
+    asyncio.run(run())
+
+
+def test_verified_token_is_checked_once(jwks_url, monkeypatch):
+    async def run():
+        monkeypatch.setattr(util, "jwks", JWKSCache(jwks_url))
+        monkeypatch.setattr(util, "verified_tokens", VerifiedTokenCache())
+        try:
+            token = jwks_server.keys.token("ES256")
+            claims = await util.verify_token(token)
+            assert claims["name"] == "User Userson"
+            assert await util.verify_token(token) == claims
+            assert util.verified_tokens.stats == {"hits": 1, "misses": 1}
+        finally:
+            await util.jwks.stop()
+
+    asyncio.run(run())
+
+
+def test_expired_token_is_evicted(monkeypatch):
+    cache = VerifiedTokenCache()
+    now = time.time()
+    cache.put("short", {"name": "User Userson", "exp": now + 60})
+    cache.put("long", {"name": "User Userson", "exp": now + 3600})
+    assert cache.get("short") is not None
+
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("short") is None
+    assert cache.get("long") is not None
+    assert len(cache._entries) == 1
+
+
+def test_token_without_expiry_is_not_cached():
+    cache = VerifiedTokenCache()
+    cache.put("token", {"name": "User Userson"})
+    assert cache.get("token") is None
+
+
+def test_cache_is_bounded():
+    cache = VerifiedTokenCache(max_size=2)
+    exp = time.time() + 60
+    for token in ("a", "b", "c"):
+        cache.put(token, {"exp": exp})
+    assert cache.get("a") is None
+    assert cache.get("b") is not None and cache.get("c") is not None
@@ -1,9 +1,18 @@
-# pip install PyJWT
+# pip install PyJWT[crypto] httpx
 
 # create a token
 import jwt
-from jwt.exceptions import ExpiredSignatureError, InvalidTokenError
+from jwt.exceptions import ExpiredSignatureError, InvalidTokenError, PyJWKError
+import asyncio
 import datetime
+import hashlib
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+
+import httpx
 
 # Secret key used to sign the JWT
 secret_key = 'your-secret-key'
@@ -42,6 +51,211 @@ def validate_token(token: str) -> str | None:
         print(f"❌ Invalid token: {e}")
     return None
 
+class VerifiedTokenCache:
+    """Claims of tokens that passed validation, kept until the token expires
+
+    Keys are SHA-256 hashes of the tokens, so the cache never holds a usable token.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> dict | None:
+        key = self._key(token)
+        claims = self._entries.get(key)
+        if claims is None:
+            self.stats["misses"] += 1
+            return None
+        if claims["exp"] <= time.time():
+            del self._entries[key]
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return claims
+
+    def put(self, token: str, claims: dict):
+        # A token without an expiry is checked every time rather than trusted forever
+        if "exp" not in claims:
+            return
+        key = self._key(token)
+        self._entries[key] = claims
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+verified_tokens = VerifiedTokenCache()
+
+# Algorithms accepted from an identity provider, never HS256 with a public key
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256"]
+
+class JWKSCache:
+    """Signing keys of an identity provider, by kid
+
+    The keys are downloaded once, then refreshed in the background before they
+    expire, so verifying a token does not wait on a download unless its kid is
+    unknown. An unknown kid triggers a refetch at most once per
+    min_refetch_interval, so made up kids cannot flood the identity provider.
+    """
+
+    def __init__(self, jwks_url: str, default_max_age: float = 600, min_refetch_interval: float = 30,
+                 client: httpx.AsyncClient | None = None):
+        self.jwks_url = jwks_url
+        self.default_max_age = default_max_age
+        self.min_refetch_interval = min_refetch_interval
+        self.client = client or httpx.AsyncClient(timeout=10)
+        self._keys: dict[str, jwt.PyJWK] = {}
+        self._expires_at = 0.0
+        self._last_fetch = -math.inf
+        self._fetching: asyncio.Task | None = None
+        self._refresher: asyncio.Task | None = None
+        self._deferred: asyncio.Task | None = None
+        self.stats = {"fetches": 0, "failures": 0, "unknown_kids": 0}
+
+    async def start(self):
+        """Download the keys and keep them fresh in the background"""
+        if self._refresher is not None:
+            return
+        try:
+            await self._fetch()
+        except Exception as e:
+            print(f"❌ Could not download JWKS: {e}")
+        if self._refresher is None:
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        for task in (self._refresher, self._deferred):
+            if task is not None:
+                task.cancel()
+        self._refresher = self._deferred = None
+        await self.client.aclose()
+
+    async def get_key(self, kid: str | None) -> jwt.PyJWK | None:
+        """Key with this kid, None if the identity provider does not have it"""
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+        if self._refresher is None:
+            await self.start()
+            key = self._keys.get(kid)
+            if key is not None:
+                return key
+
+        self.stats["unknown_kids"] += 1
+        # A new kid usually means the keys were rotated. Right after a download the
+        # token is refused, and one more download is due once the interval is over.
+        wait = self._last_fetch + self.min_refetch_interval - time.monotonic()
+        if self._fetching is None and wait > 0:
+            if self._deferred is None:
+                self._deferred = asyncio.create_task(self._fetch_later(wait))
+            return None
+        try:
+            await self._fetch()
+        except Exception as e:
+            print(f"❌ Could not download JWKS: {e}")
+            return None
+        return self._keys.get(kid)
+
+    async def _fetch(self):
+        # Concurrent callers share one download
+        if self._fetching is None:
+            self._fetching = asyncio.create_task(self._download())
+            self._fetching.add_done_callback(self._fetch_done)
+        await asyncio.shield(self._fetching)
+
+    async def _fetch_later(self, delay: float):
+        try:
+            await asyncio.sleep(delay)
+            await self._fetch()
+        except Exception as e:
+            print(f"❌ Could not download JWKS: {e}")
+        finally:
+            self._deferred = None
+
+    def _fetch_done(self, task: asyncio.Task):
+        self._fetching = None
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["failures"] += 1
+
+    async def _download(self):
+        self._last_fetch = time.monotonic()
+        self.stats["fetches"] += 1
+        response = await self.client.get(self.jwks_url)
+        response.raise_for_status()
+        keys = {}
+        for data in response.json().get("keys", []):
+            if data.get("use", "sig") != "sig" or "kid" not in data:
+                continue
+            try:
+                key = jwt.PyJWK(data)
+            except PyJWKError:
+                continue
+            if key.algorithm_name in ASYMMETRIC_ALGORITHMS:
+                keys[data["kid"]] = key
+        self._keys = keys
+        match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+        self._expires_at = time.monotonic() + (float(match.group(1)) if match else self.default_max_age)
+
+    async def _refresh_loop(self):
+        while True:
+            # Refresh when 80% of the lifetime is used up, or retry soon after a failure
+            delay = max(self.min_refetch_interval, 0.8 * (self._expires_at - self._last_fetch)
+                        - (time.monotonic() - self._last_fetch))
+            await asyncio.sleep(delay)
+            try:
+                await self._fetch()
+            except Exception as e:
+                # The old keys stay in use until a refresh works
+                print(f"❌ Could not refresh JWKS: {e}")
+
+# Set JWKS_URL to verify RS256/ES256 tokens of an identity provider instead of HS256 ones
+jwks = JWKSCache(os.environ["JWKS_URL"]) if os.environ.get("JWKS_URL") else None
+
+async def validate_token_jwks(token: str) -> dict | None:
+    try:
+        header = jwt.get_unverified_header(token)
+        if header.get("alg") not in ASYMMETRIC_ALGORITHMS:
+            print(f"❌ Invalid token: algorithm {header.get('alg')} is not allowed")
+            return None
+        key = await jwks.get_key(header.get("kid"))
+        if key is None:
+            print(f"❌ Invalid token: unknown key {header.get('kid')}")
+            return None
+        audience = os.environ.get("JWT_AUDIENCE")
+        return jwt.decode(
+            token,
+            key.key,
+            algorithms=[key.algorithm_name],
+            audience=audience,
+            issuer=os.environ.get("JWT_ISSUER"),
+            options={"verify_aud": audience is not None},
+        )
+    except ExpiredSignatureError:
+        print("❌ Token has expired.")
+    except InvalidTokenError as e:
+        print(f"❌ Invalid token: {e}")
+    return None
+
+async def verify_token(token: str) -> dict | None:
+    """Claims of a valid token, verified once until it expires
+
+    Tokens are checked against the JWKS when JWKS_URL is set, and against
+    secret_key otherwise.
+    """
+    claims = verified_tokens.get(token)
+    if claims is not None:
+        return claims
+    claims = await validate_token_jwks(token) if jwks is not None else validate_token(token)
+    if claims is not None:
+        verified_tokens.put(token, claims)
+    return claims
+
 if __name__ == "__main__":
     token = generate_token()
     # write to .env file
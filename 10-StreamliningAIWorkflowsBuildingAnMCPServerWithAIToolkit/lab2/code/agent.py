@@ -7,10 +7,9 @@ import asyncio
 import json
 import os
 from typing import Dict, Optional
-from contextlib import AsyncExitStack
+from contextlib import AsyncExitStack, nullcontext
 
 from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
 from mcp.client.sse import sse_client
 
 
@@ -19,11 +18,62 @@ from azure.ai.inference.models import AssistantMessage, SystemMessage, UserMessa
 from azure.ai.inference.models import ImageContentItem, ImageUrl, TextContentItem
 from azure.core.credentials import AzureKeyCredential
 
+from supervisor import ServerSupervisor
+from result_store import READ_TOOL, READ_TOOL_NAME, ResultStore
+from tool_cache import ToolResultCache, cache_key, is_cacheable, is_retryable
+from tool_index import ToolIndex, estimate_tokens
+from tracing import Tracer, call_tool
+
+# Number of recent messages used to decide which tools are relevant for the next model call
+TOOL_QUERY_MESSAGES = 4
+
+def message_text(message) -> str:
+    """Extract the plain text of a chat message, including names of requested tools"""
+    content = getattr(message, "content", None)
+    parts = []
+    if isinstance(content, str):
+        parts.append(content)
+    elif isinstance(content, list):
+        parts.extend(getattr(item, "text", "") or "" for item in content)
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        function = tool_call["function"] if isinstance(tool_call, dict) else tool_call.function
+        name = function["name"] if isinstance(function, dict) else function.name
+        parts.append(name)
+    return " ".join(parts)
+
+def tool_result_bytes(messages: list[any]) -> int:
+    """Total size of the tool results already in the conversation"""
+    return sum(len(message.content.encode("utf-8")) for message in messages
+               if isinstance(message, ToolMessage) and isinstance(message.content, str))
+
 class MCPClient:
-    def __init__(self):
+    def __init__(self, max_tools: Optional[int] = 16, pinned_tools: Optional[list[str]] = None,
+                 result_store: Optional[ResultStore] = None, tool_cache: Optional[ToolResultCache] = None,
+                 tracer: Optional[Tracer] = None):
+        """
+        Args:
+            max_tools: Number of most relevant tools sent to the model per call, None sends every tool
+            pinned_tools: Tool names that are always sent to the model
+            result_store: Size budgets and storage for large tool results
+            tool_cache: Cache for results of read-only tools, None calls the server every time
+            tracer: Records timing spans of the agent loop, configured from the environment by default
+        """
         # Initialize session and client objects
         self._servers = {}
         self._tool_to_server_map = {}
+        self._tool_index = ToolIndex()
+        self.max_tools = max_tools
+        self.pinned_tools = list(pinned_tools or [])
+        self.result_store = result_store or ResultStore()
+        self.tool_cache = tool_cache
+        self._cacheable_tools = set()
+        self._retryable_tools = set()
+        # Bytes read from stored results in the running turn of each conversation
+        self._turn_read_bytes: Dict[str, int] = {}
+        self.tracer = tracer or Tracer.from_env()
+        # Fair concurrency limits shared by conversations, set by ConversationScheduler
+        self.model_limiter = None
+        self.tool_limiter = None
         self.exit_stack = AsyncExitStack()
         # To authenticate with the model you will need to generate a personal access token (PAT) in your GitHub settings.
         # Create your PAT token by following instructions here: https://docs.github.com/en/authentication/keeping-your-account-and-data-secure/managing-your-personal-access-tokens
@@ -33,14 +83,22 @@ class MCPClient:
             api_version = "2024-08-01-preview",
         )
 
-    async def connect_stdio_server(self, server_id: str, command: str, args: list[str], env: Dict[str, str]):
+    async def connect_stdio_server(self, server_id: str, command: str, args: list[str], env: Dict[str, str],
+                                   spares: int = 0, health_check_interval: Optional[float] = None, replicas: int = 1):
         """Connect to an MCP server using STDIO transport
+
+        The server process is supervised: if it dies, the session is transparently
+        replaced, using a pre-spawned spare process when one is available.
+        With several replicas, each tool call goes to the least loaded process.
         
         Args:
             server_id: Unique identifier for this server connection
             command: Command to run the MCP server
             args: Arguments for the command
             env: Optional environment variables
+            spares: Number of warm spare processes kept ready for failover
+            health_check_interval: Seconds between pings that detect a dead server, None only detects failed calls
+            replicas: Number of identical server processes to spread tool calls over
         """
         server_params = StdioServerParameters(
             command=command,
@@ -48,13 +106,13 @@ class MCPClient:
             env=env
         )
         
-        stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-        stdio, write = stdio_transport
-        session = await self.exit_stack.enter_async_context(ClientSession(stdio, write))
-        await session.initialize()
+        supervisor = ServerSupervisor(server_id, server_params, spares, health_check_interval, replicas=replicas)
+        supervisor.on_restart = lambda server_id, session: self._register_server(server_id, session, supervisor)
+        self.exit_stack.push_async_callback(supervisor.close)
+        session = await supervisor.start()
         
         # Register the server
-        await self._register_server(server_id, session)
+        await self._register_server(server_id, session, supervisor)
     
     async def connect_sse_server(self, server_id: str, url: str, headers: Dict[str, str]):
         """Connect to an MCP server using SSE transport
@@ -72,111 +130,300 @@ class MCPClient:
         # Register the server
         await self._register_server(server_id, session)
     
-    async def _register_server(self, server_id: str, session: ClientSession):
+    async def _register_server(self, server_id: str, session: ClientSession,
+                               supervisor: Optional[ServerSupervisor] = None):
         """Register a server and its tools in the client
         
         Args:
             server_id: Unique identifier for this server
             session: Connected ClientSession
+            supervisor: Supervisor that restarts the server process, if any
         """
         # List available tools
         response = await session.list_tools()
         tools = response.tools
+
+        # A server registering again (reconnect or failover) may have renamed or dropped tools
+        previous = self._servers.get(server_id)
+        for tool in previous["tools"] if previous else []:
+            if self._tool_to_server_map.get(tool.name) == server_id:
+                del self._tool_to_server_map[tool.name]
+                self._tool_index.remove(tool.name)
+                self._cacheable_tools.discard(tool.name)
+                self._retryable_tools.discard(tool.name)
         
         # Store server connection info
         self._servers[server_id] = {
             "session": session,
+            "supervisor": supervisor,
             "tools": tools
         }
         
-        # Update tool-to-server mapping
+        # Update tool-to-server mapping and the relevance index
         for tool in tools:
             self._tool_to_server_map[tool.name] = server_id
+            self._tool_index.add(tool.name, tool.description, tool.inputSchema)
+            for tools_with_hint, has_hint in ((self._cacheable_tools, is_cacheable(tool)),
+                                              (self._retryable_tools, is_retryable(tool))):
+                if has_hint:
+                    tools_with_hint.add(tool.name)
+                else:
+                    tools_with_hint.discard(tool.name)
             
         print(f"\nConnected to server '{server_id}' with tools:", [tool.name for tool in tools])
 
-    async def chatWithTools(self, messages: list[any]) -> str:
+    async def chatWithTools(self, messages: list[any], conversation_id: Optional[str] = None) -> str:
         """Chat with model and using tools
         Args:
             messages: Messages to send to the model
+            conversation_id: Identifies the conversation for fair scheduling and keeps all its
+                tool calls on the same server replica, defaults to one id per messages list
         """
+        if conversation_id is None:
+            conversation_id = f"conversation-{id(messages)}"
         if not self._servers:
             raise ValueError("No MCP servers connected. Connect to at least one server first.")
 
         # Collect tools from all connected servers
-        available_tools = []
+        available_tools = {}
         for server_id, server_info in self._servers.items():
             for tool in server_info["tools"]:
-                available_tools.append({ 
+                available_tools[tool.name] = {
                     "type": "function",
                     "function": {
                         "name": tool.name,
                         "description": tool.description,
                         "parameters": tool.inputSchema
                     },
-                })
+                }
 
-        while True:
+        self._turn_read_bytes[conversation_id] = 0
+        try:
+            with self.tracer.span("chat", conversation_id=conversation_id):
+                iteration = 0
+                while True:
+                    iteration += 1
+                    with self.tracer.span("iteration", iteration=iteration):
+                        hasToolCall = await self._chat_iteration(messages, available_tools, conversation_id)
+                    if not hasToolCall:
+                        break
+        finally:
+            self._turn_read_bytes.pop(conversation_id, None)
 
-            # Call model
-            response = self.azureai.complete(
+    async def _chat_iteration(self, messages: list[any], available_tools: Dict[str, dict], conversation_id: str) -> bool:
+        """Run one model call and the tool calls it requests, returns whether any tool was called"""
+        with self.tracer.span("build_request", messages=len(messages)):
+            tools = self._select_tools(messages, available_tools, conversation_id)
+
+        # Call model, off the event loop so other conversations keep running
+        with self.tracer.span("model_call", model="gpt-4o", tools=len(tools)) as span:
+            response = await self._complete(
+                conversation_id,
                 messages = messages,
                 model = "gpt-4o",
-                tools=available_tools,
+                tools=tools,
                 response_format = "text",
                 temperature = 1,
                 top_p = 1,
             )
-            hasToolCall = False
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+        hasToolCall = False
 
-            if response.choices[0].message.tool_calls:
-                for tool in response.choices[0].message.tool_calls:
-                    hasToolCall = True
-                    tool_name = tool.function.name
+        if response.choices[0].message.tool_calls:
+            for tool in response.choices[0].message.tool_calls:
+                hasToolCall = True
+                tool_name = tool.function.name
+                with self.tracer.span("parse_arguments", tool=tool_name, bytes=len(tool.function.arguments)):
                     tool_args = json.loads(tool.function.arguments)
+                messages.append(
+                    AssistantMessage(
+                        tool_calls = [{
+                            "id": tool.id,
+                            "type": "function",
+                            "function": {
+                                "name": tool.function.name,
+                                "arguments": tool.function.arguments,
+                            }
+                        }]
+                    )
+                )
+            
+            
+                # Stored results are read locally, without a server round trip,
+                # within what is left of the conversation and turn budgets
+                if tool_name == READ_TOOL_NAME:
+                    with self.tracer.span("tool_call", tool=tool_name, server_id="local") as span:
+                        budget = self.result_store.read_budget(
+                            tool_result_bytes(messages), self._turn_read_bytes.get(conversation_id, 0))
+                        content = self.result_store.read(
+                            tool_args.get("handle", ""), tool_args.get("offset", 0), tool_args.get("length"),
+                            budget=budget, conversation_id=conversation_id)
+                        read_bytes = len(content.encode("utf-8"))
+                        self._turn_read_bytes[conversation_id] = self._turn_read_bytes.get(conversation_id, 0) + read_bytes
+                        span.set(bytes=read_bytes)
                     messages.append(
-                        AssistantMessage(
-                            tool_calls = [{
-                                "id": tool.id,
-                                "type": "function",
-                                "function": {
-                                    "name": tool.function.name,
-                                    "arguments": tool.function.arguments,
-                                }
-                            }]
+                        ToolMessage(
+                            tool_call_id = tool.id,
+                            content = content
                         )
                     )
-                
-                
-                    # Find the appropriate server for this tool
-                    if tool_name in self._tool_to_server_map:
-                        server_id = self._tool_to_server_map[tool_name]
-                        server_session = self._servers[server_id]["session"]
-                        
-                        # Execute tool call on the appropriate server
-                        result = await server_session.call_tool(tool_name, tool_args)
-                        print(f"[Server '{server_id}' call tool '{tool_name}' with args {tool_args}]: {result.content}")
 
+                # Find the appropriate server for this tool
+                elif tool_name in self._tool_to_server_map:
+                    server_id = self._tool_to_server_map[tool_name]
+
+                    # Execute tool call on the appropriate server
+                    async with self._slot(self.tool_limiter, conversation_id):
+                        result = await self.call_tool(tool_name, tool_args, affinity_key=conversation_id)
+                    print(f"[Server '{server_id}' call tool '{tool_name}' with args {tool_args}]: {result.content}")
+
+                    with self.tracer.span("build_messages", tool=tool_name) as span:
+                        content = self.result_store.bound(
+                            str(result.content), tool_result_bytes(messages), conversation_id)
+                        span.set(bytes=len(content))
                         messages.append(
                             ToolMessage(
                                 tool_call_id = tool.id,
-                                content = str(result.content)
+                                content = content
                             )
                         )
-            else:
-                messages.append(
-                    AssistantMessage(
-                        content = response.choices[0].message.content
-                    )
+        else:
+            messages.append(
+                AssistantMessage(
+                    content = response.choices[0].message.content
                 )
-                print(f"[Model Response]: {response.choices[0].message.content}")
-        
-            if not hasToolCall:
-                break
-    
+            )
+            print(f"[Model Response]: {response.choices[0].message.content}")
+        return hasToolCall
+
+    async def call_tool(self, tool_name: str, tool_args: dict, use_cache: bool = True,
+                        affinity_key: Optional[str] = None):
+        """Call a tool on the server that provides it
+
+        With a tool cache, results of read-only tools are reused for identical arguments,
+        and calls to any other tool drop the cached results of their server.
+
+        Args:
+            tool_name: Name of the tool
+            tool_args: Arguments of the call
+            use_cache: Set to False to always call the server and skip the cache
+            affinity_key: Calls with the same key go to the same replica of a replicated server
+        """
+        server_id = self._tool_to_server_map[tool_name]
+        with self.tracer.span("tool_call", tool=tool_name, server_id=server_id) as span:
+            if self.tool_cache is None:
+                return await self._call_server(server_id, tool_name, tool_args, affinity_key)
+            if tool_name not in self._cacheable_tools:
+                # The call may change what the server's read-only tools return. Results are also
+                # dropped after it, in case a read-only call finished while it ran
+                self.tool_cache.invalidate_server(server_id)
+                try:
+                    return await self._call_server(server_id, tool_name, tool_args, affinity_key)
+                finally:
+                    self.tool_cache.invalidate_server(server_id)
+
+            key = cache_key(server_id, tool_name, tool_args)
+            if not use_cache:
+                self.tool_cache.bypass()
+            else:
+                result = self.tool_cache.get(key)
+                span.set(cache_hit=result is not None)
+                if result is not None:
+                    print(f"[Cache hit] '{tool_name}' (hit rate {self.tool_cache.hit_rate():.0%})")
+                    return result
+
+            generation = self.tool_cache.generation(server_id)
+            result = await self._call_server(server_id, tool_name, tool_args, affinity_key)
+            if not result.isError:
+                self.tool_cache.put(key, result, generation)
+            return result
+
+    async def _call_server(self, server_id: str, tool_name: str, tool_args: dict,
+                           affinity_key: Optional[str] = None):
+        """Send a tool call to a server, through its supervisor when it has one
+
+        The trace context travels in the request `_meta` so server side spans join the trace.
+        """
+        supervisor = self._servers[server_id]["supervisor"]
+        meta = self.tracer.meta()
+        if supervisor is None:
+            return await call_tool(self._servers[server_id]["session"], tool_name, tool_args, meta)
+        # Only calls that are safe to repeat are retried after the server died mid-call
+        return await supervisor.call_tool(tool_name, tool_args, retry=tool_name in self._retryable_tools,
+                                          affinity_key=affinity_key, meta=meta)
+
+    async def _complete(self, conversation_id: str, **request):
+        """Send a model request from a worker thread, holding a model slot until the thread is done
+
+        A cancelled caller stops waiting right away, but the thread cannot be stopped and
+        keeps the request running, so the slot is only released once the request finished.
+
+        Args:
+            conversation_id: Conversation the slot is taken for
+            request: Arguments of `ChatCompletionsClient.complete`
+        """
+        limiter = self.model_limiter
+        if limiter is not None:
+            await limiter.acquire(conversation_id)
+        call = asyncio.ensure_future(asyncio.to_thread(self.azureai.complete, **request))
+
+        def done(call: asyncio.Future):
+            if limiter is not None:
+                limiter.release()
+            if not call.cancelled():
+                # Retrieved so an abandoned call does not log an unretrieved exception
+                call.exception()
+
+        call.add_done_callback(done)
+        return await asyncio.shield(call)
+
+    @staticmethod
+    def _slot(limiter, conversation_id: str):
+        """Slot of a fair limiter for the conversation, or no limit when there is no limiter"""
+        return limiter.slot(conversation_id) if limiter is not None else nullcontext()
+
+    def server_metrics(self) -> Dict[str, list[dict]]:
+        """Per replica call metrics of every supervised server"""
+        return {
+            server_id: server_info["supervisor"].metrics()
+            for server_id, server_info in self._servers.items()
+            if server_info["supervisor"] is not None
+        }
+
+    def _select_tools(self, messages: list[any], available_tools: Dict[str, dict],
+                      conversation_id: Optional[str] = None) -> list[dict]:
+        """Pick the tools relevant to the recent messages, plus the pinned tools
+
+        Args:
+            messages: Conversation so far
+            available_tools: Tool definitions keyed by tool name
+            conversation_id: Conversation the tools are selected for
+        """
+        # Let the model read stored results once the conversation has any
+        local_tools = [READ_TOOL] if self.result_store.has_results(conversation_id) else []
+
+        if self.max_tools is None or len(available_tools) <= self.max_tools + len(self.pinned_tools):
+            return list(available_tools.values()) + local_tools
+
+        query = " ".join(message_text(message) for message in messages[-TOOL_QUERY_MESSAGES:])
+        names = self._tool_index.top_k(query, self.max_tools, self.pinned_tools)
+        selected = [available_tools[name] for name in names if name in available_tools]
+
+        all_tokens = estimate_tokens(list(available_tools.values()))
+        selected_tokens = estimate_tokens(selected)
+        print(f"[Tool Selection] sending {len(selected)}/{len(available_tools)} tools, "
+              f"~{all_tokens - selected_tokens} of ~{all_tokens} tool schema tokens saved: {names}")
+        return selected + local_tools
+
     async def cleanup(self):
         """Clean up resources"""
+        for server_id, metrics in self.server_metrics().items():
+            if len(metrics) > 1:
+                print(f"[Server '{server_id}' replicas]: {metrics}")
         await self.exit_stack.aclose()
+        self.tracer.shutdown()
         await asyncio.sleep(1)
 
 async def main():
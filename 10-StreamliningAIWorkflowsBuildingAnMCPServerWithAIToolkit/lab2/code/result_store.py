@@ -0,0 +1,158 @@
+"""Size budgets for tool results sent back to the model
+
+Large tool results (for example a page snapshot from the Playwright server) are
+kept in a local content store. The model only receives a head/tail preview and a
+handle, and can read the rest on demand through the `read_tool_result` tool.
+
+Stored results belong to the conversation that produced them and handles are
+random, so one conversation cannot read another one's tool output.
+"""
+import secrets
+from collections import OrderedDict
+from typing import Optional
+
+READ_TOOL_NAME = "read_tool_result"
+
+READ_TOOL = {
+    "type": "function",
+    "function": {
+        "name": READ_TOOL_NAME,
+        "description": "Read part of a large tool result that was stored instead of returned in full.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "handle": {"type": "string", "description": "Handle of the stored tool result"},
+                "offset": {"type": "integer", "description": "Byte offset to start reading from", "default": 0},
+                "length": {"type": "integer", "description": "Number of bytes to read"},
+            },
+            "required": ["handle"],
+        },
+    },
+}
+
+
+def _decode(data: bytes) -> str:
+    return data.decode("utf-8", errors="ignore")
+
+
+class ResultStore:
+    """Bounded in-memory store for oversized tool results"""
+
+    def __init__(self,
+                 max_result_bytes: int = 8 * 1024,
+                 max_conversation_bytes: int = 64 * 1024,
+                 preview_bytes: int = 1024,
+                 max_store_bytes: int = 64 * 1024 * 1024,
+                 max_read_bytes_per_turn: int = 16 * 1024):
+        """
+        Args:
+            max_result_bytes: Largest tool result passed to the model as is, also the largest read
+            max_conversation_bytes: Total tool result bytes allowed in one conversation
+            preview_bytes: Size of the head/tail preview sent for a stored result
+            max_store_bytes: Memory bound of the store, the oldest results are evicted first
+            max_read_bytes_per_turn: Total bytes the model can read from stored results in one turn
+        """
+        self.max_result_bytes = max_result_bytes
+        self.max_conversation_bytes = max_conversation_bytes
+        self.preview_bytes = preview_bytes
+        self.max_store_bytes = max_store_bytes
+        self.max_read_bytes_per_turn = max_read_bytes_per_turn
+        # Handle -> (conversation id, content)
+        self._results: OrderedDict[str, tuple[Optional[str], bytes]] = OrderedDict()
+        self._counts: dict[Optional[str], int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def has_results(self, conversation_id: Optional[str] = None) -> bool:
+        """Whether the conversation has stored results it can read"""
+        return self._counts.get(conversation_id, 0) > 0
+
+    def put(self, content: str, conversation_id: Optional[str] = None) -> str:
+        """Store a result and return its handle
+
+        Args:
+            content: Full tool result
+            conversation_id: Conversation the result belongs to, only it can read the result
+        """
+        data = content.encode("utf-8")
+        handle = f"result-{secrets.token_urlsafe(12)}"
+        self._results[handle] = (conversation_id, data)
+        self._counts[conversation_id] = self._counts.get(conversation_id, 0) + 1
+        self._size += len(data)
+        while self._size > self.max_store_bytes and len(self._results) > 1:
+            _, (owner, evicted) = self._results.popitem(last=False)
+            self._size -= len(evicted)
+            self._counts[owner] -= 1
+            if not self._counts[owner]:
+                del self._counts[owner]
+        return handle
+
+    def read_budget(self, conversation_bytes: int, turn_read_bytes: int) -> int:
+        """Bytes the model may still read from stored results
+
+        Reads count against the conversation budget like any other tool result,
+        and against a cap for the current turn.
+
+        Args:
+            conversation_bytes: Tool result bytes already in the conversation
+            turn_read_bytes: Bytes already read from stored results in this turn
+        """
+        return min(self.max_conversation_bytes - conversation_bytes,
+                   self.max_read_bytes_per_turn - turn_read_bytes)
+
+    def read(self, handle: str, offset: int = 0, length: Optional[int] = None,
+             budget: Optional[int] = None, conversation_id: Optional[str] = None) -> str:
+        """Read part of a stored result, at most `max_result_bytes` at a time
+
+        Args:
+            handle: Handle returned by `put`
+            offset: Byte offset to start reading from
+            length: Number of bytes to read
+            budget: Most bytes this read may return, see `read_budget`
+            conversation_id: Conversation reading, it must be the one the result belongs to
+        """
+        owner, data = self._results.get(handle, (None, None))
+        # A handle of another conversation looks the same as one that does not exist
+        if data is None or owner != conversation_id:
+            return f"Error: Unknown or expired result handle: {handle}"
+        try:
+            offset = max(0, int(offset))
+            length = int(length) if length is not None else self.max_result_bytes
+        except (TypeError, ValueError):
+            return f"Error: offset and length must be integers, got offset={offset!r} and length={length!r}"
+        limit = self.max_result_bytes if budget is None else min(self.max_result_bytes, budget)
+        if limit <= 0:
+            return "Error: The tool result budget is used up, answer with what you have read so far."
+        length = max(0, min(length, limit))
+        chunk = _decode(data[offset:offset + length])
+        end = min(offset + length, len(data))
+        return f"[{handle} bytes {offset}-{end} of {len(data)}]\n{chunk}"
+
+    def bound(self, content: str, conversation_bytes: int, conversation_id: Optional[str] = None) -> str:
+        """Return the content to send to the model for one tool result
+
+        Results within both budgets are returned unchanged, anything else is
+        stored and replaced by a preview.
+
+        Args:
+            content: Full tool result
+            conversation_bytes: Tool result bytes already in the conversation
+            conversation_id: Conversation the result belongs to
+        """
+        size = len(content.encode("utf-8"))
+        remaining = self.max_conversation_bytes - conversation_bytes
+        if size <= self.max_result_bytes and size <= remaining:
+            return content
+
+        handle = self.put(content, conversation_id)
+        data = content.encode("utf-8")
+        half = max(0, min(self.preview_bytes, remaining) // 2)
+        head = _decode(data[:half])
+        tail = _decode(data[-half:]) if half else ""
+        return (
+            f"[Result of {size} bytes stored as '{handle}'. Showing the first and last {half} bytes. "
+            f"Call {READ_TOOL_NAME} with this handle, an offset and a length to read more.]\n"
+            f"{head}\n...\n{tail}"
+        )
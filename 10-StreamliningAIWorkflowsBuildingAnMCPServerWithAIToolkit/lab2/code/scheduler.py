@@ -0,0 +1,165 @@
+"""Run many conversations concurrently over one set of MCP server sessions
+
+The scheduler shares a single `MCPClient`, and therefore a single set of server
+processes, between all conversations. Model calls and tool calls are limited by
+fair limiters that hand out free slots round robin across conversations, so a
+busy conversation cannot starve the others.
+"""
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Optional
+
+
+class FairLimiter:
+    """Concurrency limit with round robin queuing across keys"""
+
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity: Number of slots that can be held at the same time
+        """
+        self.capacity = capacity
+        self.in_use = 0
+        self._waiters: OrderedDict[str, deque[asyncio.Future]] = OrderedDict()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._waiters.values())
+
+    async def acquire(self, key: str):
+        """Wait for a free slot
+
+        Args:
+            key: Queue the caller waits in, usually the conversation id
+        """
+        if self.in_use < self.capacity and not self._waiters:
+            self.in_use += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just before the cancellation
+                self.release()
+            else:
+                self._remove(key, future)
+            raise
+
+    def release(self):
+        """Free a slot and hand it to the next queue in turn"""
+        self.in_use -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, key: str):
+        """Hold a slot for the duration of a block
+
+        Args:
+            key: Queue the caller waits in, usually the conversation id
+        """
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _wake(self):
+        while self.in_use < self.capacity and self._waiters:
+            key, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            # The key goes to the back of the rotation so the next slot serves another conversation
+            if queue:
+                self._waiters.move_to_end(key)
+            else:
+                del self._waiters[key]
+            if not future.done():
+                self.in_use += 1
+                future.set_result(None)
+
+    def _remove(self, key: str, future: asyncio.Future):
+        queue = self._waiters.get(key)
+        if queue is None:
+            return
+        try:
+            queue.remove(future)
+        except ValueError:
+            pass
+        if not queue:
+            del self._waiters[key]
+
+
+class ConversationScheduler:
+    """Multiplexes many conversations over one `MCPClient`"""
+
+    def __init__(self, client, max_model_calls: int = 4, max_tool_calls: int = 8):
+        """
+        Args:
+            client: Connected MCPClient shared by every conversation
+            max_model_calls: Model calls in flight across all conversations
+            max_tool_calls: Tool calls in flight across all conversations
+        """
+        self.client = client
+        client.model_limiter = FairLimiter(max_model_calls)
+        client.tool_limiter = FairLimiter(max_tool_calls)
+        self._conversations: dict[str, asyncio.Task] = {}
+
+    def submit(self, conversation_id: str, messages: list[Any]) -> asyncio.Task:
+        """Start a conversation turn in the background
+
+        Args:
+            conversation_id: Unique identifier of the conversation
+            messages: Messages of the conversation, the replies are appended to it
+        """
+        running = self._conversations.get(conversation_id)
+        if running is not None and not running.done():
+            raise ValueError(f"Conversation '{conversation_id}' is already running.")
+        task = asyncio.create_task(
+            self.client.chatWithTools(messages, conversation_id=conversation_id),
+            name=f"conversation-{conversation_id}",
+        )
+        self._conversations[conversation_id] = task
+        return task
+
+    def cancel(self, conversation_id: str) -> bool:
+        """Cancel a running conversation, returns False if it was not running
+
+        A model call already sent is not aborted, but its result is discarded.
+
+        Args:
+            conversation_id: Identifier passed to `submit`
+        """
+        task = self._conversations.get(conversation_id)
+        if task is None or task.done():
+            return False
+        return task.cancel()
+
+    async def wait(self, conversation_id: Optional[str] = None) -> dict[str, Any]:
+        """Wait for one or all conversations and return their outcome by id
+
+        The outcome is the return value of `chatWithTools`, or the exception that ended the conversation.
+
+        Args:
+            conversation_id: Conversation to wait for, None waits for all of them
+        """
+        if conversation_id is not None and conversation_id not in self._conversations:
+            raise ValueError(f"Conversation '{conversation_id}' is not running or was already waited for.")
+        ids = [conversation_id] if conversation_id is not None else list(self._conversations)
+        results = await asyncio.gather(*(self._conversations[id_] for id_ in ids), return_exceptions=True)
+        for id_ in ids:
+            task = self._conversations.get(id_)
+            if task is not None and task.done():
+                del self._conversations[id_]
+        return dict(zip(ids, results))
+
+    def stats(self) -> dict:
+        """Running conversations and limiter usage"""
+        return {
+            "conversations": sum(1 for task in self._conversations.values() if not task.done()),
+            "model_calls": self.client.model_limiter.in_use,
+            "model_calls_queued": self.client.model_limiter.queued,
+            "tool_calls": self.client.tool_limiter.in_use,
+            "tool_calls_queued": self.client.tool_limiter.queued,
+        }
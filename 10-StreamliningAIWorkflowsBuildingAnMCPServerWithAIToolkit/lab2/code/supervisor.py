@@ -0,0 +1,318 @@
+"""Supervision of stdio MCP servers
+
+A stdio server (for example `npx @playwright/mcp`) can crash at any time, and
+starting a new one pays the whole npx/node cold start. The supervisor keeps
+pre-spawned, already initialized spare processes so it can swap a dead session
+for a warm one almost instantly, then replenishes the spares in the background.
+
+A CPU-bound server can also run as several identical replicas. Each call goes to
+the replica with the fewest calls in flight, unless it carries an affinity key,
+in which case it stays pinned to the replica that served the key first.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+import anyio
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.shared.exceptions import McpError
+
+from tracing import call_tool
+
+# Errors raised by a session whose server process has gone away
+CONNECTION_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, BrokenPipeError)
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """Whether an error means the server connection is dead"""
+    if isinstance(error, McpError):
+        return "connection closed" in str(error).lower()
+    return isinstance(error, CONNECTION_ERRORS)
+
+
+class ServerProcess:
+    """One stdio server process and its initialized session
+
+    The process is owned by a dedicated task, so it can be started and stopped
+    from anywhere without crossing anyio cancel scopes.
+    """
+
+    def __init__(self, params: StdioServerParameters):
+        self.params = params
+        self.session: Optional[ClientSession] = None
+        self._ready: Optional[asyncio.Future] = None
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def spawn(self):
+        """Start the process in the background, `wait_ready` returns its session"""
+        self._ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run())
+
+    async def wait_ready(self) -> ClientSession:
+        """Wait until the session is initialized"""
+        self.session = await asyncio.shield(self._ready)
+        return self.session
+
+    async def start(self) -> ClientSession:
+        """Start the process and wait until its session is initialized"""
+        self.spawn()
+        return await self.wait_ready()
+
+    @property
+    def exited(self) -> bool:
+        """Whether the process has ended, during startup or at any time after"""
+        return self._task is not None and self._task.done()
+
+    @staticmethod
+    async def _forward(read, send):
+        async with send:
+            async for message in read:
+                await send.send(message)
+
+    async def _run(self):
+        try:
+            async with stdio_client(self.params) as (read, write):
+                # Messages pass through a local stream, so the end of the server's
+                # output is noticed even when no call is in flight
+                send, receive = anyio.create_memory_object_stream(0)
+                forwarding = asyncio.create_task(self._forward(read, send))
+                try:
+                    async with ClientSession(receive, write) as session:
+                        await session.initialize()
+                        self._ready.set_result(session)
+                        stop = asyncio.create_task(self._stop.wait())
+                        await asyncio.wait({stop, forwarding}, return_when=asyncio.FIRST_COMPLETED)
+                        stop.cancel()
+                finally:
+                    forwarding.cancel()
+                    await asyncio.gather(forwarding, return_exceptions=True)
+        except Exception as e:
+            if not self._ready.done():
+                self._ready.set_exception(e)
+        finally:
+            if not self._ready.done():
+                self._ready.set_exception(ConnectionError("The server process exited"))
+
+    async def stop(self):
+        """Stop the process and wait for it to exit"""
+        self._stop.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class Replica:
+    """One replica slot of a supervised server and its metrics
+
+    The metrics survive restarts, only the process behind the slot changes.
+    """
+
+    def __init__(self, index: int, process: ServerProcess):
+        self.index = index
+        self.process = process
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.restarts = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def session(self) -> ClientSession:
+        return self.process.session
+
+    def metrics(self) -> dict:
+        return {
+            "replica": self.index,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "errors": self.errors,
+            "restarts": self.restarts,
+            "avg_latency_ms": round(1000 * self.busy_seconds / self.calls, 2) if self.calls else 0.0,
+        }
+
+
+class ServerSupervisor:
+    """Keeps stdio server sessions alive, balances calls over replicas and fails over to warm spares"""
+
+    def __init__(self,
+                 server_id: str,
+                 params: StdioServerParameters,
+                 spares: int = 0,
+                 health_check_interval: Optional[float] = None,
+                 on_restart: Optional[Callable[[str, ClientSession], Any]] = None,
+                 replicas: int = 1,
+                 max_affinity_keys: int = 1024):
+        """
+        Args:
+            server_id: Identifier of the supervised server
+            params: How to launch the server process
+            spares: Number of pre-spawned, initialized spare processes
+            health_check_interval: Seconds between pings of the active sessions, None disables pinging
+            on_restart: Awaitable callback invoked with the server id and the new session after a failover
+            replicas: Number of identical server processes serving calls
+            max_affinity_keys: Number of affinity keys remembered, the least recently used are forgotten
+        """
+        self.server_id = server_id
+        self.params = params
+        self.spares = spares
+        self.health_check_interval = health_check_interval
+        self.on_restart = on_restart
+        self.replicas = max(1, replicas)
+        self.max_affinity_keys = max_affinity_keys
+        self.restarts = 0
+        self._replicas: list[Replica] = []
+        self._spares: list[ServerProcess] = []
+        self._affinity: OrderedDict[str, Replica] = OrderedDict()
+        self._failover_lock = asyncio.Lock()
+        self._monitor: Optional[asyncio.Task] = None
+        self._stopping: set[asyncio.Task] = set()
+
+    @property
+    def session(self) -> ClientSession:
+        """Session of the first replica, used for listing tools"""
+        return self._replicas[0].session
+
+    async def start(self) -> ClientSession:
+        """Start the replicas and the spares"""
+        processes = [ServerProcess(self.params) for _ in range(self.replicas)]
+        try:
+            await asyncio.gather(*(process.start() for process in processes))
+        except Exception:
+            await asyncio.gather(*(process.stop() for process in processes), return_exceptions=True)
+            raise
+        self._replicas = [Replica(index, process) for index, process in enumerate(processes)]
+        self._replenish()
+        if self.health_check_interval:
+            self._monitor = asyncio.create_task(self._health_check())
+        return self.session
+
+    def _replenish(self):
+        """Spawn spares in the background until the configured number is reached"""
+        self._spares = [spare for spare in self._spares if not spare.exited]
+        while len(self._spares) < self.spares:
+            spare = ServerProcess(self.params)
+            spare.spawn()
+            self._spares.append(spare)
+
+    async def _take_spare(self) -> ServerProcess:
+        while self._spares:
+            spare = self._spares.pop(0)
+            try:
+                await spare.wait_ready()
+            except Exception as e:
+                print(f"[Supervisor '{self.server_id}'] spare failed to start: {e}")
+                continue
+            if spare.exited:
+                print(f"[Supervisor '{self.server_id}'] spare exited after starting, skipped")
+                continue
+            return spare
+        process = ServerProcess(self.params)
+        await process.start()
+        return process
+
+    async def failover(self, dead_session: Optional[ClientSession] = None):
+        """Replace the process of a replica with a spare
+
+        Args:
+            dead_session: Session that failed, nothing is done if it was already replaced.
+                Defaults to the first replica.
+        """
+        async with self._failover_lock:
+            if dead_session is None:
+                dead_session = self.session
+            replica = next((replica for replica in self._replicas if replica.session is dead_session), None)
+            if replica is None:
+                return
+            dead = replica.process
+            replica.process = await self._take_spare()
+            replica.restarts += 1
+            self.restarts += 1
+            self._replenish()
+            stopping = asyncio.create_task(dead.stop())
+            self._stopping.add(stopping)
+            stopping.add_done_callback(self._stopping.discard)
+            print(f"[Supervisor '{self.server_id}'] replica {replica.index} restarted ({self.restarts} restarts)")
+            if self.on_restart is not None and replica.index == 0:
+                await self.on_restart(self.server_id, self.session)
+
+    async def _health_check(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for replica in list(self._replicas):
+                session = replica.session
+                try:
+                    await asyncio.wait_for(session.send_ping(), self.health_check_interval)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    await self.failover(session)
+
+    def _pick(self, affinity_key: Optional[str]) -> Replica:
+        """Pick the replica for a call: the pinned one, otherwise the least loaded"""
+        if affinity_key is not None and affinity_key in self._affinity:
+            self._affinity.move_to_end(affinity_key)
+            return self._affinity[affinity_key]
+        replica = min(self._replicas, key=lambda replica: (replica.in_flight, replica.calls))
+        if affinity_key is not None:
+            self._affinity[affinity_key] = replica
+            while len(self._affinity) > self.max_affinity_keys:
+                self._affinity.popitem(last=False)
+        return replica
+
+    async def _call_replica(self, replica: Replica, tool_name: str, tool_args: dict, meta: Optional[dict]):
+        replica.in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await call_tool(replica.session, tool_name, tool_args, meta)
+        except Exception:
+            replica.errors += 1
+            raise
+        finally:
+            replica.in_flight -= 1
+            replica.calls += 1
+            replica.busy_seconds += time.perf_counter() - started
+
+    async def call_tool(self, tool_name: str, tool_args: dict, retry: bool = True, affinity_key: Optional[str] = None,
+                        meta: Optional[dict] = None):
+        """Call a tool on a replica, failing over if its server is dead
+
+        Args:
+            tool_name: Name of the tool
+            tool_args: Arguments of the call
+            retry: Whether the call may be repeated after the server died while handling it,
+                calls that were never sent are always retried
+            affinity_key: Calls with the same key always go to the same replica
+            meta: Request metadata sent along, for example the trace context
+        """
+        replica = self._pick(affinity_key)
+        if replica.process.exited:
+            # The process ended since the last call, replace it before sending anything
+            await self.failover(replica.session)
+        session = replica.session
+        try:
+            return await self._call_replica(replica, tool_name, tool_args, meta)
+        except Exception as e:
+            if not is_connection_error(e):
+                raise
+            # A closed stream means the request never reached the server
+            sent = isinstance(e, McpError)
+            await self.failover(session)
+            if sent and not retry:
+                raise
+        return await self._call_replica(replica, tool_name, tool_args, meta)
+
+    def metrics(self) -> list[dict]:
+        """Per replica call metrics"""
+        return [replica.metrics() for replica in self._replicas]
+
+    async def close(self):
+        """Stop every replica and spare"""
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+        processes = [replica.process for replica in self._replicas] + self._spares
+        self._replicas = []
+        self._spares = []
+        await asyncio.gather(*(process.stop() for process in processes), *self._stopping, return_exceptions=True)
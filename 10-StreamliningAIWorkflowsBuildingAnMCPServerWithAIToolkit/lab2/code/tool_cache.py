@@ -0,0 +1,124 @@
+"""Memoization of read-only MCP tool calls
+
+Results are keyed by server, tool and canonical JSON arguments, expire after a
+TTL and are evicted least recently used first. Only tools whose annotations mark
+them read-only are cached, and a call to any other tool of the same server drops
+that server's cached results, since it may have changed what they depend on.
+Idempotent tools are safe to retry, but their results are not reused.
+"""
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+def is_cacheable(tool) -> bool:
+    """Whether a tool's annotations allow its results to be reused
+
+    Args:
+        tool: Tool definition returned by `list_tools`
+    """
+    annotations = getattr(tool, "annotations", None)
+    return bool(annotations is not None and annotations.readOnlyHint)
+
+
+def is_retryable(tool) -> bool:
+    """Whether a tool's annotations allow a call to be repeated after the server died
+
+    Args:
+        tool: Tool definition returned by `list_tools`
+    """
+    annotations = getattr(tool, "annotations", None)
+    return bool(annotations is not None and (annotations.readOnlyHint or annotations.idempotentHint))
+
+
+def cache_key(server_id: str, tool_name: str, tool_args: Optional[dict]) -> tuple[str, str, str]:
+    """Build the cache key for a tool call, independent of argument order
+
+    Args:
+        server_id: Server the tool belongs to
+        tool_name: Name of the tool
+        tool_args: Arguments of the call
+    """
+    args = json.dumps(tool_args or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return server_id, tool_name, args
+
+
+class ToolResultCache:
+    """LRU cache with a TTL for tool call results"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 30):
+        """
+        Args:
+            max_entries: Number of results kept, the least recently used are evicted first
+            ttl_seconds: Time a result stays valid
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        # Bumped by every invalidation, so a result fetched before it is not stored after it
+        self._generations: dict[str, int] = {}
+        self.stats = {"hits": 0, "misses": 0, "bypasses": 0, "evictions": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple) -> Optional[Any]:
+        """Return the cached result for a key, or None on a miss
+
+        Args:
+            key: Key built by `cache_key`
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return result
+            del self._entries[key]
+        self.stats["misses"] += 1
+        return None
+
+    def generation(self, server_id: str) -> int:
+        """Current generation of a server's results, pass it to `put`"""
+        return self._generations.get(server_id, 0)
+
+    def put(self, key: tuple, result: Any, generation: Optional[int] = None):
+        """Store a result
+
+        Args:
+            key: Key built by `cache_key`
+            result: Result of the tool call
+            generation: Generation of the server when the call was sent, the result is
+                dropped if the server's results were invalidated since
+        """
+        if generation is not None and generation != self.generation(key[0]):
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def bypass(self):
+        """Record a call that skipped the cache on purpose"""
+        self.stats["bypasses"] += 1
+
+    def clear(self):
+        """Drop every cached result"""
+        self._entries.clear()
+
+    def invalidate_server(self, server_id: str):
+        """Drop the cached results of one server, after a call that may have changed its state
+
+        Args:
+            server_id: Server whose results are dropped
+        """
+        self._generations[server_id] = self.generation(server_id) + 1
+        for key in [key for key in self._entries if key[0] == server_id]:
+            del self._entries[key]
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
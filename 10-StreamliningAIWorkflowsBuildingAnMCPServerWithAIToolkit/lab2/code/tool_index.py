@@ -0,0 +1,140 @@
+"""Local relevance index over MCP tool schemas
+
+Scores tools against the recent conversation with BM25 so the agent only
+sends the most relevant tool schemas to the model on each turn.
+Everything runs in-process, no embedding service or network call is needed.
+"""
+import json
+import math
+import re
+from collections import Counter
+from typing import Any, Iterable, Optional
+
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+_SUFFIXES = ("ions", "ing", "ion", "ed", "es", "s", "e")
+
+# Tool names are the strongest relevance signal, so their terms are counted more than once
+NAME_WEIGHT = 3
+
+
+def _stem(term: str) -> str:
+    """Strip a common English suffix so that e.g. "navigation" matches "navigate" """
+    for suffix in _SUFFIXES:
+        if len(term) - len(suffix) >= 3 and term.endswith(suffix):
+            return term[:-len(suffix)]
+    return term
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase, stemmed terms, breaking snake_case and camelCase words
+
+    Args:
+        text: Text to tokenize
+    """
+    terms = []
+    for word in _WORD_RE.findall(text or ""):
+        parts = _CAMEL_RE.findall(word)
+        terms.extend(_stem(part.lower()) for part in parts)
+        if len(parts) > 1:
+            terms.append(_stem(word.lower()))
+    return terms
+
+
+def estimate_tokens(payload: Any) -> int:
+    """Rough token count of a JSON payload (about 4 characters per token)
+
+    Args:
+        payload: JSON serializable object
+    """
+    return len(json.dumps(payload, ensure_ascii=False)) // 4
+
+
+class ToolIndex:
+    """BM25 index over tool names, descriptions and parameter names"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._docs: dict[str, Counter] = {}
+        self._doc_freq: Counter = Counter()
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, name: str, description: Optional[str], input_schema: Optional[dict]):
+        """Add or replace a tool in the index
+
+        Args:
+            name: Tool name
+            description: Tool description
+            input_schema: JSON schema of the tool parameters
+        """
+        self.remove(name)
+        terms = tokenize(name) * NAME_WEIGHT + tokenize(description or "")
+        properties = (input_schema or {}).get("properties", {})
+        for param_name in properties:
+            terms.extend(tokenize(param_name))
+
+        doc = Counter(terms)
+        self._docs[name] = doc
+        self._doc_freq.update(doc.keys())
+        self._total_length += sum(doc.values())
+
+    def remove(self, name: str):
+        """Remove a tool from the index if present
+
+        Args:
+            name: Tool name
+        """
+        doc = self._docs.pop(name, None)
+        if doc is None:
+            return
+        self._doc_freq.subtract(doc.keys())
+        self._total_length -= sum(doc.values())
+
+    def score(self, query: str) -> dict[str, float]:
+        """Score every indexed tool against a query
+
+        Args:
+            query: Free text to match against the tools
+        """
+        if not self._docs:
+            return {}
+        query_terms = set(tokenize(query))
+        doc_count = len(self._docs)
+        avg_length = self._total_length / doc_count or 1
+        scores = {}
+        for name, doc in self._docs.items():
+            length = sum(doc.values())
+            score = 0.0
+            for term in query_terms:
+                freq = doc.get(term)
+                if not freq:
+                    continue
+                df = self._doc_freq[term]
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                score += idf * freq * (self.k1 + 1) / (freq + self.k1 * (1 - self.b + self.b * length / avg_length))
+            scores[name] = score
+        return scores
+
+    def top_k(self, query: str, k: int, pinned: Iterable[str] = ()) -> list[str]:
+        """Return the names of the pinned tools followed by the k best matches
+
+        Ties keep the order in which the tools were added.
+
+        Args:
+            query: Free text to match against the tools
+            k: Number of ranked tools to return in addition to the pinned ones
+            pinned: Tool names that are always included
+        """
+        selected = [name for name in pinned if name in self._docs]
+        scores = self.score(query)
+        order = {name: i for i, name in enumerate(self._docs)}
+        ranked = sorted(
+            (name for name in self._docs if name not in selected),
+            key=lambda name: (-scores[name], order[name]),
+        )
+        return selected + ranked[:k]
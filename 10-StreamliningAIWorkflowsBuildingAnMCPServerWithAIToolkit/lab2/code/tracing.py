@@ -0,0 +1,312 @@
+"""Timing spans for the agent loop
+
+Each `chatWithTools` iteration is recorded as nested spans (model call, tool
+calls tagged with their server, argument parsing and message building). Spans
+are exported as JSON lines and/or OTLP/HTTP JSON, and the trace context is sent
+to MCP servers in the `_meta.traceparent` field of every tool call so server
+side spans can join the same trace.
+
+Run `python tracing.py collector` for a local stand-in of an OpenTelemetry
+collector that prints the spans it receives.
+"""
+import json
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+from mcp import ClientSession, types
+
+SERVICE_NAME = "lab2-agent"
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """A timed operation, possibly nested in a parent span"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        """W3C trace context header value pointing at this span"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attributes):
+        """Add attributes to the span"""
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def parse_traceparent(traceparent: str) -> Optional[tuple[str, str]]:
+    """Return the (trace id, parent span id) of a traceparent value, or None if it is malformed"""
+    parts = (traceparent or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+class Tracer:
+    """Creates spans and hands finished spans to the exporters"""
+
+    def __init__(self, exporters: Optional[list] = None):
+        """
+        Args:
+            exporters: Objects with `export(span)` and `shutdown()` methods
+        """
+        self.exporters = exporters or []
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        """Configure exporters from AGENT_TRACE_FILE and OTEL_EXPORTER_OTLP_ENDPOINT"""
+        exporters = []
+        if os.environ.get("AGENT_TRACE_FILE"):
+            exporters.append(JsonlExporter(os.environ["AGENT_TRACE_FILE"]))
+        if os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
+            exporters.append(OtlpHttpExporter(os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"]))
+        return cls(exporters)
+
+    @contextmanager
+    def span(self, name: str, traceparent: Optional[str] = None, **attributes):
+        """Record a span around a block, nested in the current span
+
+        Args:
+            name: Name of the operation
+            traceparent: Remote parent to continue, used when there is no current span
+            attributes: Attributes of the span
+        """
+        parent = _current_span.get()
+        remote = parse_traceparent(traceparent) if parent is None and traceparent else None
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        elif remote is not None:
+            trace_id, parent_id = remote
+        else:
+            trace_id, parent_id = secrets.token_hex(16), None
+
+        span = Span(name, trace_id, parent_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            for exporter in self.exporters:
+                exporter.export(span)
+
+    def meta(self) -> Optional[dict]:
+        """`_meta` for an MCP request that propagates the current trace context"""
+        span = _current_span.get()
+        return {"traceparent": span.traceparent} if span is not None else None
+
+    def shutdown(self):
+        """Flush and close every exporter"""
+        for exporter in self.exporters:
+            exporter.shutdown()
+
+
+async def call_tool(session: ClientSession, tool_name: str, tool_args: dict, meta: Optional[dict] = None):
+    """`session.call_tool` that also sends `_meta` with the request
+
+    Args:
+        session: Connected ClientSession
+        tool_name: Name of the tool
+        tool_args: Arguments of the call
+        meta: Request metadata, for example the trace context
+    """
+    if not meta:
+        return await session.call_tool(tool_name, tool_args)
+    result = await session.send_request(
+        types.ClientRequest(
+            types.CallToolRequest(
+                method="tools/call",
+                params=types.CallToolRequestParams(name=tool_name, arguments=tool_args, _meta=meta),
+            )
+        ),
+        types.CallToolResult,
+    )
+    if not result.isError:
+        await session._validate_tool_result(tool_name, result)
+    return result
+
+
+class JsonlExporter:
+    """Appends one JSON line per finished span to a file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def shutdown(self):
+        with self._lock:
+            self._file.close()
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: list[Span], service_name: str = SERVICE_NAME) -> dict:
+    """Encode spans as an OTLP/HTTP JSON export request"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": service_name},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+                    "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+                } for span in spans],
+            }],
+        }]
+    }
+
+
+_STOP = object()
+
+
+class OtlpHttpExporter:
+    """Sends spans in batches to an OpenTelemetry collector over OTLP/HTTP JSON
+
+    Spans are posted from a background thread so the agent loop never waits on the collector.
+    """
+
+    def __init__(self, endpoint: str = "http://localhost:4318", service_name: str = SERVICE_NAME,
+                 batch_size: int = 64, flush_interval: float = 2.0):
+        """
+        Args:
+            endpoint: Collector base URL, or the full `/v1/traces` URL
+            service_name: Value of the `service.name` resource attribute
+            batch_size: Spans sent per request
+            flush_interval: Seconds after which a partial batch is sent
+        """
+        endpoint = endpoint.rstrip("/")
+        self.url = endpoint if endpoint.endswith("/v1/traces") else endpoint + "/v1/traces"
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=10_000)
+        self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                span = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                span = None
+            stop = span is _STOP
+            if span is not None and not stop:
+                batch.append(span)
+            if batch and (stop or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._post(batch)
+                batch = []
+            if stop:
+                return
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+    def _post(self, spans: list[Span]):
+        body = json.dumps(to_otlp(spans, self.service_name), default=str).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+        except OSError as e:
+            self.dropped += len(spans)
+            print(f"[Tracing] failed to export {len(spans)} spans to {self.url}: {e}")
+
+    def shutdown(self):
+        self._queue.put(_STOP)
+        self._thread.join(timeout=10)
+
+
+class _CollectorHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        for resource_spans in json.loads(body).get("resourceSpans", []):
+            for scope_spans in resource_spans.get("scopeSpans", []):
+                for span in scope_spans.get("spans", []):
+                    duration_ms = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+                    print(f"{span['traceId'][:8]} {span['spanId']} <- {span['parentSpanId'] or '-':16} "
+                          f"{span['name']} {duration_ms:.1f}ms", flush=True)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_collector(host: str = "127.0.0.1", port: int = 4318):
+    """Run a local stand-in for an OTLP/HTTP collector that prints received spans"""
+    server = ThreadingHTTPServer((host, port), _CollectorHandler)
+    print(f"OTLP collector stand-in listening on http://{host}:{port}/v1/traces")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "collector":
+        run_collector(port=int(sys.argv[2]) if len(sys.argv) > 2 else 4318)
+    else:
+        print("Usage: python tracing.py collector [port]")
@@ -11,8 +11,23 @@ if __name__ == "__main__":
         server.settings.port = port
         server.settings.host = "127.0.0.1"
         server.run(transport="sse")
+    elif transport_type == "streamable-http":
+        port = int(os.environ.get("PORT", 3001))
+        host = os.environ.get("HOST", "127.0.0.1")
+        workers = int(os.environ.get("WORKERS", 1))
+        json_response = os.environ.get("JSON_RESPONSE", "").lower() in ("1", "true", "yes")
+        if workers > 1:
+            # Sessions cannot follow a client across processes, so several workers always run stateless
+            from workers import run_workers
+            run_workers(host, port, workers, server.settings.log_level, json_response)
+        else:
+            server.settings.port = port
+            server.settings.host = host
+            server.settings.stateless_http = os.environ.get("STATELESS_HTTP", "").lower() in ("1", "true", "yes")
+            server.settings.json_response = json_response
+            server.run(transport="streamable-http")
     elif transport_type == "stdio":
         server.run(transport="stdio")
     else:
-        print("Invalid transport type. Use 'sse' or 'stdio'.")
-        sys.exit(1)
\ No newline at end of file
+        print("Invalid transport type. Use 'sse', 'streamable-http' or 'stdio'.")
+        sys.exit(1)
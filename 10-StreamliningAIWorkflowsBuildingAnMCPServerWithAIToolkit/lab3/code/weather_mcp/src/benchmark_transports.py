@@ -0,0 +1,143 @@
+"""Calls per second of get_weather over the HTTP transports
+
+Starts the server once per configuration on a free port and keeps it busy
+with concurrent client sessions for a while:
+
+| Configuration | Command |
+| ------------- | ------- |
+| sse | `python __init__.py sse` |
+| streamable-http x1 | `STATELESS_HTTP=1 python __init__.py streamable-http` |
+| streamable-http xN | `WORKERS=N python __init__.py streamable-http` |
+
+Clients run in several processes so the client side is not what limits the
+numbers. The mock provider answers from memory, so the results measure the
+transport and the server, not the weather API.
+
+Usage: python benchmark_transports.py [--seconds 10] [--clients 64] [--workers N] [--client-processes N]
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+
+LOCATIONS = ["Seattle", "London", "Tokyo", "47.61,-122.33", "Paris", "Sydney", "New York", "Berlin"]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"The server did not start listening on port {port}")
+
+
+async def _session_loop(url: str, transport: str, deadline: float, offset: int) -> tuple[int, int]:
+    calls = errors = 0
+    client = sse_client(url) if transport == "sse" else streamablehttp_client(url)
+    async with client as streams:
+        async with ClientSession(streams[0], streams[1]) as session:
+            await session.initialize()
+            while time.monotonic() < deadline:
+                location = LOCATIONS[(offset + calls + errors) % len(LOCATIONS)]
+                try:
+                    result = await session.call_tool("get_weather", {"location": location})
+                    if result.isError:
+                        errors += 1
+                    else:
+                        calls += 1
+                except Exception:
+                    errors += 1
+    return calls, errors
+
+
+def _client_process(url: str, transport: str, sessions: int, seconds: float, first: int) -> tuple[int, int]:
+    # One log line per request would cost more than the requests
+    logging.disable(logging.INFO)
+
+    async def run():
+        deadline = time.monotonic() + seconds
+        results = await asyncio.gather(*(
+            _session_loop(url, transport, deadline, first + index) for index in range(sessions)
+        ))
+        return sum(calls for calls, _ in results), sum(errors for _, errors in results)
+
+    return asyncio.run(run())
+
+
+def measure(transport: str, workers: int, clients: int, seconds: float, client_processes: int) -> dict:
+    """Start a server, load it and return the calls per second
+
+    Args:
+        transport: "sse" or "streamable-http"
+        workers: Server processes, only used by streamable-http
+        clients: Concurrent client sessions
+        seconds: How long the load lasts
+        client_processes: Processes the client sessions are spread over
+    """
+    port = _free_port()
+    env = dict(os.environ, PORT=str(port), WORKERS=str(workers), STATELESS_HTTP="1", LOG_LEVEL="WARNING")
+    server = subprocess.Popen([sys.executable, str(Path(__file__).with_name("__init__.py")), transport],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_for_port(port)
+        url = f"http://127.0.0.1:{port}" + ("/sse" if transport == "sse" else "/mcp/")
+        shares = [clients // client_processes + (index < clients % client_processes)
+                  for index in range(client_processes)]
+        with multiprocessing.Pool(client_processes) as pool:
+            started = time.monotonic()
+            results = pool.starmap(_client_process, [
+                (url, transport, share, seconds, sum(shares[:index]))
+                for index, share in enumerate(shares) if share
+            ])
+            elapsed = time.monotonic() - started
+    finally:
+        server.terminate()
+        server.wait()
+    calls = sum(calls for calls, _ in results)
+    return {
+        "configuration": transport if transport == "sse" else f"{transport} x{workers}",
+        "calls": calls,
+        "errors": sum(errors for _, errors in results),
+        "calls_per_second": calls / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--client-processes", type=int, default=min(8, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    configurations = [("sse", 1), ("streamable-http", 1)]
+    if args.workers > 1:
+        configurations.append(("streamable-http", args.workers))
+    print(f"{'Configuration':<24}{'Calls':>10}{'Errors':>10}{'Calls/s':>12}")
+    for transport, workers in configurations:
+        result = measure(transport, workers, args.clients, args.seconds, args.client_processes)
+        print(f"{result['configuration']:<24}{result['calls']:>10}{result['errors']:>10}"
+              f"{result['calls_per_second']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Geohash encoding
+
+A geohash names a rectangular cell of the earth with a short base32 string.
+Nearby points share a prefix, so rounding locations to a cell lets queries for
+places a few streets apart share one cached weather entry.
+
+| Precision | Cell size (approx.) |
+| --------- | ------------------- |
+| 4 | 39 km x 20 km |
+| 5 | 4.9 km x 4.9 km |
+| 6 | 1.2 km x 0.6 km |
+
+`encode_many` and `decode_many` do the same for NumPy arrays of points, so
+large batches cost about as much as a single point.
+"""
+import numpy as np
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {char: index for index, char in enumerate(_BASE32)}
+
+
+def encode(latitude: float, longitude: float, precision: int = 5) -> str:
+    """Geohash of the cell that contains a point
+
+    Args:
+        latitude: Latitude in degrees, -90 to 90
+        longitude: Longitude in degrees, -180 to 180
+        precision: Number of characters, more characters are smaller cells
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        bounds, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (bounds[0] + bounds[1]) / 2
+        if coordinate >= middle:
+            value = (value << 1) | 1
+            bounds[0] = middle
+        else:
+            value <<= 1
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def bounds(geohash: str) -> tuple[float, float, float, float]:
+    """(south, west, north, east) edges of a cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash.lower():
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if (value >> shift) & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def decode(geohash: str) -> tuple[float, float]:
+    """(latitude, longitude) of the center of a cell"""
+    south, west, north, east = bounds(geohash)
+    return (south + north) / 2, (west + east) / 2
+
+
+def _bit_counts(precision: int) -> tuple[int, int]:
+    """Bits of longitude and latitude in a geohash, longitude gets the odd bit"""
+    bits = 5 * precision
+    return (bits + 1) // 2, bits // 2
+
+
+def encode_many(latitudes, longitudes, precision: int = 5) -> list[str]:
+    """Geohashes of many points at once, same as calling `encode` for each point
+
+    Args:
+        latitudes: Latitudes in degrees
+        longitudes: Longitudes in degrees
+        precision: Number of characters, at most 12
+    """
+    lon_bits, lat_bits = _bit_counts(precision)
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    # Index of the interval of each coordinate, as halving the range bit by bit would find it
+    lat_index = np.clip(np.floor((latitudes + 90) / 180 * 2 ** lat_bits), 0, 2 ** lat_bits - 1).astype(np.uint64)
+    lon_index = np.clip(np.floor((longitudes + 180) / 360 * 2 ** lon_bits), 0, 2 ** lon_bits - 1).astype(np.uint64)
+    value = np.zeros(latitudes.shape, dtype=np.uint64)
+    for bit in range(5 * precision):
+        if bit % 2 == 0:
+            lon_bits -= 1
+            next_bit = (lon_index >> np.uint64(lon_bits)) & np.uint64(1)
+        else:
+            lat_bits -= 1
+            next_bit = (lat_index >> np.uint64(lat_bits)) & np.uint64(1)
+        value = (value << np.uint64(1)) | next_bit
+    shifts = np.arange(precision - 1, -1, -1, dtype=np.uint64) * np.uint64(5)
+    digits = (value[:, None] >> shifts) & np.uint64(31)
+    alphabet = np.array([ord(char) for char in _BASE32], dtype=np.uint32)
+    return alphabet[digits].view(f"<U{precision}").ravel().tolist()
+
+
+def decode_many(geohashes: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Centers (latitudes, longitudes) of many cells of the same precision"""
+    if not geohashes:
+        return np.zeros(0), np.zeros(0)
+    precision = len(geohashes[0])
+    lon_bits, lat_bits = _bit_counts(precision)
+    codes = np.array(geohashes, dtype=f"<U{precision}").view(np.uint32).reshape(-1, precision)
+    lookup = np.zeros(128, dtype=np.uint64)
+    for char, index in _DECODE.items():
+        lookup[ord(char)] = index
+    digits = lookup[codes]
+    lat_index = np.zeros(len(geohashes), dtype=np.uint64)
+    lon_index = np.zeros(len(geohashes), dtype=np.uint64)
+    for bit in range(5 * precision):
+        next_bit = (digits[:, bit // 5] >> np.uint64(4 - bit % 5)) & np.uint64(1)
+        if bit % 2 == 0:
+            lon_index = (lon_index << np.uint64(1)) | next_bit
+        else:
+            lat_index = (lat_index << np.uint64(1)) | next_bit
+    latitudes = (lat_index.astype(np.float64) + 0.5) / 2 ** lat_bits * 180 - 90
+    longitudes = (lon_index.astype(np.float64) + 0.5) / 2 ** lon_bits * 360 - 180
+    return latitudes, longitudes
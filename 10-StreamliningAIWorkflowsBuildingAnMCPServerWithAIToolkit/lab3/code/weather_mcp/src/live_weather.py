@@ -0,0 +1,95 @@
+"""Push updates for subscribed weather resources
+
+Each subscribed `weather://{location}` URI gets one background task, however
+many sessions subscribe to it. The task re-reads the weather when the cached
+cell expires, which is when the provider publishes new data, and notifies the
+subscribers only if the values changed. Tasks for locations in the same cell
+share one provider request through the service cache.
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+from urllib.parse import unquote
+
+from providers import ProviderError
+from subscriptions import ResourceSubscriptions
+from weather_service import UnknownLocation, WeatherService
+
+logger = logging.getLogger(__name__)
+
+URI_PREFIX = "weather://"
+
+# Fields that make a notification worth sending, observed_at alone does not
+_COMPARED = ("temperature", "condition", "humidity", "wind_mph")
+
+
+def location_of(uri: str) -> str:
+    return unquote(uri[len(URI_PREFIX):])
+
+
+class WeatherRefresher:
+    """One refresh loop per subscribed weather URI"""
+
+    def __init__(self, service: WeatherService, subscriptions: ResourceSubscriptions,
+                 min_interval: float = 30, retry_interval: float = 60):
+        """
+        Args:
+            service: Cached weather lookups shared with the tools
+            subscriptions: Sessions to notify, its subscribe hooks start and stop the loops
+            min_interval: Shortest time between two refreshes of a location
+            retry_interval: Wait after a provider error
+        """
+        self.service = service
+        self.subscriptions = subscriptions
+        self.min_interval = min_interval
+        self.retry_interval = retry_interval
+        self._tasks: dict[str, asyncio.Task] = {}
+        self.stats = {"refreshes": 0, "notifications": 0}
+        subscriptions.on_subscribe = self.start
+        subscriptions.on_unsubscribe = self.stop
+
+    def start(self, uri: str):
+        """Refresh a URI in the background until it has no subscribers"""
+        if not uri.startswith(URI_PREFIX) or uri in self._tasks:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(uri))
+        self._tasks[uri] = task
+
+        def finished(_):
+            if self._tasks.get(uri) is task:
+                del self._tasks[uri]
+
+        task.add_done_callback(finished)
+
+    def stop(self, uri: str):
+        task = self._tasks.pop(uri, None)
+        if task is not None:
+            task.cancel()
+
+    def refreshing(self) -> list[str]:
+        return list(self._tasks)
+
+    async def _run(self, uri: str):
+        location = location_of(uri)
+        last: Optional[tuple] = None
+        while self.subscriptions.subscribed(uri):
+            try:
+                place, entry, _ = await self.service.lookup(location)
+            except UnknownLocation:
+                # Reading the resource reports the error, there is nothing to refresh
+                return
+            except ProviderError as e:
+                logger.warning("Refreshing %s failed: %s", uri, e)
+                await asyncio.sleep(self.retry_interval)
+                continue
+
+            self.stats["refreshes"] += 1
+            weather = self.service.describe(location, place, entry, True)
+            values = tuple(weather[field] for field in _COMPARED)
+            # The first read is what the subscriber already has, only later changes are pushed
+            if last is not None and values != last:
+                self.stats["notifications"] += 1
+                await self.subscriptions.notify(uri)
+            last = values
+            await asyncio.sleep(max(self.min_interval, entry.expires_at - time.monotonic()))
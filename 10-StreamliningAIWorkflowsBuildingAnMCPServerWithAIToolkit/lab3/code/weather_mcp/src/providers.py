@@ -0,0 +1,471 @@
+"""Weather providers
+
+A provider turns a place name into coordinates and returns the current
+conditions at a point. `MockProvider` makes up plausible values without any
+network access, for whole arrays of points at once with NumPy.
+`OpenMeteoProvider` calls an Open-Meteo compatible HTTP API over a pooled
+client, asking for many points per request.
+
+Run `python providers.py serve [port]` for a local stand-in of the Open-Meteo
+forecast and geocoding APIs. Point the server at it with
+`WEATHER_PROVIDER=open-meteo WEATHER_API_URL=http://127.0.0.1:8080`.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import numpy as np
+
+
+@dataclass
+class Place:
+    """A resolved location"""
+    name: str
+    latitude: float
+    longitude: float
+
+
+@dataclass
+class Observation:
+    """Current conditions at a point"""
+    temperature_f: float
+    condition: str
+    humidity: int
+    wind_mph: float
+    observed_at: str
+    # Seconds the provider keeps this value before publishing a new one
+    max_age: float
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class HourlySeries:
+    """Hourly values at a point, one array per metric, NaN where a value is missing"""
+    # Hours since the Unix epoch, UTC
+    start_hour: int
+    columns: dict[str, np.ndarray]
+
+    @property
+    def hours(self) -> int:
+        return len(next(iter(self.columns.values())))
+
+
+class ProviderError(Exception):
+    """The provider could not answer"""
+
+
+# WMO weather interpretation codes, as used by Open-Meteo
+def condition_of(code: int) -> str:
+    """Condition name of a WMO weather code"""
+    if code == 0:
+        return "Sunny"
+    if code <= 3:
+        return "Cloudy"
+    if code in (45, 48):
+        return "Foggy"
+    if 71 <= code <= 77 or code in (85, 86):
+        return "Snowy"
+    if code >= 95:
+        return "Stormy"
+    return "Rainy"
+
+
+_COORDINATES_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*[, ]\s*(-?\d+(?:\.\d+)?)\s*$")
+
+
+def parse_coordinates(location: str) -> Optional[Place]:
+    """Place of a "latitude, longitude" string, None if the string is not coordinates"""
+    match = _COORDINATES_RE.match(location)
+    if not match:
+        return None
+    latitude, longitude = float(match.group(1)), float(match.group(2))
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return Place(location.strip(), latitude, longitude)
+
+
+class WeatherProvider(ABC):
+    """Interface of weather providers"""
+
+    name = "base"
+    # Seconds between updates of the provider's data, cached values live this long
+    refresh_interval: float = 900
+
+    @property
+    def source(self) -> str:
+        """Where the data comes from, stored values of another source are never used for this one"""
+        return self.name
+
+    @abstractmethod
+    async def geocode(self, query: str) -> Optional[Place]:
+        """Coordinates of a place name, None if it is unknown"""
+
+    @abstractmethod
+    async def current(self, latitude: float, longitude: float) -> Observation:
+        """Current conditions at a point, raises ProviderError on failure"""
+
+    async def current_many(self, latitudes: list[float], longitudes: list[float]) -> list[Observation]:
+        """Current conditions at many points, in order, raises ProviderError on failure
+
+        Providers that can answer for many points at once should override this.
+        """
+        return list(await asyncio.gather(*(
+            self.current(latitude, longitude) for latitude, longitude in zip(latitudes, longitudes)
+        )))
+
+    @abstractmethod
+    async def hourly(self, latitude: float, longitude: float, start_hour: int, hours: int) -> HourlySeries:
+        """Hourly history and forecast at a point, raises ProviderError on failure
+
+        Args:
+            latitude: Latitude in degrees
+            longitude: Longitude in degrees
+            start_hour: First hour, in hours since the Unix epoch
+            hours: Number of hours
+        """
+
+    async def close(self):
+        """Release connections"""
+
+
+# A few well known places, so the mock provider returns sensible coordinates for them
+_PLACES = {
+    "shanghai": (31.2304, 121.4737), "beijing": (39.9042, 116.4074), "tokyo": (35.6762, 139.6503),
+    "seoul": (37.5665, 126.9780), "singapore": (1.3521, 103.8198), "sydney": (-33.8688, 151.2093),
+    "mumbai": (19.0760, 72.8777), "dubai": (25.2048, 55.2708), "moscow": (55.7558, 37.6173),
+    "london": (51.5074, -0.1278), "paris": (48.8566, 2.3522), "berlin": (52.5200, 13.4050),
+    "madrid": (40.4168, -3.7038), "rome": (41.9028, 12.4964), "cairo": (30.0444, 31.2357),
+    "lagos": (6.5244, 3.3792), "new york": (40.7128, -74.0060), "seattle": (47.6062, -122.3321),
+    "san francisco": (37.7749, -122.4194), "los angeles": (34.0522, -118.2437),
+    "chicago": (41.8781, -87.6298), "toronto": (43.6532, -79.3832), "mexico city": (19.4326, -99.1332),
+    "sao paulo": (-23.5505, -46.6333), "buenos aires": (-34.6037, -58.3816),
+}
+
+
+class MockProvider(WeatherProvider):
+    """Made up but stable weather: the same point gets the same values until the next refresh"""
+
+    name = "mock"
+
+    def __init__(self, refresh_interval: float = 900):
+        self.refresh_interval = refresh_interval
+
+    async def geocode(self, query: str) -> Optional[Place]:
+        key = query.strip().lower()
+        if key in _PLACES:
+            return Place(query.strip(), *_PLACES[key])
+        # Unknown names get a stable pseudo location
+        digest = hashlib.sha256(key.encode("utf-8")).digest()
+        latitude = int.from_bytes(digest[:4], "big") / 2 ** 32 * 140 - 70
+        longitude = int.from_bytes(digest[4:8], "big") / 2 ** 32 * 360 - 180
+        return Place(query.strip(), round(latitude, 4), round(longitude, 4))
+
+    async def current(self, latitude: float, longitude: float) -> Observation:
+        return (await self.current_many([latitude], [longitude]))[0]
+
+    async def current_many(self, latitudes: list[float], longitudes: list[float]) -> list[Observation]:
+        now = time.time()
+        period = int(now // self.refresh_interval)
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        # One pseudo random stream per point and refresh period, computed for all points at once
+        seed = (np.round(latitudes * 1e4).astype(np.int64).astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+                ^ np.round(longitudes * 1e4).astype(np.int64).astype(np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F)
+                ^ np.uint64(period))
+        # Warmer near the equator
+        temperature = np.clip(85 - 0.6 * np.abs(latitudes) + 20 * _uniform(seed, 1) - 10, 10, 90).round(1)
+        # Snow only when it is cold
+        kinds = np.where(temperature < 35, 4, 3)
+        condition = np.array(_MOCK_CONDITIONS)[(_uniform(seed, 2) * kinds).astype(np.int64)]
+        humidity = (20 + _uniform(seed, 3) * 76).astype(np.int64)
+        wind = (_uniform(seed, 4) * 25).round(1)
+
+        observed_at = datetime.fromtimestamp(period * self.refresh_interval, timezone.utc).isoformat()
+        max_age = (period + 1) * self.refresh_interval - now
+        return [
+            Observation(temperature_f=t, condition=c, humidity=h, wind_mph=w, observed_at=observed_at, max_age=max_age)
+            for t, c, h, w in zip(temperature.tolist(), condition.tolist(), humidity.tolist(), wind.tolist())
+        ]
+
+    async def hourly(self, latitude: float, longitude: float, start_hour: int, hours: int) -> HourlySeries:
+        hour = np.arange(start_hour, start_hour + hours, dtype=np.int64)
+        # Every hour has its own stream, so history does not change when it is asked for again
+        point = ((round(latitude * 1e4) * 0x9E3779B97F4A7C15) ^ (round(longitude * 1e4) * 0xC2B2AE3D27D4EB4F))
+        with np.errstate(over="ignore"):
+            seed = np.uint64(point & 0xFFFFFFFFFFFFFFFF) ^ hour.astype(np.uint64) * np.uint64(0xD6E8FEB86659FD93)
+        # Warmest mid afternoon local time
+        local_hour = (hour + longitude / 15) % 24
+        temperature = (85 - 0.6 * abs(latitude) - 4 + 8 * np.sin((local_hour - 9) / 24 * 2 * np.pi)
+                       + 6 * _uniform(seed, 1)).clip(10, 95).round(1)
+        weather_code = np.array([0, 2, 3, 45, 61, 63, 80, 95])[(_uniform(seed, 2) * 8).astype(np.int64)]
+        weather_code = np.where((temperature < 35) & (weather_code >= 61), 73, weather_code)
+        return HourlySeries(start_hour, {
+            "temperature_f": temperature,
+            "humidity": (20 + _uniform(seed, 3) * 76).round(),
+            "wind_mph": (_uniform(seed, 4) * 25).round(1),
+            "weather_code": weather_code.astype(np.float64),
+        })
+
+
+_MOCK_CONDITIONS = ["Sunny", "Rainy", "Cloudy", "Snowy"]
+
+
+def _uniform(seed: np.ndarray, stream: int) -> np.ndarray:
+    """Uniform numbers in [0, 1), one per seed, from the splitmix64 mixer"""
+    with np.errstate(over="ignore"):
+        x = seed + np.uint64(stream) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        x = x ^ (x >> np.uint64(31))
+    return (x >> np.uint64(11)).astype(np.float64) / 2.0 ** 53
+
+
+class OpenMeteoProvider(WeatherProvider):
+    """Current conditions from an Open-Meteo compatible API"""
+
+    name = "open-meteo"
+
+    def __init__(self,
+                 api_url: str = "https://api.open-meteo.com",
+                 geocoding_url: Optional[str] = None,
+                 refresh_interval: float = 900,
+                 client: Optional[httpx.AsyncClient] = None,
+                 max_points: int = 100):
+        """
+        Args:
+            api_url: Base URL of the forecast API
+            geocoding_url: Base URL of the geocoding API, defaults to the Open-Meteo one,
+                or to api_url when api_url is not the public API
+            refresh_interval: Seconds between model updates, used when responses carry no Cache-Control
+            client: HTTP client to use, one with a connection pool is created otherwise
+            max_points: Points asked for in one request
+        """
+        self.api_url = api_url.rstrip("/")
+        if geocoding_url is None:
+            geocoding_url = ("https://geocoding-api.open-meteo.com" if "api.open-meteo.com" in self.api_url
+                             else self.api_url)
+        self.geocoding_url = geocoding_url.rstrip("/")
+        self.refresh_interval = refresh_interval
+        self.max_points = max_points
+        self.client = client or httpx.AsyncClient(
+            timeout=httpx.Timeout(10),
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+        )
+
+    @property
+    def source(self) -> str:
+        # A stand-in or a self-hosted instance is not the public API
+        return f"{self.name}-{urlparse(self.api_url).netloc}"
+
+    async def _get(self, url: str, params: dict) -> httpx.Response:
+        try:
+            response = await self.client.get(url, params=params)
+            response.raise_for_status()
+            return response
+        except httpx.HTTPError as e:
+            raise ProviderError(f"{self.name} request failed: {e}") from e
+
+    def _max_age(self, response: httpx.Response) -> float:
+        match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+        return float(match.group(1)) if match else self.refresh_interval
+
+    async def geocode(self, query: str) -> Optional[Place]:
+        response = await self._get(f"{self.geocoding_url}/v1/search", {"name": query, "count": 1})
+        results = response.json().get("results") or []
+        if not results:
+            return None
+        return Place(results[0].get("name", query), results[0]["latitude"], results[0]["longitude"])
+
+    async def current(self, latitude: float, longitude: float) -> Observation:
+        return (await self.current_many([latitude], [longitude]))[0]
+
+    async def current_many(self, latitudes: list[float], longitudes: list[float]) -> list[Observation]:
+        # The API takes comma separated coordinates and answers with a list
+        chunks = [(latitudes[start:start + self.max_points], longitudes[start:start + self.max_points])
+                  for start in range(0, len(latitudes), self.max_points)]
+        results = await asyncio.gather(*(self._current_chunk(*chunk) for chunk in chunks))
+        return [observation for result in results for observation in result]
+
+    async def _current_chunk(self, latitudes: list[float], longitudes: list[float]) -> list[Observation]:
+        response = await self._get(f"{self.api_url}/v1/forecast", {
+            "latitude": ",".join(f"{latitude:.5f}" for latitude in latitudes),
+            "longitude": ",".join(f"{longitude:.5f}" for longitude in longitudes),
+            "current": "temperature_2m,relative_humidity_2m,weather_code,wind_speed_10m",
+            "temperature_unit": "fahrenheit",
+            "wind_speed_unit": "mph",
+            "timezone": "UTC",
+        })
+        body = response.json()
+        locations = body if isinstance(body, list) else [body]
+        if len(locations) != len(latitudes):
+            raise ProviderError(f"{self.name} returned {len(locations)} locations for {len(latitudes)} points")
+        max_age = self._max_age(response)
+        return [self._observation(location.get("current"), max_age) for location in locations]
+
+    async def hourly(self, latitude: float, longitude: float, start_hour: int, hours: int) -> HourlySeries:
+        response = await self._get(f"{self.api_url}/v1/forecast", {
+            "latitude": f"{latitude:.5f}",
+            "longitude": f"{longitude:.5f}",
+            "hourly": "temperature_2m,relative_humidity_2m,weather_code,wind_speed_10m",
+            "start_hour": _hour_string(start_hour),
+            "end_hour": _hour_string(start_hour + hours - 1),
+            "temperature_unit": "fahrenheit",
+            "wind_speed_unit": "mph",
+            "timezone": "UTC",
+        })
+        hourly = response.json().get("hourly")
+        if not hourly or not hourly.get("time"):
+            raise ProviderError(f"{self.name} returned no hourly values")
+        first = datetime.fromisoformat(hourly["time"][0]).replace(tzinfo=timezone.utc)
+        # Missing values come back as null, which NumPy turns into NaN
+        return HourlySeries(int(first.timestamp() // 3600), {
+            name: np.array(hourly.get(field) or [None] * len(hourly["time"]), dtype=np.float64)
+            for name, field in _HOURLY_FIELDS.items()
+        })
+
+    def _observation(self, current: Optional[dict], max_age: float) -> Observation:
+        if not current:
+            raise ProviderError(f"{self.name} returned no current conditions")
+        return Observation(
+            temperature_f=current["temperature_2m"],
+            condition=condition_of(int(current["weather_code"])),
+            humidity=int(current["relative_humidity_2m"]),
+            wind_mph=current["wind_speed_10m"],
+            observed_at=current["time"],
+            max_age=max_age,
+        )
+
+    async def close(self):
+        await self.client.aclose()
+
+
+_HOURLY_FIELDS = {
+    "temperature_f": "temperature_2m",
+    "humidity": "relative_humidity_2m",
+    "wind_mph": "wind_speed_10m",
+    "weather_code": "weather_code",
+}
+
+
+def _hour_string(hour: int) -> str:
+    return datetime.fromtimestamp(hour * 3600, timezone.utc).strftime("%Y-%m-%dT%H:%M")
+
+
+def provider_from_env() -> WeatherProvider:
+    """Provider chosen by WEATHER_PROVIDER ("mock" or "open-meteo") and WEATHER_API_URL"""
+    name = os.environ.get("WEATHER_PROVIDER", "mock")
+    refresh_interval = float(os.environ.get("WEATHER_REFRESH_SECONDS", 900))
+    if name == "mock":
+        return MockProvider(refresh_interval)
+    if name == "open-meteo":
+        return OpenMeteoProvider(
+            os.environ.get("WEATHER_API_URL", "https://api.open-meteo.com"),
+            os.environ.get("WEATHER_GEOCODING_URL"),
+            refresh_interval,
+        )
+    raise ValueError(f"Unknown weather provider: {name}. Use 'mock' or 'open-meteo'.")
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Open-Meteo shaped answers computed from the coordinates, with a request counter"""
+
+    requests = 0
+    lock = threading.Lock()
+    max_age = 60
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with self.lock:
+            type(self).requests += 1
+        if url.path == "/v1/forecast" and "hourly" in query:
+            body = self._hourly(float(query["latitude"]), float(query["longitude"]),
+                                query["start_hour"], query["end_hour"])
+        elif url.path == "/v1/forecast":
+            points = list(zip(query["latitude"].split(","), query["longitude"].split(",")))
+            body = [self._forecast(float(latitude), float(longitude)) for latitude, longitude in points]
+            if len(body) == 1:
+                body = body[0]
+        elif url.path == "/v1/search":
+            name = query.get("name", "").strip().lower()
+            place = _PLACES.get(name)
+            body = {"results": [{"name": query["name"], "latitude": place[0], "longitude": place[1]}]} if place else {}
+        elif url.path == "/stats":
+            body = {"requests": self.requests}
+        else:
+            self.send_error(404)
+            return
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", f"max-age={self.max_age}")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _forecast(self, latitude: float, longitude: float) -> dict:
+        period = int(time.time() // self.max_age)
+        seed = math.sin(latitude * 12.9898 + longitude * 78.233 + period) * 43758.5453
+        noise = seed - math.floor(seed)
+        return {
+            "latitude": latitude,
+            "longitude": longitude,
+            "current": {
+                "time": datetime.fromtimestamp(period * self.max_age, timezone.utc).strftime("%Y-%m-%dT%H:%M"),
+                "temperature_2m": round(80 - 0.5 * abs(latitude) + 10 * noise, 1),
+                "relative_humidity_2m": int(30 + 60 * noise),
+                "weather_code": [0, 2, 45, 61, 71, 95][int(noise * 6)],
+                "wind_speed_10m": round(20 * noise, 1),
+            },
+        }
+
+    def _hourly(self, latitude: float, longitude: float, start: str, end: str) -> dict:
+        first = int(datetime.fromisoformat(start).replace(tzinfo=timezone.utc).timestamp() // 3600)
+        last = int(datetime.fromisoformat(end).replace(tzinfo=timezone.utc).timestamp() // 3600)
+        hours = range(first, last + 1)
+        noise = [math.sin(latitude * 12.9898 + longitude * 78.233 + hour) * 43758.5453 for hour in hours]
+        noise = [value - math.floor(value) for value in noise]
+        return {
+            "latitude": latitude,
+            "longitude": longitude,
+            "hourly": {
+                "time": [_hour_string(hour) for hour in hours],
+                "temperature_2m": [round(75 - 0.5 * abs(latitude) + 10 * math.sin(hour / 24 * 2 * math.pi)
+                                         + 5 * value, 1) for hour, value in zip(hours, noise)],
+                "relative_humidity_2m": [int(30 + 60 * value) for value in noise],
+                "weather_code": [[0, 2, 45, 61, 71, 95][int(value * 6)] for value in noise],
+                "wind_speed_10m": [round(20 * value, 1) for value in noise],
+            },
+        }
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_stand_in(host: str = "127.0.0.1", port: int = 8080):
+    """Run a local stand-in of the Open-Meteo forecast and geocoding APIs"""
+    server = ThreadingHTTPServer((host, port), _StandInHandler)
+    print(f"Open-Meteo stand-in listening on http://{host}:{port} (request count at /stats)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        run_stand_in(port=int(sys.argv[2]) if len(sys.argv) > 2 else 8080)
+    else:
+        print("Usage: python providers.py serve [port]")
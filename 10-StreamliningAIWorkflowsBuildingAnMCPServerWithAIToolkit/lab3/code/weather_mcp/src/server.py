@@ -1,26 +1,127 @@
 import json
-import random
+import os
+import time
+from urllib.parse import unquote
 from mcp.server.fastmcp import FastMCP
 
+from live_weather import WeatherRefresher
+from providers import ProviderError, provider_from_env
+from subscriptions import ResourceSubscriptions
+from timeseries import AGGREGATES, ForecastStore
+from weather_service import UnknownLocation, WeatherService
+
 # Initialize FastMCP server
 server = FastMCP("weather_mcp")
 
+# Weather of nearby locations is cached per geohash cell until the provider refreshes it
+weather_service = WeatherService(
+    provider_from_env(),
+    precision=int(os.environ.get("WEATHER_GEOHASH_PRECISION", 5)),
+    forecasts=ForecastStore(retention_hours=int(os.environ.get("WEATHER_HISTORY_HOURS", 24 * 30))),
+)
+
+# Clients can subscribe to weather://{location}, one refresher per location pushes changes
+subscriptions = ResourceSubscriptions()
+subscriptions.install(server)
+weather_refresher = WeatherRefresher(
+    weather_service,
+    subscriptions,
+    min_interval=float(os.environ.get("WEATHER_MIN_REFRESH_SECONDS", 30)),
+)
+
 @server.tool()
 async def get_weather(location: str) -> str:
     """Get weather for a location.
 
     Args:
         location: Location to get weather for, e.g., city name, state, or coordinates
-    
+
     """
     if not location:
         return "Location is required."
-    
-    # mock weather data
-    conditions = [ "Sunny", "Rainy", "Cloudy", "Snowy" ]
-    weather = {
-        "location": location,
-        "temperature": f"{random.randint(10, 90)}°F",
-        "condition": random.choice(conditions),
-    }
+
+    try:
+        weather = await weather_service.weather(location)
+    except UnknownLocation as e:
+        return str(e)
+    except ProviderError as e:
+        return f"Weather provider error: {e}"
+    return json.dumps(weather, ensure_ascii=False)
+
+@server.tool()
+async def get_weather_batch(locations: list[str]) -> str:
+    """Get weather for many locations at once.
+
+    Locations in the same geohash cell share one lookup, and all cells that are
+    not cached are fetched from the provider together.
+
+    Args:
+        locations: Locations to get weather for, e.g., city names or coordinates
+
+    """
+    if not locations:
+        return json.dumps({"success": False, "error": "At least one location is required."})
+
+    hits, misses = weather_service.stats["hits"], weather_service.stats["misses"]
+    results = await weather_service.weather_many(locations)
+    return json.dumps({
+        "success": True,
+        "count": len(results),
+        "cells": len({result["cell"] for result in results if "cell" in result}),
+        "cache_hits": weather_service.stats["hits"] - hits,
+        "cache_misses": weather_service.stats["misses"] - misses,
+        "results": results,
+    }, ensure_ascii=False)
+
+@server.tool()
+async def get_forecast(
+    location: str,
+    hours: int = 48,
+    offset_hours: int = 0,
+    resolution_hours: int = 1,
+    aggregate: str = "mean",
+) -> str:
+    """Get hourly forecast or history for a location.
+
+    Args:
+        location: Location to get the forecast for, e.g., city name, state, or coordinates
+        hours: Number of hours, up to 384 (16 days)
+        offset_hours: First hour relative to the current hour, negative for history
+        resolution_hours: Hours combined into one value, e.g., 24 for daily values
+        aggregate: How combined hours are summarized: mean, min or max
+
+    """
+    if not location:
+        return json.dumps({"success": False, "error": "Location is required."})
+    if not 1 <= hours <= 16 * 24:
+        return json.dumps({"success": False, "error": "hours must be between 1 and 384."})
+    if offset_hours < -weather_service.forecasts.retention_hours or offset_hours + hours > 16 * 24:
+        return json.dumps({
+            "success": False,
+            "error": f"The range must lie between {weather_service.forecasts.retention_hours} hours ago "
+                     f"and 384 hours from now."
+        })
+    if not 1 <= resolution_hours <= hours:
+        return json.dumps({"success": False, "error": "resolution_hours must be between 1 and hours."})
+    if aggregate not in AGGREGATES:
+        return json.dumps({"success": False, "error": f"aggregate must be one of {', '.join(AGGREGATES)}."})
+
+    start_hour = int(time.time() // 3600) + offset_hours
+    try:
+        forecast = await weather_service.forecast(location, start_hour, hours, resolution_hours, aggregate)
+    except UnknownLocation as e:
+        return json.dumps({"success": False, "error": str(e)})
+    except ProviderError as e:
+        return json.dumps({"success": False, "error": f"Weather provider error: {e}"})
+    return json.dumps({"success": True, **forecast}, ensure_ascii=False)
+
+@server.resource("weather://{location}", mime_type="application/json")
+async def weather_resource(location: str) -> str:
+    """Current weather of a location. Subscribe to be notified when it changes."""
+    try:
+        weather = await weather_service.weather(unquote(location))
+    except ProviderError as e:
+        raise ValueError(f"Weather provider error: {e}")
+    except UnknownLocation as e:
+        raise ValueError(str(e))
     return json.dumps(weather, ensure_ascii=False)
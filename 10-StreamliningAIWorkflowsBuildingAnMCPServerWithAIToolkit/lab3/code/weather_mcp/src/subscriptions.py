@@ -0,0 +1,81 @@
+"""Resource subscriptions for FastMCP servers
+
+FastMCP does not track `resources/subscribe` requests, so this module keeps the
+subscribed sessions per URI and sends `notifications/resources/updated` to them.
+"""
+from typing import Any, Callable, Optional
+
+from mcp.server.fastmcp import FastMCP
+from mcp.server.session import ServerSession
+
+
+class ResourceSubscriptions:
+    """Sessions subscribed to each resource URI"""
+
+    def __init__(self, on_subscribe: Optional[Callable[[str], None]] = None,
+                 on_unsubscribe: Optional[Callable[[str], None]] = None):
+        """
+        Args:
+            on_subscribe: Called when a URI gets its first subscriber
+            on_unsubscribe: Called when a URI loses its last subscriber
+        """
+        self._sessions: dict[str, set[ServerSession]] = {}
+        self.on_subscribe = on_subscribe
+        self.on_unsubscribe = on_unsubscribe
+
+    def install(self, server: FastMCP):
+        """Handle subscribe/unsubscribe requests and advertise the capability
+
+        Args:
+            server: Server whose resources can be subscribed to
+        """
+        lowlevel = server._mcp_server
+
+        @lowlevel.subscribe_resource()
+        async def subscribe(uri):
+            self._add(str(uri), lowlevel.request_context.session)
+
+        @lowlevel.unsubscribe_resource()
+        async def unsubscribe(uri):
+            self._discard(str(uri), lowlevel.request_context.session)
+
+        get_capabilities = lowlevel.get_capabilities
+
+        def get_capabilities_with_subscribe(*args: Any, **kwargs: Any):
+            capabilities = get_capabilities(*args, **kwargs)
+            if capabilities.resources is not None:
+                capabilities.resources.subscribe = True
+            return capabilities
+
+        lowlevel.get_capabilities = get_capabilities_with_subscribe
+
+    def _add(self, uri: str, session: ServerSession):
+        first = not self._sessions.get(uri)
+        self._sessions.setdefault(uri, set()).add(session)
+        if first and self.on_subscribe is not None:
+            self.on_subscribe(uri)
+
+    def _discard(self, uri: str, session: ServerSession):
+        sessions = self._sessions.get(uri)
+        if sessions is None:
+            return
+        sessions.discard(session)
+        if not sessions:
+            del self._sessions[uri]
+            if self.on_unsubscribe is not None:
+                self.on_unsubscribe(uri)
+
+    def subscribed(self, uri: str) -> bool:
+        return bool(self._sessions.get(uri))
+
+    async def notify(self, uri: str):
+        """Tell every subscribed session that a resource changed, dropping closed sessions
+
+        Args:
+            uri: URI of the changed resource
+        """
+        for session in list(self._sessions.get(uri, ())):
+            try:
+                await session.send_resource_updated(uri)
+            except Exception:
+                self._discard(uri, session)
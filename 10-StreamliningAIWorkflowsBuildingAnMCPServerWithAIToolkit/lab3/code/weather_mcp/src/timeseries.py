@@ -0,0 +1,292 @@
+"""Hourly forecast and history store
+
+Values are kept per geohash cell as one column per metric, stored as small
+scaled integers: a location-hour of all metrics takes 6 bytes, plus one byte
+that flags hours stored as a forecast. Each provider has a folder of cells, each
+cell is a folder of segment files, the newest one is current:
+
+| Offset | Content |
+| ------ | ------- |
+| 0 | Header: magic `WXTS`, version, metric count, first hour, hour count, fetch time |
+| 32 | Columns in `METRICS` order, `hours` values each |
+| 32 + 6 * hours | Forecast flags, 1 where the hour had not passed when it was fetched |
+
+Hours are counted since the Unix epoch in UTC. Segments are read with
+`numpy.memmap`, so a query touches only the pages of the hours it asks for.
+Merging new data writes a new segment file instead of replacing the mapped one,
+which Windows does not allow. Older files are deleted once nothing maps them.
+"""
+import os
+import re
+import struct
+import tempfile
+import time
+import warnings
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from providers import HourlySeries
+
+# name: (stored type, scale, missing value), ordered so every column starts aligned
+METRICS = {
+    "temperature_f": (np.dtype("<i2"), 10, -32768),
+    "wind_mph": (np.dtype("<u2"), 10, 65535),
+    "humidity": (np.dtype("u1"), 1, 255),
+    "weather_code": (np.dtype("u1"), 1, 255),
+}
+
+_HEADER = struct.Struct("<4sHHqqd")
+_MAGIC = b"WXTS"
+_VERSION = 2
+
+AGGREGATES = ("mean", "min", "max")
+
+
+class Segment:
+    """Hourly columns of one cell, in memory or memory-mapped from its file"""
+
+    def __init__(self, start_hour: int, columns: dict[str, np.ndarray], forecast: np.ndarray, fetched_at: float):
+        self.start_hour = start_hour
+        self.columns = columns
+        self.forecast = forecast
+        self.fetched_at = fetched_at
+
+    @property
+    def hours(self) -> int:
+        return len(self.columns["temperature_f"])
+
+    @property
+    def end_hour(self) -> int:
+        return self.start_hour + self.hours
+
+    def covers(self, start_hour: int, end_hour: int) -> bool:
+        return self.start_hour <= start_hour and end_hour <= self.end_hour
+
+    def has_forecasts(self, start_hour: int, end_hour: int) -> bool:
+        """Whether any hour of the range was stored as a forecast"""
+        start = max(start_hour, self.start_hour) - self.start_hour
+        end = min(end_hour, self.end_hour) - self.start_hour
+        return start < end and bool(self.forecast[start:end].any())
+
+    @classmethod
+    def empty(cls) -> "Segment":
+        return cls(0, {name: np.zeros(0, dtype) for name, (dtype, _, _) in METRICS.items()}, np.zeros(0, "u1"), 0.0)
+
+    @classmethod
+    def open(cls, path: Path) -> Optional["Segment"]:
+        """Memory-map a segment file, None if it is missing or not a segment"""
+        try:
+            with open(path, "rb") as file:
+                magic, version, count, start_hour, hours, fetched_at = _HEADER.unpack(file.read(_HEADER.size))
+            if magic != _MAGIC or version != _VERSION or count != len(METRICS):
+                return None
+            if hours == 0:
+                return cls.empty()
+            columns = {}
+            offset = _HEADER.size
+            for name, (dtype, _, _) in METRICS.items():
+                columns[name] = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(hours,))
+                offset += hours * dtype.itemsize
+            forecast = np.memmap(path, dtype="u1", mode="r", offset=offset, shape=(hours,))
+        except (OSError, ValueError, struct.error):
+            # Deleted or cut short by another process since it was listed
+            return None
+        return cls(start_hour, columns, forecast, fetched_at)
+
+    def write(self, path: Path):
+        """Write the segment next to the path, then move it there; the path must not be mapped"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(_HEADER.pack(_MAGIC, _VERSION, len(METRICS), self.start_hour, self.hours,
+                                        self.fetched_at))
+                for name in METRICS:
+                    file.write(np.ascontiguousarray(self.columns[name]).tobytes())
+                file.write(np.ascontiguousarray(self.forecast).tobytes())
+            os.replace(temp, path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+    def merge(self, series: HourlySeries, fetched_at: float, keep_from: int) -> "Segment":
+        """New segment with the series written over this one, dropping hours before keep_from"""
+        start = max(keep_from, min(self.start_hour if self.hours else series.start_hour, series.start_hour))
+        end = max(self.end_hour, series.start_hour + series.hours)
+        columns = {}
+        for name, (dtype, scale, missing) in METRICS.items():
+            column = np.full(max(0, end - start), missing, dtype=dtype)
+            if self.hours:
+                _copy_range(column, start, np.asarray(self.columns[name]), self.start_hour)
+            values = series.columns.get(name)
+            if values is not None:
+                stored = _to_stored(np.asarray(values, dtype=np.float64), dtype, scale, missing)
+                # Hours the provider left empty keep what was stored before
+                mask = stored != missing
+                merged = np.full(len(stored), missing, dtype=dtype)
+                _copy_range(merged, series.start_hour, column, start)
+                merged[mask] = stored[mask]
+                _copy_range(column, start, merged, series.start_hour)
+            columns[name] = column
+        # Every hour of the series is now what the provider said at fetch time, a forecast
+        # unless the hour had passed, even where it left values empty
+        forecast = np.zeros(max(0, end - start), dtype="u1")
+        if self.hours:
+            _copy_range(forecast, start, np.asarray(self.forecast), self.start_hour)
+        fetched = np.arange(series.start_hour, series.start_hour + series.hours) >= int(fetched_at // 3600)
+        _copy_range(forecast, start, fetched.astype("u1"), series.start_hour)
+        return Segment(start, columns, forecast, fetched_at)
+
+    def values(self, name: str, start_hour: int, hours: int) -> np.ndarray:
+        """Values of one metric as floats, NaN outside the segment or where missing"""
+        dtype, scale, missing = METRICS[name]
+        result = np.full(hours, np.nan)
+        if not self.hours:
+            return result
+        stored = np.full(hours, missing, dtype=dtype)
+        _copy_range(stored, start_hour, self.columns[name], self.start_hour)
+        present = stored != missing
+        result[present] = stored[present] / scale
+        return result
+
+
+def _copy_range(target: np.ndarray, target_start: int, source: np.ndarray, source_start: int):
+    """Copy the hours both arrays have, each array starting at its own hour"""
+    start = max(target_start, source_start)
+    end = min(target_start + len(target), source_start + len(source))
+    if start < end:
+        target[start - target_start:end - target_start] = source[start - source_start:end - source_start]
+
+
+def _to_stored(values: np.ndarray, dtype: np.dtype, scale: int, missing: int) -> np.ndarray:
+    info = np.iinfo(dtype)
+    # The missing marker is one end of the type's range, real values stay clear of it
+    low, high = (info.min + 1, info.max) if missing == info.min else (info.min, info.max - 1)
+    scaled = np.round(values * scale)
+    stored = np.clip(np.nan_to_num(scaled, nan=missing), low, high).astype(dtype)
+    stored[np.isnan(scaled)] = missing
+    return stored
+
+
+def downsample(values: np.ndarray, resolution: int, aggregate: str) -> np.ndarray:
+    """Combine every `resolution` hours into one value, ignoring missing hours
+
+    Args:
+        values: Hourly values, NaN where missing
+        resolution: Hours per output value
+        aggregate: "mean", "min" or "max"
+    """
+    if resolution == 1:
+        return values
+    padded = np.full(-(-len(values) // resolution) * resolution, np.nan)
+    padded[:len(values)] = values
+    bins = padded.reshape(-1, resolution)
+    # Bins without any value are NaN, which is what they should be
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return {"mean": np.nanmean, "min": np.nanmin, "max": np.nanmax}[aggregate](bins, axis=1)
+
+
+class ForecastStore:
+    """Segment files of many cells and providers, with the recently used ones kept mapped
+
+    Cells are kept apart per provider source, values of one provider are never
+    answered for another.
+    """
+
+    def __init__(self, directory: Optional[str] = None, retention_hours: int = 24 * 30, max_open: int = 256):
+        """
+        Args:
+            directory: Where the segment files are, one folder per provider source and cell,
+                defaults to $WEATHER_FORECAST_DIR or ~/.cache/weather_mcp/forecast
+            retention_hours: History kept before the current hour
+            max_open: Number of segments kept memory-mapped
+        """
+        self.directory = Path(directory or os.environ.get("WEATHER_FORECAST_DIR")
+                              or Path.home() / ".cache" / "weather_mcp" / "forecast")
+        self.retention_hours = retention_hours
+        self.max_open = max_open
+        self._open: OrderedDict[str, Segment] = OrderedDict()
+
+    @staticmethod
+    def _key(source: str, cell: str) -> str:
+        # Sources name a provider and its host, which may hold characters folder names cannot
+        return f"{re.sub(r'[^A-Za-z0-9._-]', '_', source)}/{cell}"
+
+    def _files(self, key: str) -> list[Path]:
+        """Segment files of a cell, newest first"""
+        try:
+            names = [entry.name for entry in os.scandir(self.directory / key)
+                     if entry.name.endswith(".seg") and not entry.name.startswith(".")]
+        except OSError:
+            return []
+        return [self.directory / key / name for name in sorted(names, reverse=True)]
+
+    def _new_path(self, key: str) -> Path:
+        # Names sort by creation time and never collide between the processes sharing the folder
+        return self.directory / key / f"{time.time_ns():020d}-{os.getpid()}.seg"
+
+    def get(self, source: str, cell: str) -> Segment:
+        """Segment of a cell, empty if nothing is stored for it
+
+        Args:
+            source: Provider the values come from, see `WeatherProvider.source`
+            cell: Geohash cell
+        """
+        key = self._key(source, cell)
+        segment = self._open.get(key)
+        if segment is not None:
+            self._open.move_to_end(key)
+            return segment
+        segment = next(filter(None, map(Segment.open, self._files(key))), None) or Segment.empty()
+        self._remember(key, segment)
+        return segment
+
+    def put(self, source: str, cell: str, series: HourlySeries) -> Segment:
+        """Merge newly fetched hours into a cell's segment and save it as a new file"""
+        key = self._key(source, cell)
+        keep_from = int(time.time() // 3600) - self.retention_hours
+        segment = self.get(source, cell).merge(series, time.time(), keep_from)
+        path = self._new_path(key)
+        segment.write(path)
+        self._open.pop(key, None)
+        segment = Segment.open(path) or segment
+        self._remember(key, segment)
+        self._delete_old(key, path)
+        return segment
+
+    def _delete_old(self, key: str, current: Path):
+        for path in self._files(key):
+            if path.name >= current.name:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                # Still mapped by a query in flight on Windows, a later put deletes it
+                pass
+
+    def _remember(self, key: str, segment: Segment):
+        self._open[key] = segment
+        self._open.move_to_end(key)
+        while len(self._open) > self.max_open:
+            self._open.popitem(last=False)
+
+    def query(self, segment: Segment, start_hour: int, hours: int, resolution: int = 1,
+              aggregate: str = "mean") -> dict[str, np.ndarray]:
+        """Values of every metric over a range, downsampled
+
+        Args:
+            segment: Segment of the cell
+            start_hour: First hour, in hours since the Unix epoch
+            hours: Number of hours
+            resolution: Hours per returned value
+            aggregate: How hours are combined, the weather code always takes the most severe one
+        """
+        return {
+            name: downsample(segment.values(name, start_hour, hours), resolution,
+                             "max" if name == "weather_code" else aggregate)
+            for name in METRICS
+        }
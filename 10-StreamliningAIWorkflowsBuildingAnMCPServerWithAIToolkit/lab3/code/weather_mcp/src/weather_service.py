@@ -0,0 +1,328 @@
+"""Cached weather lookups
+
+Locations are resolved to coordinates once, then rounded to a geohash cell.
+The weather of a cell is fetched at the cell center and cached until the
+provider publishes new data, so every query that falls in the same cell shares
+one entry. Concurrent misses of a cell wait for a single provider request.
+
+`forecast` answers hourly range queries from a `ForecastStore`, fetching the
+hours it does not have, or whose forecast is older than the provider's refresh
+interval, once per cell. Hours stored as forecasts are fetched again once they
+have passed, and values of one provider are never answered for another.
+
+`weather_many` answers a batch of locations: names are geocoded once each,
+points are rounded to cells with NumPy, and all cells that are not cached
+are fetched from the provider in one batch.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+
+import geohash
+from providers import Observation, Place, WeatherProvider, condition_of, parse_coordinates
+from timeseries import ForecastStore, Segment
+
+
+class UnknownLocation(Exception):
+    """The location could not be resolved to coordinates"""
+
+
+@dataclass
+class CellWeather:
+    """Cached weather of one geohash cell"""
+    cell: str
+    latitude: float
+    longitude: float
+    observation: Observation
+    expires_at: float
+
+
+class WeatherService:
+    """Geohash keyed TTL cache with single-flight fetches in front of a provider"""
+
+    def __init__(self, provider: WeatherProvider, precision: int = 5, max_cells: int = 10_000,
+                 max_places: int = 10_000, forecasts: Optional[ForecastStore] = None):
+        """
+        Args:
+            provider: Where the weather comes from
+            precision: Geohash length of the cells, 5 is about 5 km x 5 km
+            max_cells: Number of cells kept, the least recently used are evicted first
+            max_places: Number of resolved place names kept
+            forecasts: Store of hourly values, a default ForecastStore otherwise
+        """
+        self.provider = provider
+        self.precision = precision
+        self.max_cells = max_cells
+        self.max_places = max_places
+        self._cells: OrderedDict[str, CellWeather] = OrderedDict()
+        self._places: OrderedDict[str, Place] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._fetches: set[asyncio.Task] = set()
+        self.forecasts = forecasts or ForecastStore()
+        self._hourly_inflight: dict[str, asyncio.Task] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "fetches": 0, "cells_fetched": 0, "geocodes": 0,
+                      "hourly_fetches": 0}
+
+    async def resolve(self, location: str) -> Place:
+        """Coordinates of a location: "latitude, longitude" or a place name"""
+        place = parse_coordinates(location)
+        if place is not None:
+            return place
+        key = location.strip().lower()
+        place = self._places.get(key)
+        if place is not None:
+            self._places.move_to_end(key)
+            return place
+        self.stats["geocodes"] += 1
+        place = await self.provider.geocode(location)
+        if place is None:
+            raise UnknownLocation(f"Unknown location: {location}")
+        self._places[key] = place
+        while len(self._places) > self.max_places:
+            self._places.popitem(last=False)
+        return place
+
+    def cached(self, cell: str) -> Optional[CellWeather]:
+        """Weather of a cell if it is cached and still fresh"""
+        entry = self._cells.get(cell)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            del self._cells[cell]
+            return None
+        self._cells.move_to_end(cell)
+        return entry
+
+    def store(self, cell: str, observation: Observation) -> CellWeather:
+        """Cache the weather of a cell until the provider's next refresh"""
+        latitude, longitude = geohash.decode(cell)
+        entry = CellWeather(cell, latitude, longitude, observation,
+                            time.monotonic() + max(1.0, observation.max_age))
+        self._cells[cell] = entry
+        self._cells.move_to_end(cell)
+        while len(self._cells) > self.max_cells:
+            self._cells.popitem(last=False)
+        return entry
+
+    async def cell_weather(self, cell: str) -> tuple[CellWeather, bool]:
+        """Weather of a cell and whether it came from the cache"""
+        entry = self.cached(cell)
+        if entry is not None:
+            self.stats["hits"] += 1
+            return entry, True
+        future = self._inflight.get(cell)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(future), True
+
+        self.stats["misses"] += 1
+        return await asyncio.shield(self._start_fetch([cell])[cell]), False
+
+    def _start_fetch(self, cells: list[str]) -> dict[str, asyncio.Future]:
+        """Fetch cells in one provider request, returns a future per cell
+
+        The fetch runs in its own task, so a cancelled caller does not fail the
+        others waiting for it.
+        """
+        loop = asyncio.get_running_loop()
+        futures = {cell: loop.create_future() for cell in cells}
+        self._inflight.update(futures)
+
+        async def fetch():
+            try:
+                latitudes, longitudes = geohash.decode_many(cells)
+                self.stats["fetches"] += 1
+                self.stats["cells_fetched"] += len(cells)
+                observations = await self.provider.current_many(latitudes.tolist(), longitudes.tolist())
+                for cell, observation in zip(cells, observations):
+                    futures[cell].set_result(self.store(cell, observation))
+            except BaseException as e:
+                for future in futures.values():
+                    if not future.done():
+                        future.set_exception(e)
+                        # Nobody may be waiting any more, do not warn about it
+                        future.exception()
+                if not isinstance(e, Exception):
+                    raise
+            finally:
+                for cell, future in futures.items():
+                    if self._inflight.get(cell) is future:
+                        del self._inflight[cell]
+
+        task = loop.create_task(fetch())
+        self._fetches.add(task)
+        task.add_done_callback(self._fetches.discard)
+        return futures
+
+    async def lookup(self, location: str) -> tuple[Place, CellWeather, bool]:
+        """Place, cell weather and whether it was cached, raises UnknownLocation or ProviderError"""
+        place = await self.resolve(location)
+        cell = geohash.encode(place.latitude, place.longitude, self.precision)
+        entry, cached = await self.cell_weather(cell)
+        return place, entry, cached
+
+    async def weather(self, location: str) -> dict:
+        """Current weather of a location, raises UnknownLocation or ProviderError"""
+        return self.describe(location, *await self.lookup(location))
+
+    async def weather_many(self, locations: list[str]) -> list[dict]:
+        """Current weather of many locations, in order
+
+        A location that fails gets {"location": ..., "error": ...} instead of
+        failing the whole batch.
+        """
+        results: list[Optional[dict]] = [None] * len(locations)
+        places: list[Optional[Place]] = [None] * len(locations)
+
+        # Coordinates are parsed right away, each distinct name is geocoded once
+        names: dict[str, list[int]] = {}
+        for index, location in enumerate(locations):
+            if not location.strip():
+                results[index] = {"location": location, "error": "Location is required."}
+                continue
+            places[index] = parse_coordinates(location)
+            if places[index] is None:
+                names.setdefault(location.strip().lower(), []).append(index)
+        resolved = await asyncio.gather(
+            *(self.resolve(locations[indexes[0]]) for indexes in names.values()), return_exceptions=True)
+        for indexes, place in zip(names.values(), resolved):
+            for index in indexes:
+                if isinstance(place, BaseException):
+                    results[index] = {"location": locations[index], "error": _error_message(place)}
+                else:
+                    places[index] = place
+
+        pending = [index for index in range(len(locations)) if places[index] is not None]
+        cells = geohash.encode_many([places[index].latitude for index in pending],
+                                    [places[index].longitude for index in pending], self.precision)
+
+        # Cached cells answer right away, the rest share in-flight fetches or one new batch
+        waiting: dict[str, asyncio.Future] = {}
+        missing: dict[str, None] = {}
+        entries: dict[str, tuple[CellWeather, bool]] = {}
+        for cell in cells:
+            if cell in entries or cell in waiting or cell in missing:
+                self.stats["hits"] += 1
+                continue
+            entry = self.cached(cell)
+            if entry is not None:
+                self.stats["hits"] += 1
+                entries[cell] = entry, True
+            elif cell in self._inflight:
+                self.stats["coalesced"] += 1
+                waiting[cell] = self._inflight[cell]
+            else:
+                self.stats["misses"] += 1
+                missing[cell] = None
+        if missing:
+            waiting.update(self._start_fetch(list(missing)))
+        fetched = await asyncio.gather(*(asyncio.shield(future) for future in waiting.values()),
+                                       return_exceptions=True)
+        for cell, entry in zip(waiting, fetched):
+            entries[cell] = entry, cell not in missing
+
+        for index, cell in zip(pending, cells):
+            entry, cached = entries[cell]
+            if isinstance(entry, BaseException):
+                results[index] = {"location": locations[index], "error": _error_message(entry)}
+            else:
+                results[index] = self.describe(locations[index], places[index], entry, cached)
+        return results
+
+    async def forecast(self, location: str, start_hour: int, hours: int, resolution: int = 1,
+                       aggregate: str = "mean") -> dict:
+        """Hourly values of a location over a range, raises UnknownLocation or ProviderError
+
+        Args:
+            location: Place name or "latitude, longitude"
+            start_hour: First hour, in hours since the Unix epoch
+            hours: Number of hours
+            resolution: Hours per returned value
+            aggregate: "mean", "min" or "max" of the hours combined into one value
+        """
+        place = await self.resolve(location)
+        cell = geohash.encode(place.latitude, place.longitude, self.precision)
+        segment, cached = await self._segment(cell, start_hour, start_hour + hours)
+        columns = self.forecasts.query(segment, start_hour, hours, resolution, aggregate)
+        return {
+            "location": location,
+            "latitude": place.latitude,
+            "longitude": place.longitude,
+            "cell": cell,
+            "provider": self.provider.name,
+            "resolution_hours": resolution,
+            "aggregate": aggregate,
+            "cached": cached,
+            "times": [datetime.fromtimestamp(hour * 3600, timezone.utc).isoformat()
+                      for hour in range(start_hour, start_hour + hours, resolution)],
+            "temperature_f": _rounded(columns["temperature_f"]),
+            "humidity": _rounded(columns["humidity"]),
+            "wind_mph": _rounded(columns["wind_mph"]),
+            "condition": [None if np.isnan(code) else condition_of(int(code)) for code in columns["weather_code"]],
+        }
+
+    def _fresh(self, segment: Segment, start_hour: int, end_hour: int) -> bool:
+        if not segment.covers(start_hour, end_hour):
+            return False
+        if time.time() - segment.fetched_at < self.provider.refresh_interval:
+            return True
+        # Past hours fetched once they had passed do not change. Forecasts do when the provider
+        # publishes a new run, and hours stored as forecasts are fetched again once they passed.
+        return end_hour <= time.time() // 3600 and not segment.has_forecasts(start_hour, end_hour)
+
+    async def _segment(self, cell: str, start_hour: int, end_hour: int) -> tuple[Segment, bool]:
+        """Segment of a cell that has a fresh range, and whether it was already stored"""
+        while True:
+            segment = self.forecasts.get(self.provider.source, cell)
+            if self._fresh(segment, start_hour, end_hour):
+                return segment, True
+            task = self._hourly_inflight.get(cell)
+            if task is None:
+                break
+            # Another query is fetching this cell, it may bring the hours asked for
+            self.stats["coalesced"] += 1
+            await asyncio.shield(task)
+
+        # The next two days come along, so the common queries find them stored
+        now_hour = int(time.time() // 3600)
+        task = asyncio.ensure_future(self._fetch_hourly(cell, min(start_hour, now_hour), max(end_hour, now_hour + 48)))
+        self._hourly_inflight[cell] = task
+        task.add_done_callback(lambda _: self._hourly_inflight.pop(cell, None))
+        return await asyncio.shield(task), False
+
+    async def _fetch_hourly(self, cell: str, start_hour: int, end_hour: int) -> Segment:
+        latitude, longitude = geohash.decode(cell)
+        self.stats["hourly_fetches"] += 1
+        series = await self.provider.hourly(latitude, longitude, start_hour, end_hour - start_hour)
+        return self.forecasts.put(self.provider.source, cell, series)
+
+    def describe(self, location: str, place: Place, entry: CellWeather, cached: bool) -> dict:
+        observation = entry.observation
+        return {
+            "location": location,
+            "temperature": f"{round(observation.temperature_f)}°F",
+            "condition": observation.condition,
+            "humidity": observation.humidity,
+            "wind_mph": observation.wind_mph,
+            "observed_at": observation.observed_at,
+            "latitude": place.latitude,
+            "longitude": place.longitude,
+            "cell": entry.cell,
+            "provider": self.provider.name,
+            "cached": cached,
+        }
+
+
+def _error_message(error: BaseException) -> str:
+    if isinstance(error, UnknownLocation):
+        return str(error)
+    return f"Weather provider error: {error}"
+
+
+def _rounded(values: np.ndarray) -> list[Optional[float]]:
+    return [None if np.isnan(value) else round(value, 1) for value in values.tolist()]
@@ -0,0 +1,78 @@
+"""Streamable HTTP on several worker processes
+
+Every worker opens its own listening socket on the same port with
+SO_REUSEPORT, and the kernel spreads incoming connections over them, so one
+deployment uses every core without a load balancer in front. Workers share
+nothing, so the server runs stateless: each request stands on its own and can
+be answered by any worker.
+"""
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import socket
+import sys
+
+
+def reuse_port_supported() -> bool:
+    return hasattr(socket, "SO_REUSEPORT")
+
+
+def _listen(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve_worker(host: str, port: int, log_level: str, json_response: bool):
+    """Run one stateless streamable HTTP worker on a shared port"""
+    import uvicorn
+
+    from server import server
+
+    server.settings.stateless_http = True
+    server.settings.json_response = json_response
+    config = uvicorn.Config(server.streamable_http_app(), log_level=log_level.lower())
+    uvicorn.Server(config).run(sockets=[_listen(host, port)])
+
+
+def run_workers(host: str, port: int, workers: int, log_level: str = "INFO", json_response: bool = False):
+    """Start workers that share a port and wait for them, stopping all when one exits
+
+    Args:
+        host: Address to listen on
+        port: Port shared by the workers
+        workers: Number of worker processes
+        log_level: Log level of the workers
+        json_response: Answer with plain JSON instead of SSE streams
+    """
+    if not reuse_port_supported():
+        raise RuntimeError("SO_REUSEPORT is not available on this platform, use WORKERS=1")
+
+    processes = [
+        multiprocessing.Process(target=serve_worker, args=(host, port, log_level, json_response),
+                                name=f"weather_mcp-worker-{index}")
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    print(f"Serving streamable HTTP on http://{host}:{port} with {workers} workers", file=sys.stderr)
+
+    def stop(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        # A worker that dies takes the others down, so the deployment restarts as a whole
+        multiprocessing.connection.wait([process.sentinel for process in processes])
+    finally:
+        stop(None, None)
+        for process in processes:
+            process.join()
@@ -0,0 +1,433 @@
+"""Repository snapshots downloaded as archives
+
+When only the files of one ref are needed, downloading the archive GitHub
+serves for it is much cheaper than a clone: no history and no git objects.
+The archive is streamed over a pooled HTTP client and tarballs are extracted
+while they download, so the archive is never held in memory. Zip archives keep
+their index at the end, so they are spooled to a temporary file first.
+
+Every member is checked before it is written: absolute paths, `..` components
+and links that point outside the target folder are refused, and the download
+size, extracted size and number of files are limited. Files are never written
+through a link: links are only created once every file and folder is in place,
+and checked again once they all exist.
+
+Run `python archive.py serve <folder> [port]` for a local stand-in of an
+archive host. It serves `/archive.tar.gz` and `/archive.zip` built from the
+folder, and any file of the folder as is.
+"""
+import asyncio
+import io
+import os
+import posixpath
+import re
+import shutil
+import stat
+import sys
+import tarfile
+import tempfile
+import zipfile
+from dataclasses import dataclass
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+from clone_jobs import ReportFn
+
+ARCHIVE_FORMATS = {".tar.gz": "tar", ".tgz": "tar", ".tar.bz2": "tar", ".tar.xz": "tar", ".tar": "tar",
+                   ".zip": "zip"}
+
+_GITHUB_RE = re.compile(r"^(?:https?://|git@)github\.com[/:](?P<owner>[^/]+)/(?P<repo>[^/]+?)(?:\.git)?/?$")
+
+CHUNK_BYTES = 64 * 1024
+
+# New files only, never through a link; O_NOFOLLOW does not exist on Windows
+_OPEN_FLAGS = (os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_NOFOLLOW", 0) | getattr(os, "O_BINARY", 0))
+
+
+class ArchiveError(Exception):
+    """An archive could not be downloaded or was refused"""
+
+
+@dataclass
+class ArchiveLimits:
+    """Limits that protect the server from huge archives and archive bombs"""
+    # Bytes downloaded
+    max_download_bytes: int = 512 * 1024 ** 2
+    # Bytes written to disk after extraction
+    max_extracted_bytes: int = 2 * 1024 ** 3
+    # Files, folders and links created
+    max_members: int = 100_000
+
+
+def archive_url(repo_url: str, ref: Optional[str] = None) -> tuple[str, str]:
+    """Archive URL and format ("tar" or "zip") for a repository URL and ref
+
+    GitHub repository URLs are mapped to their codeload tarball, URLs that
+    already point at an archive are used as they are.
+
+    Args:
+        repo_url: URL of a GitHub repository or of an archive
+        ref: Branch, tag or commit, defaults to the default branch
+    """
+    path = repo_url.split("?", 1)[0].lower()
+    for extension, archive_format in ARCHIVE_FORMATS.items():
+        if path.endswith(extension):
+            return repo_url, archive_format
+    match = _GITHUB_RE.match(repo_url.strip())
+    if match:
+        return f"https://codeload.github.com/{match['owner']}/{match['repo']}/tar.gz/{ref or 'HEAD'}", "tar"
+    raise ArchiveError(f"Cannot download an archive of {repo_url}. Use a GitHub repository URL or an archive URL.")
+
+
+class _Extractor:
+    """Writes archive members below a target folder, refusing unsafe ones"""
+
+    def __init__(self, target: Path, limits: ArchiveLimits):
+        self.target = target
+        self.root = os.path.realpath(target)
+        self.limits = limits
+        self.members = 0
+        self.extracted_bytes = 0
+        self.skipped: list[str] = []
+        self._prefix: Optional[str] = None
+        # Links are created after everything else, see `finish`
+        self._links: list[tuple[str, str]] = []
+
+    def _relative(self, name: str, is_dir: bool = False) -> Optional[str]:
+        """Safe relative path of a member, without the single top folder of repository archives"""
+        name = name.replace("\\", "/")
+        if name.startswith("/") or re.match(r"^[A-Za-z]:", name):
+            raise ArchiveError(f"Refusing absolute path in archive: {name}")
+        parts = [part for part in name.split("/") if part not in ("", ".")]
+        if ".." in parts:
+            raise ArchiveError(f"Refusing path outside of the target folder: {name}")
+        if not parts:
+            return None
+        # GitHub archives put everything below "<repo>-<ref>/", which is dropped
+        if self._prefix is None:
+            self._prefix = parts[0] if len(parts) > 1 or is_dir else ""
+        if self._prefix and parts[0] == self._prefix:
+            parts = parts[1:]
+        return "/".join(parts) or None
+
+    def _inside(self, path: str) -> bool:
+        return path == self.root or path.startswith(self.root + os.sep)
+
+    def _path(self, relative: str) -> str:
+        path = os.path.join(self.root, *relative.split("/"))
+        # A link must never redirect a member outside of the target
+        if os.path.islink(path):
+            raise ArchiveError(f"Refusing to write through a link: {relative}")
+        if not self._inside(os.path.realpath(os.path.dirname(path))) or not self._inside(os.path.realpath(path)):
+            raise ArchiveError(f"Refusing path outside of the target folder: {relative}")
+        return path
+
+    def _count(self):
+        self.members += 1
+        if self.members > self.limits.max_members:
+            raise ArchiveError(f"Archive has more than {self.limits.max_members} entries")
+
+    def add_dir(self, name: str):
+        relative = self._relative(name, is_dir=True)
+        if relative is None:
+            return
+        self._count()
+        os.makedirs(self._path(relative), exist_ok=True)
+
+    def add_file(self, name: str, source: io.BufferedIOBase, executable: bool = False):
+        relative = self._relative(name)
+        if relative is None:
+            return
+        self._count()
+        path = self._path(relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            fd = os.open(path, _OPEN_FLAGS, 0o666)
+        except FileExistsError:
+            raise ArchiveError(f"Refusing archive with the same file twice: {relative}") from None
+        with os.fdopen(fd, "wb") as file:
+            # The sizes in archive headers can lie, so the written bytes are counted
+            while chunk := source.read(CHUNK_BYTES):
+                self.extracted_bytes += len(chunk)
+                if self.extracted_bytes > self.limits.max_extracted_bytes:
+                    raise ArchiveError(f"Archive extracts to more than {self.limits.max_extracted_bytes} bytes")
+                file.write(chunk)
+        if executable:
+            os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    def add_symlink(self, name: str, link_target: str):
+        relative = self._relative(name)
+        if relative is None:
+            return
+        if os.path.isabs(link_target) or re.match(r"^[A-Za-z]:", link_target):
+            self.skipped.append(relative)
+            return
+        self._count()
+        self._links.append((relative, link_target))
+
+    def finish(self):
+        """Create the links, once no file or folder is written any more"""
+        created = []
+        for relative, link_target in self._links:
+            path = os.path.join(self.root, *relative.split("/"))
+            if os.path.lexists(path) or not self._inside(os.path.realpath(os.path.dirname(path))):
+                self.skipped.append(relative)
+                continue
+            if not self._inside(os.path.realpath(os.path.join(os.path.dirname(path), link_target))):
+                self.skipped.append(relative)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.symlink(link_target, path)
+            except OSError:
+                # Symbolic links need extra privileges on Windows
+                self.skipped.append(relative)
+                continue
+            created.append((relative, path))
+
+        # A link created later can redirect one created earlier, so every link is checked
+        # again until none resolves outside of the target
+        removed = True
+        while removed:
+            removed = False
+            for relative, path in list(created):
+                if not self._inside(os.path.realpath(path)):
+                    os.unlink(path)
+                    created.remove((relative, path))
+                    self.skipped.append(relative)
+                    removed = True
+
+    def extract_tar(self, fileobj):
+        # "r|*" reads the archive as a stream, without seeking, whatever its compression
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for member in archive:
+                if member.isdir():
+                    self.add_dir(member.name)
+                elif member.isfile():
+                    self.add_file(member.name, archive.extractfile(member), bool(member.mode & 0o111))
+                elif member.issym():
+                    self.add_symlink(member.name, member.linkname)
+                else:
+                    # Hard links, devices and fifos are never created
+                    relative = self._relative(member.name)
+                    if relative:
+                        self.skipped.append(relative)
+        self.finish()
+
+    def extract_zip(self, path: str):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    self.add_dir(info.filename)
+                else:
+                    mode = info.external_attr >> 16
+                    with archive.open(info) as source:
+                        self.add_file(info.filename, source, bool(mode & 0o111))
+        self.finish()
+
+
+class _ChunkReader(io.RawIOBase):
+    """Blocking file object over chunks that an event loop puts in an asyncio queue
+
+    Lets tarfile, which reads synchronously in a worker thread, consume the HTTP
+    stream while it is downloaded. The bounded queue holds back the download when
+    extraction is slower.
+    """
+
+    def __init__(self, queue: asyncio.Queue, loop: asyncio.AbstractEventLoop):
+        self._queue = queue
+        self._loop = loop
+        self._buffer = b""
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer and not self._eof:
+            chunk = asyncio.run_coroutine_threadsafe(self._queue.get(), self._loop).result()
+            if isinstance(chunk, BaseException):
+                raise chunk
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer = chunk
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+class ArchiveDownloader:
+    """Downloads and extracts archives over a shared, pooled HTTP client"""
+
+    def __init__(self, limits: Optional[ArchiveLimits] = None, client: Optional[httpx.AsyncClient] = None):
+        """
+        Args:
+            limits: Size limits, defaults to ArchiveLimits()
+            client: HTTP client to use, one with a connection pool is created on first use
+        """
+        self.limits = limits or ArchiveLimits()
+        self._client = client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=httpx.Timeout(30, read=120),
+                limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+                headers={"User-Agent": "github_mcp_server"},
+            )
+        return self._client
+
+    async def download(self, url: str, archive_format: str, target: Path, report: ReportFn) -> dict:
+        """Download an archive and extract it into a new folder
+
+        The files are extracted next to the target and moved into place once
+        everything succeeded, so a failed download leaves nothing behind.
+        Raises ArchiveError when the archive is refused or the download fails.
+
+        Args:
+            url: URL of the archive
+            archive_format: "tar" (any compression) or "zip"
+            target: Folder to create, must not exist
+            report: Awaitable callback for progress as (percent, phase, message, bytes received)
+        """
+        partial = target.with_name(f".{target.name}.partial")
+        shutil.rmtree(partial, ignore_errors=True)
+        partial.mkdir(parents=True)
+        extractor = _Extractor(partial, self.limits)
+        try:
+            async with self.client.stream("GET", url) as response:
+                if response.status_code != 200:
+                    raise ArchiveError(f"Archive download failed: HTTP {response.status_code} from {url}")
+                total = int(response.headers.get("Content-Length", 0)) or None
+                if total is not None and total > self.limits.max_download_bytes:
+                    raise ArchiveError(f"Archive is larger than {self.limits.max_download_bytes} bytes")
+                if archive_format == "zip":
+                    received = await self._spool_zip(response, total, extractor, report)
+                else:
+                    received = await self._stream_tar(response, total, extractor, report)
+            partial.rename(target)
+        except httpx.HTTPError as e:
+            raise ArchiveError(f"Archive download failed: {e}") from e
+        except (tarfile.TarError, zipfile.BadZipFile, EOFError) as e:
+            raise ArchiveError(f"Invalid archive: {e}") from e
+        finally:
+            shutil.rmtree(partial, ignore_errors=True)
+        await report(100, "Done", "Archive extracted", received)
+        return {
+            "files": extractor.members,
+            "bytes_downloaded": received,
+            "bytes_extracted": extractor.extracted_bytes,
+            "skipped": extractor.skipped,
+        }
+
+    async def _chunks(self, response: httpx.Response, total: Optional[int], report: ReportFn):
+        """Yield the response body, enforcing the download limit and reporting progress"""
+        received = 0
+        last_percent = -1
+        async for chunk in response.aiter_bytes(CHUNK_BYTES):
+            received += len(chunk)
+            if received > self.limits.max_download_bytes:
+                raise ArchiveError(f"Archive is larger than {self.limits.max_download_bytes} bytes")
+            percent = int(99 * received / total) if total else 0
+            if percent != last_percent:
+                last_percent = percent
+                await report(percent, "Downloading archive", f"Downloading archive: {received} bytes", received)
+            yield chunk
+
+    async def _stream_tar(self, response: httpx.Response, total: Optional[int], extractor: _Extractor,
+                          report: ReportFn) -> int:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=32)
+
+        def drain(_=None):
+            while not queue.empty():
+                queue.get_nowait()
+
+        extracting = asyncio.ensure_future(asyncio.to_thread(extractor.extract_tar, _ChunkReader(queue, loop)))
+        # A finished extraction must never leave the download blocked on a full queue
+        extracting.add_done_callback(drain)
+        received = 0
+        try:
+            async for chunk in self._chunks(response, total, report):
+                received += len(chunk)
+                if extracting.done():
+                    break
+                await queue.put(chunk)
+            else:
+                await queue.put(None)
+            await extracting
+        except BaseException as e:
+            if not extracting.done():
+                # Wake the extraction thread with the error and wait for it to stop
+                drain()
+                queue.put_nowait(e if isinstance(e, Exception) else ArchiveError("Download cancelled"))
+                await asyncio.gather(extracting, return_exceptions=True)
+            raise
+        return received
+
+    async def _spool_zip(self, response: httpx.Response, total: Optional[int], extractor: _Extractor,
+                         report: ReportFn) -> int:
+        received = 0
+        spool = tempfile.NamedTemporaryFile(suffix=".zip", dir=extractor.target.parent, delete=False)
+        try:
+            with spool:
+                async for chunk in self._chunks(response, total, report):
+                    received += len(chunk)
+                    spool.write(chunk)
+            await report(99, "Extracting archive", "Extracting archive", received)
+            await asyncio.to_thread(extractor.extract_zip, spool.name)
+        finally:
+            os.unlink(spool.name)
+        return received
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class _StandInHandler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        name = posixpath.basename(self.path.split("?", 1)[0])
+        if name not in ("archive.tar.gz", "archive.zip"):
+            return super().do_GET()
+        folder = Path(self.directory)
+        buffer = io.BytesIO()
+        if name == "archive.zip":
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+                for path in sorted(folder.rglob("*")):
+                    archive.write(path, f"{folder.name}-main/{path.relative_to(folder).as_posix()}")
+        else:
+            with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+                archive.add(folder, f"{folder.name}-main")
+        body = buffer.getvalue()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_stand_in(folder: str, host: str = "127.0.0.1", port: int = 8765):
+    """Serve archives of a folder, and the files of the folder, like an archive host"""
+    folder = os.path.abspath(folder)
+    server = ThreadingHTTPServer((host, port), lambda *args: _StandInHandler(*args, directory=folder))
+    print(f"Archive host stand-in serving {folder} on http://{host}:{port}/archive.tar.gz and /archive.zip")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "serve":
+        run_stand_in(sys.argv[2], port=int(sys.argv[3]) if len(sys.argv) > 3 else 8765)
+    else:
+        print("Usage: python archive.py serve <folder> [port]")
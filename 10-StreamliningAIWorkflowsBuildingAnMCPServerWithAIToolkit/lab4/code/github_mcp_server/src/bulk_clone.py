@@ -0,0 +1,87 @@
+"""Concurrent cloning of many repositories
+
+`bulk_clone` runs the clones of a batch at the same time, limited by a global
+cap and by a cap per host so a single git server is not flooded with requests.
+Each clone reports its own progress, and the batch progress is the mean of the
+progress of its repositories.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+from clone_jobs import ReportFn
+from git_ops import normalize_remote
+
+# Clones one repository, reporting progress as (percent, phase, message, bytes received)
+CloneOneFn = Callable[[str, str, ReportFn], Awaitable[dict]]
+
+
+def host_of(repo_url: str) -> str:
+    """Host of a repository URL, "local" for file paths and file:// URLs"""
+    return normalize_remote(repo_url).split("/", 1)[0].split(":", 1)[0] or "local"
+
+
+class HostLimiter:
+    """Global and per host concurrency limits"""
+
+    def __init__(self, max_concurrency: int, max_per_host: int):
+        """
+        Args:
+            max_concurrency: Clones running at the same time across all hosts
+            max_per_host: Clones running at the same time against one host
+        """
+        self.max_per_host = max(1, max_per_host)
+        self._global = asyncio.Semaphore(max(1, max_concurrency))
+        self._hosts: dict[str, asyncio.Semaphore] = {}
+
+    async def run(self, host: str, work: Callable[[], Awaitable[dict]]) -> dict:
+        """Run work once both a host slot and a global slot are free
+
+        The host slot is taken first, so a clone waiting for its host never holds a global slot.
+        """
+        host_slot = self._hosts.setdefault(host, asyncio.Semaphore(self.max_per_host))
+        async with host_slot:
+            async with self._global:
+                return await work()
+
+
+async def bulk_clone(repos: list[tuple[str, str]],
+                     clone_one: CloneOneFn,
+                     max_concurrency: int = 8,
+                     max_per_host: int = 4,
+                     on_progress: Optional[Callable[[float, str], Awaitable[None]]] = None) -> list[dict]:
+    """Clone repositories concurrently and return one summary per repository, in input order
+
+    Args:
+        repos: (repo_url, target_folder) pairs
+        clone_one: Coroutine function cloning one repository and returning its tool result
+        max_concurrency: Clones running at the same time
+        max_per_host: Clones running at the same time against one host
+        on_progress: Awaitable callback receiving the batch progress (0 to 100) and a message
+    """
+    limiter = HostLimiter(max_concurrency, max_per_host)
+    percents = [0.0] * len(repos)
+
+    async def clone_at(index: int, repo_url: str, target_folder: str) -> dict:
+        async def report(percent: float, phase: str, message: str, bytes_received: Optional[int]):
+            percents[index] = percent
+            if on_progress is not None:
+                await on_progress(sum(percents) / len(percents),
+                                  f"[{index + 1}/{len(repos)} {repo_url}] {message}")
+
+        async def work() -> dict:
+            started = time.perf_counter()
+            try:
+                result = await clone_one(repo_url, target_folder, report)
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            percents[index] = 100.0
+            return {
+                "repo_url": repo_url,
+                **result,
+                "seconds": round(time.perf_counter() - started, 2),
+            }
+
+        return await limiter.run(host_of(repo_url), work)
+
+    return await asyncio.gather(*(clone_at(index, url, target) for index, (url, target) in enumerate(repos)))
@@ -0,0 +1,168 @@
+"""Background clone jobs
+
+`git_clone_repo(background=True)` returns a job id right away while a bounded
+pool of workers runs the clones. Job state is readable through the
+`clone_status` tool and the `jobs://{job_id}` resource.
+"""
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+# Job statuses that will not change anymore
+FINISHED = ("succeeded", "failed", "cancelled")
+
+
+class CloneJob:
+    """State of one background clone"""
+
+    def __init__(self, repo_url: str, target_folder: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.repo_url = repo_url
+        self.target_folder = target_folder
+        self.status = "queued"
+        self.phase: Optional[str] = None
+        self.percent = 0.0
+        self.bytes_received: Optional[int] = None
+        self.result: Optional[dict] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def uri(self) -> str:
+        return f"jobs://{self.id}"
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "repo_url": self.repo_url,
+            "target_folder": self.target_folder,
+            "status": self.status,
+            "phase": self.phase,
+            "percent": round(self.percent, 1),
+            "bytes_received": self.bytes_received,
+            "result": self.result,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+# Runs the clone of a job, reporting progress as (percent, phase, message, bytes received)
+ReportFn = Callable[[float, str, str, Optional[int]], Awaitable[None]]
+CloneFn = Callable[[ReportFn], Awaitable[dict]]
+
+
+class CloneJobQueue:
+    """Bounded worker pool for clone jobs"""
+
+    def __init__(self, workers: int = 4, max_finished: int = 100,
+                 on_update: Optional[Callable[[CloneJob], Awaitable[None]]] = None):
+        """
+        Args:
+            workers: Number of clones running at the same time
+            max_finished: Finished jobs kept for status queries, the oldest are forgotten first
+            on_update: Awaitable callback invoked when a job starts, changes phase or finishes
+        """
+        self.workers = workers
+        self.max_finished = max_finished
+        self.on_update = on_update
+        self._jobs: OrderedDict[str, CloneJob] = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+
+    def submit(self, repo_url: str, target_folder: str, run: CloneFn) -> CloneJob:
+        """Queue a clone and return its job
+
+        Args:
+            repo_url: URL of the repository
+            target_folder: Folder the repository is cloned into
+            run: Coroutine function doing the clone, returns the tool result
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        job = CloneJob(repo_url, target_folder)
+        self._jobs[job.id] = job
+        self._queue.put_nowait((job, run))
+        self._forget_finished()
+        return job
+
+    def get(self, job_id: str) -> Optional[CloneJob]:
+        return self._jobs.get(job_id)
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job, returns False if it already finished
+
+        Args:
+            job_id: Id returned by `submit`
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            await self._finish(job, "cancelled", {"success": False, "error": "Clone cancelled"})
+        return True
+
+    async def _work(self):
+        while True:
+            job, run = await self._queue.get()
+            try:
+                if job.finished:
+                    continue
+                job.status = "running"
+                job.started_at = time.time()
+                await self._notify(job)
+                job.task = asyncio.create_task(run(self._reporter(job)))
+                try:
+                    result = await job.task
+                except asyncio.CancelledError:
+                    if not job.task.cancelled():
+                        raise
+                    await self._finish(job, "cancelled", {"success": False, "error": "Clone cancelled"})
+                except Exception as e:
+                    await self._finish(job, "failed", {"success": False, "error": str(e)})
+                else:
+                    await self._finish(job, "succeeded" if result.get("success") else "failed", result)
+            finally:
+                self._queue.task_done()
+
+    def _reporter(self, job: CloneJob) -> ReportFn:
+        async def report(percent: float, phase: str, message: str, bytes_received: Optional[int]):
+            changed = phase != job.phase
+            job.phase = phase
+            job.percent = percent
+            if bytes_received is not None:
+                job.bytes_received = bytes_received
+            if changed:
+                await self._notify(job)
+        return report
+
+    async def _finish(self, job: CloneJob, status: str, result: dict):
+        job.status = status
+        job.result = result
+        job.finished_at = time.time()
+        if status == "succeeded":
+            job.percent = 100.0
+        await self._notify(job)
+
+    async def _notify(self, job: CloneJob):
+        if self.on_update is not None:
+            try:
+                await self.on_update(job)
+            except Exception as e:
+                print(f"Failed to publish update of job {job.id}: {e}")
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
@@ -0,0 +1,324 @@
+"""Asynchronous git helpers
+
+Git runs as an asyncio subprocess so a long clone never blocks the server's
+event loop. Progress lines that git writes to stderr (with `--progress`) are
+parsed and forwarded to a callback, and cancelling the awaiting task stops
+the child process.
+"""
+import asyncio
+import re
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+# Share of the overall progress taken by each phase of a clone
+PHASES = {
+    "Counting objects": (0, 5),
+    "Compressing objects": (5, 10),
+    "Receiving objects": (10, 80),
+    "Unpacking objects": (10, 80),
+    "Resolving deltas": (80, 95),
+    "Updating files": (95, 100),
+}
+
+_PROGRESS_RE = re.compile(r"^(?:remote: )?(?P<phase>[A-Za-z ]+):\s+(?P<percent>\d+)%")
+_SIZE_RE = re.compile(r"(?P<size>\d+(?:\.\d+)?) (?P<unit>bytes|KiB|MiB|GiB)")
+_UNITS = {"bytes": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3}
+
+
+@dataclass
+class GitProgress:
+    """One progress update of a git command"""
+    phase: str
+    percent: int
+    # Overall progress of the command, 0 to 100
+    overall: float
+    # Bytes received so far, only known while receiving objects
+    bytes_received: Optional[int] = None
+    line: str = ""
+
+
+ProgressCallback = Callable[[GitProgress], Awaitable[None]]
+
+
+class GitError(Exception):
+    """A git command failed"""
+
+    def __init__(self, message: str, stderr: str = ""):
+        super().__init__(message)
+        self.stderr = stderr
+
+
+def parse_progress(line: str) -> Optional[GitProgress]:
+    """Parse a git progress line such as "Receiving objects:  45% (450/1000), 1.20 MiB | 1.00 MiB/s"
+
+    Args:
+        line: One line of git stderr
+    """
+    match = _PROGRESS_RE.match(line.strip())
+    if not match:
+        return None
+    phase = match.group("phase").strip()
+    percent = int(match.group("percent"))
+    start, end = PHASES.get(phase, (0, 100))
+    size = _SIZE_RE.search(line)
+    bytes_received = int(float(size.group("size")) * _UNITS[size.group("unit")]) if size else None
+    return GitProgress(phase, percent, start + (end - start) * percent / 100, bytes_received, line.strip())
+
+
+async def _read_stderr(stream: asyncio.StreamReader, on_progress: Optional[ProgressCallback]) -> str:
+    """Read git stderr, forward progress updates and return the other lines"""
+    output = []
+    buffer = ""
+    last = None
+    while True:
+        chunk = await stream.read(4096)
+        if not chunk:
+            break
+        buffer += chunk.decode("utf-8", errors="replace")
+        # git rewrites progress lines in place with carriage returns
+        *lines, buffer = re.split(r"[\r\n]", buffer)
+        for line in lines:
+            progress = parse_progress(line)
+            if progress is None:
+                if line.strip():
+                    output.append(line)
+            elif on_progress is not None:
+                # Only whole steps of the overall progress and the final line of each phase are forwarded
+                key = (progress.phase, int(progress.overall), line.rstrip().endswith("done."))
+                if key != last:
+                    last = key
+                    await on_progress(progress)
+    if buffer.strip():
+        output.append(buffer)
+    return "\n".join(output)
+
+
+async def _stop(process: asyncio.subprocess.Process, timeout: float = 5):
+    """Wait for a terminated child process, killing it if it does not exit in time"""
+    if process.returncode is not None:
+        return
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+async def run_git(*args: str, cwd: Optional[str] = None, on_progress: Optional[ProgressCallback] = None,
+                  git: str = "git") -> str:
+    """Run a git command and return its stdout
+
+    Raises GitError when git exits with an error and FileNotFoundError when git is not installed.
+    If the awaiting task is cancelled, the git process is stopped.
+
+    Args:
+        args: Arguments of the git command
+        cwd: Working directory of the command
+        on_progress: Awaitable callback for progress updates, pass `--progress` to get them
+        git: Git executable
+    """
+    process = await asyncio.create_subprocess_exec(
+        git, *args,
+        cwd=cwd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr, _ = await asyncio.gather(
+            process.stdout.read(),
+            _read_stderr(process.stderr, on_progress),
+            process.wait(),
+        )
+    except BaseException:
+        # Signal git right away, even if the task is cancelled again while waiting for it to exit
+        if process.returncode is None:
+            try:
+                process.terminate()
+            except ProcessLookupError:
+                pass
+        await asyncio.shield(_stop(process))
+        raise
+    if process.returncode != 0:
+        raise GitError(f"git {args[0]} exited with code {process.returncode}", stderr)
+    return stdout.decode("utf-8", errors="replace")
+
+
+# Partial clone modes and the git filter they use
+PARTIAL_FILTERS = {
+    "blobless": "blob:none",
+    "treeless": "tree:0",
+}
+
+
+async def clone(repo_url: str,
+                target: str,
+                depth: Optional[int] = None,
+                partial: Optional[str] = None,
+                branch: Optional[str] = None,
+                single_branch: bool = False,
+                sparse_paths: Optional[list[str]] = None,
+                reference: Optional[str] = None,
+                dissociate: bool = True,
+                on_progress: Optional[ProgressCallback] = None,
+                git: str = "git"):
+    """Clone a repository with optional shallow, partial and sparse settings
+
+    Local paths ignore `depth` and `partial`, use a `file://` URL for them.
+
+    Args:
+        repo_url: URL of the repository
+        target: Folder to clone into
+        depth: Only fetch the last `depth` commits
+        partial: "blobless" or "treeless" partial clone, missing objects are fetched on demand
+        branch: Branch or tag to check out
+        single_branch: Only fetch the history of one branch
+        sparse_paths: Only check out these directories
+        reference: Local repository (e.g. a mirror) to borrow objects from
+        dissociate: Copy the borrowed objects so the clone does not depend on `reference`
+        on_progress: Awaitable callback for progress updates
+        git: Git executable
+    """
+    args = ["clone", "--progress"]
+    if depth:
+        args += ["--depth", str(depth)]
+    if partial:
+        if partial not in PARTIAL_FILTERS:
+            raise ValueError(f"Unknown partial clone mode: {partial}. Use one of {', '.join(PARTIAL_FILTERS)}.")
+        args += ["--filter", PARTIAL_FILTERS[partial]]
+    if branch:
+        args += ["--branch", branch]
+    if single_branch:
+        args.append("--single-branch")
+    if sparse_paths:
+        args.append("--sparse")
+    if reference:
+        args += ["--reference", reference]
+        if dissociate:
+            args.append("--dissociate")
+    args += ["--", repo_url, target]
+    await run_git(*args, on_progress=on_progress, git=git)
+
+    if sparse_paths:
+        await run_git("-C", target, "sparse-checkout", "set", "--", *sparse_paths, git=git)
+
+
+_DEFAULT_PORTS = {"ssh": "22", "git+ssh": "22", "https": "443", "http": "80", "git": "9418"}
+
+
+def normalize_remote(url: str) -> str:
+    """Normalize a remote URL so that equivalent spellings compare equal
+
+    "https://github.com/Org/Repo.git/", "ssh://git@github.com:22/Org/Repo.git" and
+    "git@github.com:Org/Repo.git" all normalize to "github.com/Org/Repo". Only the
+    host is lowercased, paths are case sensitive on most servers. Default ports
+    are dropped, other ports are kept since they may be a different server.
+    """
+    url = url.strip().rstrip("/")
+    url = re.sub(r"\.git$", "", url)
+    match = re.match(r"^([a-z][a-z0-9+.-]*)://([^/]*)(.*)$", url, flags=re.IGNORECASE)
+    if match:
+        scheme, authority, path = match.groups()
+        host = authority.rsplit("@", 1)[-1]
+        host, _, port = host.partition(":")
+        if port and port != _DEFAULT_PORTS.get(scheme.lower()):
+            host = f"{host}:{port}"
+    else:
+        # scp-like syntax "user@host:path", anything else is a local path
+        match = re.match(r"^(?:[^@/]+@)?([^/:]+):(.*)$", url)
+        if not match:
+            return url
+        host, path = match.groups()
+    if not host:
+        return path
+    return f"{host.lower()}/{path.lstrip('/')}"
+
+
+async def remote_url(path: str, remote: str = "origin", git: str = "git") -> Optional[str]:
+    """URL of a remote of a local repository, or None if the folder is not a repository with that remote"""
+    try:
+        return (await run_git("-C", path, "remote", "get-url", remote, git=git)).strip()
+    except GitError:
+        return None
+
+
+async def object_store_bytes(path: str, git: str = "git") -> int:
+    """Size of the object store of a local repository, loose objects and packs"""
+    output = await run_git("-C", path, "count-objects", "-v", git=git)
+    sizes = dict(line.split(": ", 1) for line in output.splitlines() if ": " in line)
+    return (int(sizes.get("size", 0)) + int(sizes.get("size-pack", 0))) * 1024
+
+
+async def _has_ref(path: str, ref: str, git: str = "git") -> bool:
+    try:
+        await run_git("-C", path, "rev-parse", "--verify", "--quiet", ref, git=git)
+        return True
+    except GitError:
+        return False
+
+
+async def _checkout(path: str, branch: str, mode: str, git: str = "git"):
+    """Switch to a branch or tag of origin, local changes are kept unless the mode is reset"""
+    force = ["--force"] if mode == "reset" else []
+    if await _has_ref(path, f"refs/remotes/origin/{branch}", git=git):
+        if mode == "reset":
+            await run_git("-C", path, "checkout", "--quiet", *force, "-B", branch, "--track", f"origin/{branch}",
+                          git=git)
+        else:
+            # Creates a local branch tracking origin/<branch> if there is none yet
+            await run_git("-C", path, "checkout", "--quiet", branch, git=git)
+    elif await _has_ref(path, f"refs/tags/{branch}", git=git):
+        await run_git("-C", path, "checkout", "--quiet", *force, "--detach", f"refs/tags/{branch}", git=git)
+    else:
+        raise GitError(f"git checkout {branch} failed", f"Remote branch or tag not found: {branch}")
+
+
+async def update(path: str, mode: str = "fast-forward", on_progress: Optional[ProgressCallback] = None,
+                 git: str = "git", branch: Optional[str] = None) -> dict:
+    """Fetch a repository incrementally and move the current branch to its upstream
+
+    Returns the old and new HEAD, whether the branch moved and the bytes received by the fetch.
+    Git only prints transfer sizes for fetches that take a while, otherwise the growth of the
+    object store is reported instead.
+
+    Args:
+        path: Folder of the local repository
+        mode: "fast-forward" only moves the branch if it has not diverged, "reset" hard resets to the upstream
+        on_progress: Awaitable callback for progress updates
+        git: Git executable
+        branch: Branch or tag to switch to before updating, the current branch by default
+    """
+    received = 0
+
+    async def track(progress: GitProgress):
+        nonlocal received
+        if progress.bytes_received is not None:
+            received = progress.bytes_received
+        if on_progress is not None:
+            await on_progress(progress)
+
+    old_head = (await run_git("-C", path, "rev-parse", "HEAD", git=git)).strip()
+    size_before = await object_store_bytes(path, git=git)
+    await run_git("-C", path, "fetch", "--prune", "--tags", "--progress", "origin", on_progress=track, git=git)
+    if not received:
+        received = max(0, await object_store_bytes(path, git=git) - size_before)
+    if branch:
+        await _checkout(path, branch, mode, git=git)
+    try:
+        upstream = (await run_git("-C", path, "rev-parse", "--abbrev-ref", "@{upstream}", git=git)).strip()
+    except GitError:
+        upstream = None
+
+    if upstream is not None:
+        if mode == "reset":
+            await run_git("-C", path, "reset", "--hard", "--quiet", upstream, git=git)
+        else:
+            await run_git("-C", path, "merge", "--ff-only", "--quiet", upstream, git=git)
+    new_head = (await run_git("-C", path, "rev-parse", "HEAD", git=git)).strip()
+    return {
+        "old_head": old_head,
+        "new_head": new_head,
+        "upstream": upstream,
+        "updated": old_head != new_head,
+        "bytes_received": received,
+    }
@@ -0,0 +1,71 @@
+"""Local cache of bare repository mirrors
+
+The first clone of a repository also creates a bare mirror in the cache.
+Later clones of the same repository only fetch what changed into the mirror,
+then borrow its objects with `git clone --reference`, so they mostly copy
+local objects instead of downloading the whole history again.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Optional
+
+from git_ops import ProgressCallback, run_git
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "github_mcp_server" / "mirrors"
+
+
+class MirrorCache:
+    """Bare mirrors keyed by repository URL"""
+
+    def __init__(self, root: Optional[Path] = None, git: str = "git"):
+        """
+        Args:
+            root: Folder of the mirrors, defaults to $GITHUB_MCP_CACHE_DIR or ~/.cache/github_mcp_server/mirrors
+            git: Git executable
+        """
+        self.root = Path(root or os.environ.get("GITHUB_MCP_CACHE_DIR") or DEFAULT_CACHE_DIR)
+        self.git = git
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def path_for(self, repo_url: str) -> Path:
+        """Folder of the mirror for a repository URL"""
+        name = re.sub(r"[^A-Za-z0-9._-]+", "_", repo_url.rstrip("/").split("/")[-1])[:60]
+        digest = hashlib.sha256(repo_url.rstrip("/").encode("utf-8")).hexdigest()[:16]
+        return self.root / f"{name}-{digest}.git"
+
+    async def ensure(self, repo_url: str, on_progress: Optional[ProgressCallback] = None,
+                     git: Optional[str] = None) -> tuple[Path, bool]:
+        """Create or update the mirror of a repository
+
+        Returns the mirror folder and whether it already existed.
+
+        Args:
+            repo_url: URL of the repository
+            on_progress: Awaitable callback for progress updates
+            git: Git executable, defaults to the one of the cache
+        """
+        git = git or self.git
+        path = self.path_for(repo_url)
+        lock = self._locks.setdefault(str(path), asyncio.Lock())
+        async with lock:
+            if path.exists():
+                await run_git("--git-dir", str(path), "fetch", "--prune", "--progress", "origin",
+                              on_progress=on_progress, git=git)
+                return path, True
+
+            # Clone next to the final folder and rename, so an interrupted clone never looks like a mirror
+            self.root.mkdir(parents=True, exist_ok=True)
+            partial = path.with_name(path.name + ".partial")
+            shutil.rmtree(partial, ignore_errors=True)
+            try:
+                await run_git("clone", "--mirror", "--progress", "--", repo_url, str(partial),
+                              on_progress=on_progress, git=git)
+            except BaseException:
+                shutil.rmtree(partial, ignore_errors=True)
+                raise
+            partial.rename(path)
+            return path, False
@@ -0,0 +1,317 @@
+"""File index and parallel grep for cloned repositories
+
+`RepoIndex` keeps a manifest (path, size, language, mtime, binary) of the files
+of a repository on disk. Refreshing it only stats the files and reads the head
+of new or changed ones, so repeated refreshes are cheap. Ignored files are left
+out: git repositories list their files with `git ls-files --exclude-standard`,
+other folders skip well known dependency and build folders.
+
+`RepoGrep` searches the indexed text files. Each file is memory mapped and
+scanned with a compiled bytes regex, and large searches are split across a
+process pool so they use every core.
+"""
+import asyncio
+import fnmatch
+import hashlib
+import json
+import mmap
+import os
+import re
+import stat
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from git_ops import GitError, run_git
+
+DEFAULT_INDEX_DIR = Path.home() / ".cache" / "github_mcp_server" / "index"
+
+# Folders skipped when a repository is not a git work tree
+SKIP_DIRS = {".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", ".tox",
+             ".mypy_cache", ".pytest_cache", "dist", "build", "target", ".idea", ".vs"}
+
+LANGUAGES = {
+    ".py": "Python", ".pyi": "Python", ".ipynb": "Jupyter",
+    ".js": "JavaScript", ".mjs": "JavaScript", ".cjs": "JavaScript", ".jsx": "JavaScript",
+    ".ts": "TypeScript", ".tsx": "TypeScript",
+    ".java": "Java", ".kt": "Kotlin", ".scala": "Scala", ".groovy": "Groovy",
+    ".c": "C", ".h": "C", ".cc": "C++", ".cpp": "C++", ".cxx": "C++", ".hpp": "C++",
+    ".cs": "C#", ".fs": "F#", ".vb": "Visual Basic",
+    ".go": "Go", ".rs": "Rust", ".rb": "Ruby", ".php": "PHP", ".swift": "Swift",
+    ".m": "Objective-C", ".r": "R", ".lua": "Lua", ".pl": "Perl", ".dart": "Dart",
+    ".sh": "Shell", ".bash": "Shell", ".zsh": "Shell", ".ps1": "PowerShell",
+    ".sql": "SQL", ".html": "HTML", ".htm": "HTML", ".css": "CSS", ".scss": "SCSS",
+    ".vue": "Vue", ".svelte": "Svelte",
+    ".json": "JSON", ".yaml": "YAML", ".yml": "YAML", ".toml": "TOML", ".xml": "XML",
+    ".ini": "INI", ".cfg": "INI",
+    ".md": "Markdown", ".rst": "reStructuredText", ".txt": "Text",
+    ".bicep": "Bicep", ".tf": "Terraform",
+}
+FILENAME_LANGUAGES = {"Dockerfile": "Dockerfile", "Makefile": "Makefile", "CMakeLists.txt": "CMake"}
+
+# Bytes read to decide whether a file is binary
+BINARY_SNIFF_BYTES = 8000
+# Files larger than this are indexed but not searched
+MAX_GREP_FILE_BYTES = 20 * 1024 * 1024
+# Longest line text returned for a match
+MAX_LINE_CHARS = 300
+
+
+def language_of(path: str) -> Optional[str]:
+    """Language of a file from its name, None if unknown"""
+    name = os.path.basename(path)
+    if name in FILENAME_LANGUAGES:
+        return FILENAME_LANGUAGES[name]
+    return LANGUAGES.get(os.path.splitext(name)[1].lower())
+
+
+def _is_binary(path: str) -> bool:
+    try:
+        with open(path, "rb") as file:
+            return b"\0" in file.read(BINARY_SNIFF_BYTES)
+    except OSError:
+        return True
+
+
+class RepoIndex:
+    """Manifest of the files of one repository, persisted as JSON"""
+
+    def __init__(self, root: Path, index_dir: Optional[Path] = None, git: str = "git"):
+        """
+        Args:
+            root: Folder of the repository
+            index_dir: Folder of the manifests, defaults to $GITHUB_MCP_INDEX_DIR or ~/.cache/github_mcp_server/index
+            git: Git executable
+        """
+        self.root = Path(root).expanduser().absolute()
+        index_dir = Path(index_dir or os.environ.get("GITHUB_MCP_INDEX_DIR") or DEFAULT_INDEX_DIR)
+        digest = hashlib.sha256(str(self.root).encode("utf-8")).hexdigest()[:16]
+        self.path = index_dir / f"{self.root.name}-{digest}.json"
+        self.git = git
+        # Relative path -> [size, mtime_ns, language, binary]
+        self.files: dict[str, list] = {}
+        self.refreshed_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get("root") == str(self.root):
+            self.files = data.get("files", {})
+            self.refreshed_at = data.get("refreshed_at")
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        partial = self.path.with_name(self.path.name + ".partial")
+        with open(partial, "w", encoding="utf-8") as file:
+            json.dump({"root": str(self.root), "refreshed_at": self.refreshed_at, "files": self.files},
+                      file, separators=(",", ":"))
+        os.replace(partial, self.path)
+
+    async def _list_files(self) -> list[str]:
+        """Relative paths of the files that are not ignored"""
+        try:
+            output = await run_git("-C", str(self.root), "ls-files", "-z", "--cached", "--others",
+                                   "--exclude-standard", git=self.git)
+            return [path for path in dict.fromkeys(output.split("\0")) if path]
+        except (GitError, FileNotFoundError):
+            return await asyncio.to_thread(self._walk)
+
+    def _walk(self) -> list[str]:
+        paths = []
+        for folder, dirs, files in os.walk(self.root):
+            dirs[:] = [name for name in dirs if name not in SKIP_DIRS]
+            relative = os.path.relpath(folder, self.root)
+            for name in files:
+                paths.append(name if relative == "." else os.path.join(relative, name).replace(os.sep, "/"))
+        return paths
+
+    async def refresh(self) -> dict:
+        """Bring the manifest up to date, only reading new and changed files
+
+        Returns counts of the files added, changed, removed and unchanged.
+        """
+        async with self._lock:
+            paths = await self._list_files()
+            stats = await asyncio.to_thread(self._refresh, paths)
+            self.refreshed_at = time.time()
+            if stats["added"] or stats["changed"] or stats["removed"] or not self.path.exists():
+                await asyncio.to_thread(self._save)
+            return stats
+
+    def _refresh(self, paths: list[str]) -> dict:
+        files = {}
+        stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+        for path in paths:
+            full_path = os.path.join(self.root, path)
+            try:
+                info = os.lstat(full_path)
+            except OSError:
+                continue
+            if not stat.S_ISREG(info.st_mode):
+                continue
+            old = self.files.get(path)
+            if old is not None and old[0] == info.st_size and old[1] == info.st_mtime_ns:
+                files[path] = old
+                stats["unchanged"] += 1
+                continue
+            stats["added" if old is None else "changed"] += 1
+            files[path] = [info.st_size, info.st_mtime_ns, language_of(path), _is_binary(full_path)]
+        stats["removed"] = len(set(self.files) - set(files))
+        self.files = files
+        return stats
+
+    def select(self, glob: Optional[str] = None, language: Optional[str] = None,
+               include_binary: bool = False) -> list[tuple[str, int]]:
+        """(path, size) of the indexed files matching a glob and a language
+
+        Args:
+            glob: Shell pattern matched against the relative path, e.g. "src/**/*.py" or "*.md"
+            language: Language name as reported by the index, case insensitive
+            include_binary: Whether binary files are included
+        """
+        language = language.lower() if language else None
+        selected = []
+        for path, (size, _, file_language, binary) in self.files.items():
+            if binary and not include_binary:
+                continue
+            if language and (file_language or "").lower() != language:
+                continue
+            if glob and not (fnmatch.fnmatch(path, glob) or fnmatch.fnmatch(os.path.basename(path), glob)):
+                continue
+            selected.append((path, size))
+        return selected
+
+    def summary(self) -> dict:
+        """File count and bytes per language"""
+        languages: dict[str, dict] = {}
+        for size, _, language, binary in self.files.values():
+            entry = languages.setdefault("Binary" if binary else language or "Other", {"files": 0, "bytes": 0})
+            entry["files"] += 1
+            entry["bytes"] += size
+        return dict(sorted(languages.items(), key=lambda item: -item[1]["bytes"]))
+
+    def entries(self, paths: list[str]) -> list[dict]:
+        """Manifest entries of some files"""
+        return [{
+            "path": path,
+            "size": self.files[path][0],
+            "language": self.files[path][2],
+            "mtime": self.files[path][1] / 1e9,
+            "binary": self.files[path][3],
+        } for path in paths]
+
+
+@lru_cache(maxsize=32)
+def _compile(pattern: str, fixed_string: bool, ignore_case: bool) -> re.Pattern:
+    source = re.escape(pattern) if fixed_string else pattern
+    return re.compile(source.encode("utf-8"), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+
+
+def _grep_files(root: str, paths: list[str], pattern: str, fixed_string: bool, ignore_case: bool,
+                max_results: int) -> list[tuple[str, int, int, str]]:
+    """Search memory mapped files, returning (path, line, column, text) of at most max_results lines
+
+    Runs in the worker processes, so it only takes and returns picklable values.
+    """
+    regex = _compile(pattern, fixed_string, ignore_case)
+    matches = []
+    for path in paths:
+        try:
+            with open(os.path.join(root, path), "rb") as file, \
+                    mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                line = 1
+                counted = 0
+                match = regex.search(data)
+                while match is not None:
+                    start = match.start()
+                    line += data[counted:start].count(b"\n")
+                    counted = start
+                    line_start = data.rfind(b"\n", 0, start) + 1
+                    line_end = data.find(b"\n", start)
+                    if line_end < 0:
+                        line_end = len(data)
+                    text = data[line_start:min(line_end, line_start + MAX_LINE_CHARS * 4)]
+                    text = text.decode("utf-8", errors="replace").rstrip("\r")[:MAX_LINE_CHARS]
+                    matches.append((path, line, start - line_start + 1, text))
+                    if len(matches) >= max_results:
+                        return matches
+                    # One result per line: continue after the end of the matched line
+                    match = regex.search(data, line_end + 1) if line_end < len(data) else None
+        except (OSError, ValueError):
+            # Unreadable, vanished or empty files
+            continue
+    return matches
+
+
+class RepoGrep:
+    """Regex search over indexed files, parallel across processes for large searches"""
+
+    def __init__(self, workers: Optional[int] = None, parallel_min_bytes: int = 8 * 1024 * 1024):
+        """
+        Args:
+            workers: Size of the process pool, defaults to the number of CPUs
+            parallel_min_bytes: Searches over fewer bytes run in a thread instead of the process pool
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.parallel_min_bytes = parallel_min_bytes
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _chunks(self, files: list[tuple[str, int]]) -> list[list[str]]:
+        """Split files into chunks of about the same number of bytes, a few per worker"""
+        target = max(1, sum(size for _, size in files) // (self.workers * 4))
+        chunks, chunk, chunk_bytes = [], [], 0
+        for path, size in files:
+            chunk.append(path)
+            chunk_bytes += size
+            if chunk_bytes >= target:
+                chunks.append(chunk)
+                chunk, chunk_bytes = [], 0
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    async def search(self, root: Path, files: list[tuple[str, int]], pattern: str, fixed_string: bool = False,
+                     ignore_case: bool = False, max_results: int = 200) -> tuple[list[dict], bool]:
+        """Search files for a pattern, returns the matches sorted by path and line and whether they were capped
+
+        Raises re.error for an invalid pattern.
+
+        Args:
+            root: Folder the file paths are relative to
+            files: (relative path, size) of the files to search
+            pattern: Python regular expression, or a literal string with fixed_string
+            fixed_string: Search for the pattern literally
+            ignore_case: Case insensitive search
+            max_results: Maximum number of matching lines returned
+        """
+        _compile(pattern, fixed_string, ignore_case)
+        files = sorted((path, size) for path, size in files if 0 < size <= MAX_GREP_FILE_BYTES)
+        args = (str(root), pattern, fixed_string, ignore_case, max_results + 1)
+        if self.workers == 1 or sum(size for _, size in files) < self.parallel_min_bytes:
+            matches = await asyncio.to_thread(_grep_files, args[0], [path for path, _ in files], *args[1:])
+        else:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers)
+            loop = asyncio.get_running_loop()
+            results = await asyncio.gather(*(
+                loop.run_in_executor(self._pool, _grep_files, args[0], chunk, *args[1:])
+                for chunk in self._chunks(files)
+            ))
+            matches = sorted((match for result in results for match in result), key=lambda match: match[:2])
+        truncated = len(matches) > max_results
+        return [
+            {"path": path, "line": line, "column": column, "text": text}
+            for path, line, column, text in matches[:max_results]
+        ], truncated
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
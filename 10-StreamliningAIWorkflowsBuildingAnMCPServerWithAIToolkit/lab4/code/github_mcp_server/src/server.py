@@ -1,14 +1,53 @@
 import json
 import random
 import os
-import platform
+import re
+import shutil
 import subprocess
+import uuid
 from pathlib import Path
-from mcp.server.fastmcp import FastMCP
+from typing import Literal, Optional
+from mcp.server.fastmcp import Context, FastMCP
+from pydantic import BaseModel
+
+from archive import ArchiveDownloader, ArchiveError, archive_url
+from bulk_clone import bulk_clone as run_bulk_clone
+from clone_jobs import CloneJob, CloneJobQueue, ReportFn
+from git_ops import GitError, GitProgress, clone, normalize_remote, remote_url, update as update_repo
+from mirror_cache import MirrorCache
+from repo_search import RepoGrep, RepoIndex
+from toolchain import Toolchain
+from subscriptions import ResourceSubscriptions
 
 # Initialize FastMCP server
 server = FastMCP("github_mcp_server")
 
+# Locations of git and VS Code, resolved once at startup instead of on every call
+toolchain = Toolchain()
+toolchain.discover()
+
+# Bare mirrors shared by clones of the same repository
+mirror_cache = MirrorCache()
+
+# Pooled HTTP client for snapshot downloads
+archive_downloader = ArchiveDownloader()
+
+# Clients can subscribe to jobs://{job_id} to be notified when a background clone changes
+subscriptions = ResourceSubscriptions()
+subscriptions.install(server)
+
+async def _publish_job(job: CloneJob):
+    await subscriptions.notify(job.uri)
+
+clone_jobs = CloneJobQueue(
+    workers=int(os.environ.get("GITHUB_MCP_CLONE_WORKERS", 4)),
+    on_update=_publish_job,
+)
+
+# File manifests of the repositories searched so far, by folder
+repo_indexes: dict[str, RepoIndex] = {}
+repo_searcher = RepoGrep(workers=int(os.environ.get("GITHUB_MCP_GREP_WORKERS", 0)) or None)
+
 @server.tool()
 async def get_weather(location: str) -> str:
     """Get weather for a location.
@@ -30,55 +69,448 @@ async def get_weather(location: str) -> str:
     return json.dumps(weather, ensure_ascii=False)
 
 @server.tool()
-async def git_clone_repo(repo_url: str, target_folder: str) -> str:
+async def git_clone_repo(
+    repo_url: str,
+    target_folder: str,
+    ctx: Context,
+    depth: Optional[int] = None,
+    partial: Optional[Literal["blobless", "treeless"]] = None,
+    branch: Optional[str] = None,
+    single_branch: bool = False,
+    sparse_paths: Optional[list[str]] = None,
+    use_cache: bool = False,
+    update: Optional[Literal["fast-forward", "reset"]] = None,
+    replace: bool = False,
+    background: bool = False,
+    archive: bool = False,
+) -> str:
     """Clone a git repository to a specified folder.
+
+    Clone progress is reported as MCP progress notifications, and cancelling the
+    request stops the clone. With background set, the clone runs as a job and the
+    tool returns its id right away.
     
     Args:
         repo_url: URL of the git repository to clone
         target_folder: Path to the folder where the repository should be cloned
+        depth: Only fetch the last N commits (shallow clone)
+        partial: "blobless" or "treeless" partial clone, file contents or trees are fetched on demand
+        branch: Branch or tag to check out
+        single_branch: Only fetch the history of one branch
+        sparse_paths: Only check out these directories of the repository
+        use_cache: Keep a local mirror of the repository so later clones only fetch what changed, ignored with depth or partial
+        update: If the target folder already exists, update it instead of failing: "fast-forward" or "reset" to the remote branch
+        replace: With update, replace a target folder that is a clone of another repository, deleting its local changes
+        background: Return a job id immediately, follow it with clone_status or the jobs://{job_id} resource
+        archive: Download a snapshot of the branch as an archive instead of cloning, without git history
     """
-    # Check if target folder exists
-    target_path = Path(target_folder).expanduser().absolute()
-    if target_path.exists():
+    options = dict(
+        depth=depth,
+        partial=partial,
+        branch=branch,
+        single_branch=single_branch,
+        sparse_paths=sparse_paths,
+        use_cache=use_cache,
+        update=update,
+        replace=replace,
+        archive=archive,
+    )
+    if background:
+        target_path = Path(target_folder).expanduser().absolute()
+        job = clone_jobs.submit(
+            repo_url,
+            str(target_path),
+            lambda report: _clone_repo(repo_url, target_folder, report, **options),
+        )
         return json.dumps({
-            "success": False,
-            "error": f"Target folder already exists: {str(target_path)}"
+            "success": True,
+            "job_id": job.id,
+            "status": job.status,
+            "status_uri": job.uri
         })
-    
+
+    async def report(percent: float, phase: str, message: str, bytes_received: Optional[int]):
+        await ctx.report_progress(percent, 100, message)
+
+    return json.dumps(await _clone_repo(repo_url, target_folder, report, **options))
+
+async def _clone_repo(
+    repo_url: str,
+    target_folder: str,
+    report: ReportFn,
+    depth: Optional[int] = None,
+    partial: Optional[str] = None,
+    branch: Optional[str] = None,
+    single_branch: bool = False,
+    sparse_paths: Optional[list[str]] = None,
+    use_cache: bool = False,
+    update: Optional[str] = None,
+    replace: bool = False,
+    archive: bool = False,
+) -> dict:
+    """Clone a repository, reporting progress as (percent, phase, message, bytes received)"""
+    if archive:
+        return await _download_archive(repo_url, target_folder, report, branch)
+
     # Check if git is installed
-    try:
-        subprocess.run(["git", "--version"], check=True, capture_output=True, text=True)
-    except FileNotFoundError:
-        return json.dumps({
+    git = toolchain.git()
+    if git is None:
+        return {
             "success": False,
             "error": "Git is not installed. Please install Git first."
-        })
-    except subprocess.CalledProcessError:
-        return json.dumps({
+        }
+    if await toolchain.version("git") is None:
+        return {
             "success": False,
             "error": "Error checking Git installation."
-        })
+        }
+
+    # A mirror holds the whole history, which is what shallow and partial clones avoid downloading
+    cache_skipped = use_cache and (depth is not None or partial is not None)
+    if cache_skipped:
+        use_cache = False
+
+    # Check if target folder exists
+    target_path = Path(target_folder).expanduser().absolute()
+    replace_path = None
+    if target_path.exists():
+        if update is None:
+            return {
+                "success": False,
+                "error": f"Target folder already exists: {str(target_path)}"
+            }
+        if target_path.is_dir() and not any(target_path.iterdir()):
+            target_path.rmdir()
+        else:
+            existing_remote = await remote_url(str(target_path), git=git)
+            if existing_remote is None:
+                return {
+                    "success": False,
+                    "error": f"Target folder exists and is not a git repository: {str(target_path)}"
+                }
+            if normalize_remote(existing_remote) == normalize_remote(repo_url):
+                return await _update_repo(target_path, update, report, git, branch)
+            if not replace:
+                return {
+                    "success": False,
+                    "error": f"Target folder is a clone of another repository ({existing_remote}). "
+                             "Pass replace=True to replace it, its local changes are deleted."
+                }
+            # Another repository: clone next to it and swap the folders once the clone succeeded
+            replace_path = target_path
+            target_path = target_path.with_name(f".{target_path.name}.clone-{uuid.uuid4().hex[:8]}")
     
     # Create parent directory if it doesn't exist
     target_path.parent.mkdir(parents=True, exist_ok=True)
     
+    def report_progress(start: float, end: float, prefix: str = ""):
+        async def on_progress(progress: GitProgress):
+            await report(start + (end - start) * progress.overall / 100, prefix + progress.phase,
+                         prefix + progress.line, progress.bytes_received)
+        return on_progress
+
     # Clone the repository
     try:
-        result = subprocess.run(
-            ["git", "clone", repo_url, str(target_path)],
-            check=True,
-            capture_output=True,
-            text=True
+        reference = None
+        cache_hit = None
+        if use_cache:
+            # Update the mirror first, the clone then only copies local objects
+            reference, cache_hit = await mirror_cache.ensure(repo_url, report_progress(0, 50, "[cache] "), git=git)
+        await clone(
+            repo_url,
+            str(target_path),
+            depth=depth,
+            partial=partial,
+            branch=branch,
+            single_branch=single_branch,
+            sparse_paths=sparse_paths,
+            reference=str(reference) if reference else None,
+            on_progress=report_progress(50 if use_cache else 0, 100),
+            git=git,
         )
-        return json.dumps({
+        if replace_path is not None:
+            target_path = _swap_folders(target_path, replace_path)
+        await report(100, "Done", "Clone complete", None)
+        result = {
             "success": True,
             "target_folder": str(target_path)
+        }
+        if replace_path is not None:
+            result["replaced"] = True
+        if use_cache:
+            result["cache"] = "hit" if cache_hit else "miss"
+        elif cache_skipped:
+            result["cache"] = "skipped"
+        return result
+    except ValueError as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }
+    except GitError as e:
+        return {
+            "success": False,
+            "error": f"Git clone failed: {e.stderr}"
+        }
+    except FileNotFoundError:
+        # git was removed since it was discovered
+        toolchain.invalidate("git")
+        return {
+            "success": False,
+            "error": "Git is not installed. Please install Git first."
+        }
+    finally:
+        if replace_path is not None and target_path.exists() and target_path != replace_path:
+            shutil.rmtree(target_path, ignore_errors=True)
+
+async def _update_repo(target_path: Path, mode: str, report: ReportFn, git: str,
+                       branch: Optional[str] = None) -> dict:
+    """Bring an existing clone of the same remote up to date"""
+    async def on_progress(progress: GitProgress):
+        await report(progress.overall, progress.phase, progress.line, progress.bytes_received)
+
+    try:
+        result = await update_repo(str(target_path), mode, on_progress, git=git, branch=branch)
+    except GitError as e:
+        return {
+            "success": False,
+            "error": f"Git update failed: {e.stderr}"
+        }
+    await report(100, "Done", "Update complete", result["bytes_received"])
+    return {
+        "success": True,
+        "target_folder": str(target_path),
+        "mode": "update",
+        **result
+    }
+
+async def _download_archive(repo_url: str, target_folder: str, report: ReportFn, ref: Optional[str]) -> dict:
+    """Download and extract a snapshot of a repository instead of cloning it"""
+    target_path = Path(target_folder).expanduser().absolute()
+    if target_path.exists():
+        return {
+            "success": False,
+            "error": f"Target folder already exists: {str(target_path)}"
+        }
+    try:
+        url, archive_format = archive_url(repo_url, ref)
+        result = await archive_downloader.download(url, archive_format, target_path, report)
+    except ArchiveError as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }
+    return {
+        "success": True,
+        "target_folder": str(target_path),
+        "mode": "archive",
+        "archive_url": url,
+        **result
+    }
+
+def _swap_folders(new_path: Path, old_path: Path) -> Path:
+    """Move a fresh clone into place of an older folder, then delete the older folder"""
+    trash = old_path.with_name(f".{old_path.name}.old-{uuid.uuid4().hex[:8]}")
+    old_path.rename(trash)
+    new_path.rename(old_path)
+    shutil.rmtree(trash, ignore_errors=True)
+    return old_path
+
+class CloneTarget(BaseModel):
+    """One repository of a bulk clone"""
+    repo_url: str
+    target_folder: str
+    branch: Optional[str] = None
+
+@server.tool()
+async def bulk_clone(
+    repos: list[CloneTarget],
+    ctx: Context,
+    max_concurrency: int = 8,
+    max_per_host: int = 4,
+    depth: Optional[int] = None,
+    partial: Optional[Literal["blobless", "treeless"]] = None,
+    use_cache: bool = True,
+    update: Optional[Literal["fast-forward", "reset"]] = None,
+    replace: bool = False,
+) -> str:
+    """Clone many git repositories concurrently.
+
+    Progress of every repository is reported as MCP progress notifications, and
+    the result summarizes each repository in the order given.
+
+    Args:
+        repos: Repositories to clone, each with repo_url, target_folder and an optional branch
+        max_concurrency: Number of clones running at the same time
+        max_per_host: Number of clones running at the same time against one host
+        depth: Only fetch the last N commits of each repository (shallow clone)
+        partial: "blobless" or "treeless" partial clone, file contents or trees are fetched on demand
+        use_cache: Share local mirrors between clones so repeated repositories are only downloaded once, ignored with depth or partial
+        update: If a target folder already exists, update it instead of failing: "fast-forward" or "reset"
+        replace: With update, replace target folders that are clones of another repository
+    """
+    if not repos:
+        return json.dumps({
+            "success": False,
+            "error": "No repositories to clone."
         })
-    except subprocess.CalledProcessError as e:
+    targets = [str(Path(repo.target_folder).expanduser().absolute()) for repo in repos]
+    duplicates = sorted({target for target in targets if targets.count(target) > 1})
+    if duplicates:
         return json.dumps({
             "success": False,
-            "error": f"Git clone failed: {e.stderr}"
+            "error": f"Target folders used more than once: {', '.join(duplicates)}"
+        })
+
+    branches = {repo.target_folder: repo.branch for repo in repos}
+
+    async def clone_one(repo_url: str, target_folder: str, report: ReportFn) -> dict:
+        return await _clone_repo(repo_url, target_folder, report, depth=depth, partial=partial,
+                                 branch=branches[target_folder], use_cache=use_cache, update=update,
+                                 replace=replace)
+
+    async def on_progress(percent: float, message: str):
+        await ctx.report_progress(percent, 100, message)
+
+    results = await run_bulk_clone(
+        [(repo.repo_url, repo.target_folder) for repo in repos],
+        clone_one,
+        max_concurrency=max_concurrency,
+        max_per_host=max_per_host,
+        on_progress=on_progress,
+    )
+    succeeded = sum(1 for result in results if result.get("success"))
+    return json.dumps({
+        "success": succeeded == len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "repositories": results
+    })
+
+@server.tool()
+async def clone_status(job_id: str) -> str:
+    """Get the status of a background clone job.
+
+    Args:
+        job_id: Job id returned by git_clone_repo with background set
+    """
+    job = clone_jobs.get(job_id)
+    if job is None:
+        return json.dumps({
+            "success": False,
+            "error": f"Unknown clone job: {job_id}"
+        })
+    return json.dumps({"success": True, **job.to_dict()})
+
+@server.tool()
+async def cancel_clone(job_id: str) -> str:
+    """Cancel a queued or running background clone job.
+
+    Args:
+        job_id: Job id returned by git_clone_repo with background set
+    """
+    if not await clone_jobs.cancel(job_id):
+        return json.dumps({
+            "success": False,
+            "error": f"Clone job is unknown or already finished: {job_id}"
+        })
+    return json.dumps({"success": True, "job_id": job_id})
+
+@server.resource("jobs://{job_id}", mime_type="application/json")
+async def clone_job(job_id: str) -> str:
+    """Status of a background clone job: phase, percent, bytes received and result."""
+    job = clone_jobs.get(job_id)
+    if job is None:
+        raise ValueError(f"Unknown clone job: {job_id}")
+    return json.dumps(job.to_dict())
+
+async def _refreshed_index(folder_path: str) -> tuple[Optional[RepoIndex], dict]:
+    """Index of a folder, refreshed, or None and an error result if the folder does not exist"""
+    root = Path(folder_path).expanduser().absolute()
+    if not root.is_dir():
+        return None, {
+            "success": False,
+            "error": f"Folder does not exist: {str(root)}"
+        }
+    index = repo_indexes.get(str(root))
+    if index is None:
+        index = repo_indexes[str(root)] = RepoIndex(root, git=toolchain.git() or "git")
+    return index, await index.refresh()
+
+@server.tool()
+async def repo_index(
+    folder_path: str,
+    glob: Optional[str] = None,
+    language: Optional[str] = None,
+    max_files: int = 200,
+) -> str:
+    """Index the files of a cloned repository and list them.
+
+    The index is kept on disk and refreshed incrementally, only new and changed
+    files are read. Files ignored by git are left out.
+
+    Args:
+        folder_path: Path to the repository folder
+        glob: Only list files whose path matches this pattern, e.g. "src/*.py" or "*.md"
+        language: Only list files of this language, e.g. "Python"
+        max_files: Maximum number of files listed
+    """
+    index, refreshed = await _refreshed_index(folder_path)
+    if index is None:
+        return json.dumps(refreshed)
+    paths = [path for path, _ in index.select(glob, language, include_binary=True)]
+    return json.dumps({
+        "success": True,
+        "folder_path": str(index.root),
+        "total_files": len(index.files),
+        "refresh": refreshed,
+        "languages": index.summary(),
+        "matching_files": len(paths),
+        "files": index.entries(sorted(paths)[:max_files])
+    })
+
+@server.tool()
+async def repo_grep(
+    folder_path: str,
+    pattern: str,
+    fixed_string: bool = False,
+    ignore_case: bool = False,
+    glob: Optional[str] = None,
+    language: Optional[str] = None,
+    max_results: int = 200,
+) -> str:
+    """Search the text files of a cloned repository for a regular expression.
+
+    Binary files and files ignored by git are skipped. Large repositories are
+    searched in parallel.
+
+    Args:
+        folder_path: Path to the repository folder
+        pattern: Python regular expression to search for, or a literal string with fixed_string
+        fixed_string: Search for the pattern literally
+        ignore_case: Case insensitive search
+        glob: Only search files whose path matches this pattern, e.g. "src/*.py" or "*.md"
+        language: Only search files of this language, e.g. "Python"
+        max_results: Maximum number of matching lines returned
+    """
+    index, refreshed = await _refreshed_index(folder_path)
+    if index is None:
+        return json.dumps(refreshed)
+    files = index.select(glob, language)
+    try:
+        matches, truncated = await repo_searcher.search(index.root, files, pattern, fixed_string=fixed_string,
+                                                        ignore_case=ignore_case, max_results=max_results)
+    except re.error as e:
+        return json.dumps({
+            "success": False,
+            "error": f"Invalid pattern: {str(e)}"
         })
+    return json.dumps({
+        "success": True,
+        "files_searched": len(files),
+        "truncated": truncated,
+        "matches": matches
+    }, ensure_ascii=False)
 
 @server.tool()
 async def open_in_vscode(folder_path: str, use_insiders: bool = False) -> str:
@@ -97,58 +529,27 @@ async def open_in_vscode(folder_path: str, use_insiders: bool = False) -> str:
         })
     
     # Determine the command based on OS and whether to use Insiders
-    system = platform.system()
-    
+    if toolchain.system not in ("Darwin", "Windows", "Linux"):
+        return json.dumps({
+            "success": False,
+            "error": f"Unsupported operating system: {toolchain.system}"
+        })
+    commands = toolchain.vscode_commands(use_insiders)
+
     try:
-        if system == "Darwin":  # macOS
-            app_name = "Visual Studio Code - Insiders" if use_insiders else "Visual Studio Code"
-            subprocess.run(["open", "-a", app_name, str(folder_path)], check=True)
-        elif system == "Windows":
-            # On Windows, use the start command to open the application
-            vscode_path = os.path.join(os.environ.get("LOCALAPPDATA", ""), 
-                                      "Programs",
-                                      "Microsoft VS Code Insiders" if use_insiders else "Microsoft VS Code",
-                                      "Code.exe")
-            
-            # Check if VS Code exists at the expected path
-            if not os.path.exists(vscode_path):
-                # Try alternative installation paths
-                program_files = os.environ.get("ProgramFiles", "C:\\Program Files")
-                program_files_x86 = os.environ.get("ProgramFiles(x86)", "C:\\Program Files (x86)")
-                
-                alt_paths = [
-                    os.path.join(program_files, "Microsoft VS Code" + (" Insiders" if use_insiders else ""), "Code.exe"),
-                    os.path.join(program_files_x86, "Microsoft VS Code" + (" Insiders" if use_insiders else ""), "Code.exe")
-                ]
-                
-                for path in alt_paths:
-                    if os.path.exists(path):
-                        vscode_path = path
-                        break
-            
-            if os.path.exists(vscode_path):
-                subprocess.run(["start", "", vscode_path, str(folder_path)], 
-                              check=True, shell=True)
-            else:
-                # Fallback to command line approach
-                cmd = "code-insiders" if use_insiders else "code"
-                subprocess.run([cmd, str(folder_path)], check=True)
-                
-        elif system == "Linux":
-            # On Linux, try to use the desktop application
-            app_name = "code-insiders" if use_insiders else "code"
-            
-            # Try using xdg-open which should use the desktop application
+        if not commands:
+            raise FileNotFoundError()
+        # Fall back to the next command when one fails
+        for command in commands[:-1]:
             try:
-                subprocess.run(["xdg-open", str(folder_path)], check=True)
-            except (FileNotFoundError, subprocess.CalledProcessError):
-                # Fallback to direct command
-                subprocess.run([app_name, str(folder_path)], check=True)
+                subprocess.run([*command, str(folder_path)], check=True)
+                break
+            except FileNotFoundError:
+                toolchain.invalidate()
+            except subprocess.CalledProcessError:
+                pass
         else:
-            return json.dumps({
-                "success": False,
-                "error": f"Unsupported operating system: {system}"
-            })
+            subprocess.run([*commands[-1], str(folder_path)], check=True)
         
         return json.dumps({
             "success": True,
@@ -160,6 +561,8 @@ async def open_in_vscode(folder_path: str, use_insiders: bool = False) -> str:
             "error": f"Failed to open VS Code: {str(e)}"
         })
     except FileNotFoundError:
+        # A discovered program may have been removed, look for it again on the next call
+        toolchain.invalidate()
         return json.dumps({
             "success": False,
             "error": f"{'VS Code Insiders' if use_insiders else 'VS Code'} is not installed or not in PATH"
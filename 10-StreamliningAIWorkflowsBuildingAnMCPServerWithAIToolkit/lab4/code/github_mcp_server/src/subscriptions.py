@@ -0,0 +1,63 @@
+"""Resource subscriptions for FastMCP servers
+
+FastMCP does not track `resources/subscribe` requests, so this module keeps the
+subscribed sessions per URI and sends `notifications/resources/updated` to them.
+"""
+from typing import Any
+
+from mcp.server.fastmcp import FastMCP
+from mcp.server.session import ServerSession
+
+
+class ResourceSubscriptions:
+    """Sessions subscribed to each resource URI"""
+
+    def __init__(self):
+        self._sessions: dict[str, set[ServerSession]] = {}
+
+    def install(self, server: FastMCP):
+        """Handle subscribe/unsubscribe requests and advertise the capability
+
+        Args:
+            server: Server whose resources can be subscribed to
+        """
+        lowlevel = server._mcp_server
+
+        @lowlevel.subscribe_resource()
+        async def subscribe(uri):
+            self._sessions.setdefault(str(uri), set()).add(lowlevel.request_context.session)
+
+        @lowlevel.unsubscribe_resource()
+        async def unsubscribe(uri):
+            sessions = self._sessions.get(str(uri))
+            if sessions is not None:
+                sessions.discard(lowlevel.request_context.session)
+                if not sessions:
+                    del self._sessions[str(uri)]
+
+        get_capabilities = lowlevel.get_capabilities
+
+        def get_capabilities_with_subscribe(*args: Any, **kwargs: Any):
+            capabilities = get_capabilities(*args, **kwargs)
+            if capabilities.resources is not None:
+                capabilities.resources.subscribe = True
+            return capabilities
+
+        lowlevel.get_capabilities = get_capabilities_with_subscribe
+
+    def subscribed(self, uri: str) -> bool:
+        return bool(self._sessions.get(uri))
+
+    async def notify(self, uri: str):
+        """Tell every subscribed session that a resource changed, dropping closed sessions
+
+        Args:
+            uri: URI of the changed resource
+        """
+        for session in list(self._sessions.get(uri, ())):
+            try:
+                await session.send_resource_updated(uri)
+            except Exception:
+                self._sessions[uri].discard(session)
+        if uri in self._sessions and not self._sessions[uri]:
+            del self._sessions[uri]
@@ -0,0 +1,141 @@
+"""Cached discovery of the external programs used by the tools
+
+Git and VS Code are located once, at startup, and their locations and versions
+are remembered, so tool calls neither search PATH nor probe install folders.
+The cache is refreshed lazily: when PATH or one of the variables that locate
+VS Code changes, or when a cached program turns out to be gone (the caller
+reports it with `invalidate`). A version that has to be probed during a tool
+call is probed in a thread, so the event loop is not blocked.
+"""
+import asyncio
+import os
+import platform
+import shutil
+import subprocess
+from typing import Optional
+
+# Environment variables that change where programs are found
+_ENV_KEYS = ("PATH", "PATHEXT", "LOCALAPPDATA", "ProgramFiles", "ProgramFiles(x86)")
+
+
+def _probe_version(path: str) -> Optional[str]:
+    """First line of `<program> --version`, None if the program fails"""
+    try:
+        result = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    lines = result.stdout.strip().splitlines()
+    return lines[0] if result.returncode == 0 and lines else None
+
+
+class Toolchain:
+    """Locations and versions of git and VS Code"""
+
+    def __init__(self):
+        self.system = platform.system()
+        self._env: Optional[tuple] = None
+        self._paths: dict[str, Optional[str]] = {}
+        self._versions: dict[str, Optional[str]] = {}
+
+    def _check_env(self):
+        env = tuple(os.environ.get(key) for key in _ENV_KEYS)
+        if env != self._env:
+            self._env = env
+            self._paths.clear()
+            self._versions.clear()
+
+    def which(self, name: str) -> Optional[str]:
+        """Full path of a program on PATH, None if it is not installed"""
+        self._check_env()
+        if name not in self._paths:
+            self._paths[name] = shutil.which(name)
+        return self._paths[name]
+
+    def invalidate(self, name: Optional[str] = None):
+        """Forget a program, or every program, after it could not be started"""
+        if name is None:
+            self._paths.clear()
+            self._versions.clear()
+        else:
+            self._paths.pop(name, None)
+            self._versions.pop(name, None)
+
+    async def version(self, name: str) -> Optional[str]:
+        """First line of `<program> --version`, None if the program is missing or fails"""
+        path = self.which(name)
+        if path is None:
+            return None
+        if name not in self._versions:
+            self._versions[name] = await asyncio.to_thread(_probe_version, path)
+        return self._versions[name]
+
+    def _version_now(self, name: str) -> Optional[str]:
+        """`version` for startup, before there is an event loop to block"""
+        path = self.which(name)
+        if path is None:
+            return None
+        if name not in self._versions:
+            self._versions[name] = _probe_version(path)
+        return self._versions[name]
+
+    def git(self) -> Optional[str]:
+        """Full path of git, None if it is not installed"""
+        return self.which("git")
+
+    def _code_exe(self, insiders: bool) -> Optional[str]:
+        """Code.exe in the Windows install folders"""
+        folder = "Microsoft VS Code Insiders" if insiders else "Microsoft VS Code"
+        candidates = [
+            os.path.join(os.environ.get("LOCALAPPDATA", ""), "Programs", folder, "Code.exe"),
+            os.path.join(os.environ.get("ProgramFiles", "C:\\Program Files"), folder, "Code.exe"),
+            os.path.join(os.environ.get("ProgramFiles(x86)", "C:\\Program Files (x86)"), folder, "Code.exe"),
+        ]
+        return next((path for path in candidates if os.path.exists(path)), None)
+
+    def vscode_commands(self, insiders: bool = False) -> list[list[str]]:
+        """Commands that open a folder in VS Code, best first; the folder is appended as the last argument
+
+        Empty if VS Code cannot be found or the operating system is not supported.
+
+        Args:
+            insiders: Whether to use VS Code Insiders instead of regular VS Code
+        """
+        self._check_env()
+        key = "vscode-insiders" if insiders else "vscode"
+        if key not in self._paths:
+            # The cached value is the whole list of commands, not a single path
+            self._paths[key] = self._find_vscode(insiders)
+        return self._paths[key]
+
+    def _find_vscode(self, insiders: bool) -> list[list[str]]:
+        cli = self.which("code-insiders" if insiders else "code")
+        commands = []
+        if self.system == "Darwin":
+            opener = self.which("open")
+            if opener:
+                commands.append([opener, "-a", "Visual Studio Code - Insiders" if insiders else "Visual Studio Code"])
+        elif self.system == "Windows":
+            code_exe = self._code_exe(insiders)
+            if code_exe:
+                # Start the application detached from the server, like the "start" shell command does
+                commands.append([os.environ.get("COMSPEC", "cmd.exe"), "/c", "start", "", code_exe])
+            if cli:
+                commands.append([cli])
+        elif self.system == "Linux":
+            # Try the desktop application through xdg-open first, then the command line launcher
+            opener = self.which("xdg-open")
+            if opener:
+                commands.append([opener])
+            if cli:
+                commands.append([cli])
+        return commands
+
+    def discover(self) -> dict:
+        """Resolve every program now and return what was found"""
+        return {
+            "system": self.system,
+            "git": self.git(),
+            "git_version": self._version_now("git"),
+            "vscode": self.vscode_commands(False),
+            "vscode_insiders": self.vscode_commands(True),
+        }
@@ -0,0 +1,169 @@
+"""
+Tests of archive extraction with small tarballs served by a mock HTTP transport.
+
+Run with `python -m pytest tests` from the github_mcp_server folder.
+"""
+import asyncio
+import io
+import os
+import stat
+import sys
+import tarfile
+import zipfile
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from archive import ArchiveDownloader, ArchiveError, ArchiveLimits  # noqa: E402
+
+
+async def no_report(*args):
+    pass
+
+
+def tarball(*members) -> bytes:
+    """A gzipped tarball of (name, type, data or link target) members"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, kind, value in members:
+            info = tarfile.TarInfo(name)
+            info.type = kind
+            if kind == tarfile.REGTYPE:
+                data = value.encode()
+                info.size = len(data)
+                info.mode = 0o755 if name.endswith(".sh") else 0o644
+                archive.addfile(info, io.BytesIO(data))
+            else:
+                info.linkname = value or ""
+                info.mode = 0o755
+                archive.addfile(info)
+    return buffer.getvalue()
+
+
+def zipped(*members) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def download(tmp_path, body: bytes, archive_format: str = "tar", limits: ArchiveLimits = None) -> dict:
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body)))
+        downloader = ArchiveDownloader(limits, client)
+        try:
+            return await downloader.download("https://example.com/archive", archive_format,
+                                             tmp_path / "target" / "repo", no_report)
+        finally:
+            await downloader.close()
+
+    (tmp_path / "target").mkdir(exist_ok=True)
+    return asyncio.run(run())
+
+
+def assert_nothing_written(tmp_path):
+    assert os.listdir(tmp_path / "target") == []
+    assert not (tmp_path / "outside").exists()
+
+
+def test_normal_archive_is_extracted(tmp_path):
+    result = download(tmp_path, tarball(
+        ("repo-main", tarfile.DIRTYPE, None),
+        ("repo-main/README.md", tarfile.REGTYPE, "# Repo"),
+        ("repo-main/src/main.py", tarfile.REGTYPE, "print('hi')"),
+        ("repo-main/run.sh", tarfile.REGTYPE, "#!/bin/sh"),
+        ("repo-main/docs", tarfile.SYMTYPE, "src"),
+    ))
+    repo = tmp_path / "target" / "repo"
+    # The top folder of repository archives is dropped
+    assert (repo / "README.md").read_text() == "# Repo"
+    assert (repo / "src" / "main.py").read_text() == "print('hi')"
+    assert os.stat(repo / "run.sh").st_mode & stat.S_IXUSR
+    assert os.readlink(repo / "docs") == "src"
+    assert result["skipped"] == []
+    assert result["bytes_extracted"] == len("# Repo") + len("print('hi')") + len("#!/bin/sh")
+
+
+def test_parent_path_is_rejected(tmp_path):
+    with pytest.raises(ArchiveError, match="outside of the target"):
+        download(tmp_path, tarball(
+            ("repo-main/README.md", tarfile.REGTYPE, "# Repo"),
+            ("repo-main/../../outside", tarfile.REGTYPE, "escaped"),
+        ))
+    assert_nothing_written(tmp_path)
+
+
+def test_absolute_path_is_rejected(tmp_path):
+    with pytest.raises(ArchiveError, match="absolute path"):
+        download(tmp_path, tarball((str(tmp_path / "outside"), tarfile.REGTYPE, "escaped")))
+    assert_nothing_written(tmp_path)
+
+
+def test_zip_parent_path_is_rejected(tmp_path):
+    with pytest.raises(ArchiveError, match="outside of the target"):
+        download(tmp_path, zipped(("repo-main/a.txt", "a"), ("repo-main/../../outside", "escaped")), "zip")
+    assert_nothing_written(tmp_path)
+
+
+def test_symlinks_out_of_the_target_are_not_created(tmp_path):
+    result = download(tmp_path, tarball(
+        ("repo-main/README.md", tarfile.REGTYPE, "# Repo"),
+        ("repo-main/relative", tarfile.SYMTYPE, "../../../outside"),
+        ("repo-main/absolute", tarfile.SYMTYPE, str(tmp_path / "outside")),
+    ))
+    repo = tmp_path / "target" / "repo"
+    assert sorted(result["skipped"]) == ["absolute", "relative"]
+    assert not os.path.lexists(repo / "relative") and not os.path.lexists(repo / "absolute")
+
+
+def test_files_are_never_written_through_a_symlink(tmp_path):
+    (tmp_path / "outside").mkdir()
+    result = download(tmp_path, tarball(
+        ("repo-main/README.md", tarfile.REGTYPE, "# Repo"),
+        ("repo-main/link", tarfile.SYMTYPE, "../../outside"),
+        ("repo-main/link/escaped.txt", tarfile.REGTYPE, "escaped"),
+    ))
+    repo = tmp_path / "target" / "repo"
+    assert os.listdir(tmp_path / "outside") == []
+    # Links are created last, the file went into a real folder and the link was dropped
+    assert (repo / "link" / "escaped.txt").read_text() == "escaped"
+    assert not os.path.islink(repo / "link")
+    assert result["skipped"] == ["link"]
+
+
+def test_chained_symlinks_out_of_the_target_are_removed(tmp_path):
+    result = download(tmp_path, tarball(
+        ("repo-main/README.md", tarfile.REGTYPE, "# Repo"),
+        ("repo-main/a", tarfile.SYMTYPE, "b/.."),
+        ("repo-main/b", tarfile.SYMTYPE, "c/d"),
+        ("repo-main/c", tarfile.SYMTYPE, ".."),
+    ))
+    repo = tmp_path / "target" / "repo"
+    for name in result["skipped"]:
+        assert not os.path.lexists(repo / name)
+    for name in ("a", "b", "c"):
+        if os.path.lexists(repo / name):
+            assert os.path.realpath(repo / name).startswith(os.path.realpath(repo))
+
+
+def test_hardlinks_are_not_created(tmp_path):
+    (tmp_path / "secret").write_text("secret")
+    result = download(tmp_path, tarball(
+        ("repo-main/README.md", tarfile.REGTYPE, "# Repo"),
+        ("repo-main/hard", tarfile.LNKTYPE, str(tmp_path / "secret")),
+        ("repo-main/relative", tarfile.LNKTYPE, "../../secret"),
+    ))
+    repo = tmp_path / "target" / "repo"
+    assert sorted(result["skipped"]) == ["hard", "relative"]
+    assert not os.path.lexists(repo / "hard") and not os.path.lexists(repo / "relative")
+    assert os.stat(tmp_path / "secret").st_nlink == 1
+
+
+def test_extracted_size_is_limited(tmp_path):
+    with pytest.raises(ArchiveError, match="more than 10 bytes"):
+        download(tmp_path, tarball(("repo-main/big.txt", tarfile.REGTYPE, "x" * 100)),
+                 limits=ArchiveLimits(max_extracted_bytes=10))
+    assert_nothing_written(tmp_path)
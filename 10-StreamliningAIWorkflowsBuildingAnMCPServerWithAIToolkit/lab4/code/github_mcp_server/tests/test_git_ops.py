@@ -0,0 +1,179 @@
+"""
+Tests of the mirror cache, clone updates and folder replacement against local bare repositories.
+
+Run with `python -m pytest tests` from the github_mcp_server folder, git must be installed.
+"""
+import asyncio
+import importlib.util
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC))
+
+from git_ops import clone, normalize_remote  # noqa: E402
+from mirror_cache import MirrorCache  # noqa: E402
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+
+def git(*args: str, cwd=None) -> str:
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+async def no_report(*args):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def git_identity(monkeypatch):
+    for name in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{name}_NAME", "Test")
+        monkeypatch.setenv(f"GIT_{name}_EMAIL", "test@example.com")
+
+
+class Remote:
+    """A bare repository and a working copy that pushes commits to it"""
+
+    def __init__(self, root: Path, name: str):
+        self.bare = root / f"{name}.git"
+        self.work = root / f"{name}-work"
+        git("init", "--quiet", "--bare", "--initial-branch=main", str(self.bare))
+        git("clone", "--quiet", str(self.bare), str(self.work))
+        git("checkout", "--quiet", "-B", "main", cwd=self.work)
+        self.commit("first")
+
+    @property
+    def url(self) -> str:
+        # file:// so git honours depth and filters like for a real remote
+        return self.bare.as_uri()
+
+    def commit(self, message: str, branch: str = "main") -> str:
+        git("checkout", "--quiet", "-B", branch, cwd=self.work)
+        (self.work / f"{message}.txt").write_text(message)
+        git("add", ".", cwd=self.work)
+        git("commit", "--quiet", "-m", message, cwd=self.work)
+        git("push", "--quiet", "origin", branch, cwd=self.work)
+        return git("rev-parse", "HEAD", cwd=self.work)
+
+
+@pytest.fixture
+def remote(tmp_path) -> Remote:
+    return Remote(tmp_path, "repo")
+
+
+@pytest.fixture(scope="module")
+def server_module():
+    # Loaded under its own name, other samples have a server module too
+    spec = importlib.util.spec_from_file_location("github_mcp_server_server", SRC / "server.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def server(server_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(server_module, "mirror_cache", MirrorCache(tmp_path / "cache"))
+    return server_module
+
+
+def test_mirror_is_created_then_updated(tmp_path, remote):
+    cache = MirrorCache(tmp_path / "cache")
+    path, existed = asyncio.run(cache.ensure(remote.url))
+    assert not existed
+    head = remote.commit("second")
+    path_again, existed = asyncio.run(cache.ensure(remote.url))
+    assert existed and path_again == path
+    assert git("--git-dir", str(path), "rev-parse", "main") == head
+
+
+def test_clone_with_reference_is_dissociated(tmp_path, remote):
+    cache = MirrorCache(tmp_path / "cache")
+    mirror, _ = asyncio.run(cache.ensure(remote.url))
+    target = tmp_path / "clone"
+    asyncio.run(clone(remote.url, str(target), reference=str(mirror)))
+    assert git("rev-parse", "HEAD", cwd=target) == git("rev-parse", "HEAD", cwd=remote.work)
+    # --dissociate copies the borrowed objects, the clone works without the mirror
+    assert not (target / ".git" / "objects" / "info" / "alternates").exists()
+    shutil.rmtree(mirror)
+    git("fsck", "--no-progress", cwd=target)
+
+
+def test_clone_repo_reports_cache_miss_then_hit(tmp_path, remote, server):
+    first = asyncio.run(server._clone_repo(remote.url, str(tmp_path / "a"), no_report, use_cache=True))
+    second = asyncio.run(server._clone_repo(remote.url, str(tmp_path / "b"), no_report, use_cache=True))
+    assert first["success"] and first["cache"] == "miss"
+    assert second["success"] and second["cache"] == "hit"
+
+
+def test_shallow_clone_skips_cache(tmp_path, remote, server):
+    result = asyncio.run(server._clone_repo(remote.url, str(tmp_path / "a"), no_report, depth=1, use_cache=True))
+    assert result["success"] and result["cache"] == "skipped"
+    assert not (tmp_path / "cache").exists()
+
+
+def test_update_fast_forwards(tmp_path, remote, server):
+    target = tmp_path / "clone"
+    asyncio.run(server._clone_repo(remote.url, str(target), no_report))
+    head = remote.commit("second")
+    result = asyncio.run(server._clone_repo(remote.url, str(target), no_report, update="fast-forward"))
+    assert result["success"] and result["mode"] == "update" and result["updated"]
+    assert result["new_head"] == head == git("rev-parse", "HEAD", cwd=target)
+
+
+def test_update_checks_out_branch(tmp_path, remote, server):
+    target = tmp_path / "clone"
+    asyncio.run(server._clone_repo(remote.url, str(target), no_report))
+    head = remote.commit("feature", branch="dev")
+    result = asyncio.run(server._clone_repo(remote.url, str(target), no_report, update="fast-forward", branch="dev"))
+    assert result["success"] and result["upstream"] == "origin/dev"
+    assert git("rev-parse", "--abbrev-ref", "HEAD", cwd=target) == "dev"
+    assert git("rev-parse", "HEAD", cwd=target) == head
+
+
+def test_update_unknown_branch_fails(tmp_path, remote, server):
+    target = tmp_path / "clone"
+    asyncio.run(server._clone_repo(remote.url, str(target), no_report))
+    result = asyncio.run(server._clone_repo(remote.url, str(target), no_report, update="reset", branch="nope"))
+    assert not result["success"] and "nope" in result["error"]
+
+
+def test_other_remote_is_not_replaced_without_replace(tmp_path, remote, server):
+    other = Remote(tmp_path, "other")
+    target = tmp_path / "clone"
+    asyncio.run(server._clone_repo(remote.url, str(target), no_report))
+    (target / "work in progress.txt").write_text("not committed")
+
+    refused = asyncio.run(server._clone_repo(other.url, str(target), no_report, update="fast-forward"))
+    assert not refused["success"] and "replace=True" in refused["error"]
+    assert (target / "work in progress.txt").exists()
+
+    replaced = asyncio.run(server._clone_repo(other.url, str(target), no_report, update="fast-forward",
+                                              replace=True))
+    assert replaced["success"] and replaced["replaced"]
+    assert normalize_remote(git("remote", "get-url", "origin", cwd=target)) == normalize_remote(other.url)
+    assert not (target / "work in progress.txt").exists()
+    # Nothing is left next to the target
+    assert sorted(path.name for path in tmp_path.iterdir() if path.name.startswith(".")) == []
+
+
+@pytest.mark.parametrize("url", [
+    "https://github.com/Org/Repo",
+    "https://GitHub.com/Org/Repo.git/",
+    "https://github.com:443/Org/Repo.git",
+    "ssh://git@github.com:22/Org/Repo.git",
+    "ssh://git@github.com/Org/Repo",
+    "git@github.com:Org/Repo.git",
+])
+def test_remote_spellings_are_equal(url):
+    assert normalize_remote(url) == "github.com/Org/Repo"
+
+
+def test_remote_path_case_and_ports_are_kept():
+    assert normalize_remote("git@github.com:org/repo") != normalize_remote("git@github.com:Org/Repo")
+    assert normalize_remote("ssh://git@example.com:2222/a/b") == "example.com:2222/a/b"
+    assert normalize_remote("file:///srv/Repo.git") == "/srv/Repo"